@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized NumPy kernels of the WordVectorSpace stages (contextionaryAnalytics.py).
+
+Each kernel replaces a Python loop over phrases or contexts by array operations on a block of
+a phrase x context matrix. The kernels return the same values as the loops they replace.
+"""
+import numpy as np
+
+
+"""
+Arrays mapped from shared memory by the worker processes, see attach_arrays.
+"""
+_shared = dict()
+
+
+def percentile_indexes(counts, percentile):
+    """
+    Return the indexes of the two sorted values to interpolate and the interpolation weight of the
+    --percentile-- percentile of --counts-- values, as the "linear" method of np.percentile.
+    """
+    virtualIndexes = (counts - 1) * np.true_divide(percentile, 100)
+    previousIndexes = np.floor(virtualIndexes)
+    gamma = virtualIndexes - previousIndexes
+    previousIndexes = np.clip(previousIndexes.astype(np.int64), 0, None)
+    nextIndexes = np.minimum(previousIndexes + 1, np.maximum(counts - 1, 0))
+    return previousIndexes, nextIndexes, gamma
+
+
+def interpolate(previous, following, gamma):
+    """
+    Same interpolation between two sorted values as np.percentile, which starts from the following value
+    when --gamma-- is at least 0.5.
+    """
+    with np.errstate(invalid='ignore'):
+        difference = following - previous
+        result = previous + difference * gamma
+        return np.where(gamma >= 0.5, following - difference * (1 - gamma), result)
+
+
+def masked_column_percentile(values, mask, percentile):
+    """
+    Return, for each column of --values--, the --percentile-- percentile of the values of the column where
+    --mask-- is True, computed as np.percentile (linear interpolation) of these values.
+    The percentile of a column without any value is 0, the percentile of a column with a nan value is nan.
+    """
+    values = np.asarray(values)
+    mask = np.asarray(mask, dtype=bool)
+    columns = np.arange(values.shape[1])
+    if len(values) == 0:
+        return np.zeros(len(columns))
+
+    """
+    The masked cells are replaced by infinity so that, once each column is sorted, the values of
+    the column come first.
+    """
+    sortedValues = np.where(mask, values, np.inf)
+    sortedValues.sort(axis=0)
+    counts = mask.sum(axis=0)
+
+    previousIndexes, nextIndexes, gamma = percentile_indexes(counts, percentile)
+
+    result = interpolate(sortedValues[previousIndexes, columns], sortedValues[nextIndexes, columns], gamma)
+
+    result[counts == 0] = 0
+    result[np.any(np.isnan(values) & mask, axis=0)] = np.nan
+    return result
+
+
+def sparse_row_percentile(matrix, length, percentile):
+    """
+    Return, for each line of the sparse --matrix-- (CSR format) of non-negative values, the --percentile--
+    percentile of the --length-- values of the line, computed as np.percentile (linear interpolation)
+    of these values. The values which are not stored are 0: they come first once the line is sorted, so
+    that only the stored values are sorted. The percentile of a line without any value is 0.
+    """
+    lines = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    sortedValues = matrix.data[np.lexsort((matrix.data, lines))]
+    counts = np.full(matrix.shape[0], length, dtype=np.int64)
+    zeros = counts - np.diff(matrix.indptr)
+
+    previousIndexes, nextIndexes, gamma = percentile_indexes(counts, percentile)
+
+    def value(indexes):
+        stored = indexes >= zeros
+        positions = np.where(stored, matrix.indptr[:-1] + indexes - zeros, 0)
+        return np.where(stored, sortedValues[positions] if len(sortedValues) else 0, 0).astype(np.float64)
+
+    result = interpolate(value(previousIndexes), value(nextIndexes), gamma)
+    result[counts == 0] = 0
+    return result
+
+
+def related_phrases(phraseDocumentMatrix, documentMask, lines, percentile, blockSize):
+    """
+    Return the bonding index boundaries and the related phrases of the lexical set of a context
+    (WordVectorSpace.createPhraseLexicalSet):
+        - phraseDocumentMatrix: phrase document matrix (phrase line, document column), in CSR format
+        - documentMask: boolean array, True for the documents of the context
+        - lines: lines of the n phrases of the lexical set in --phraseDocumentMatrix--
+        - percentile: percentile of the bonding indexes of a phrase giving its boundary
+        - blockSize: number of phrases whose pairs are computed at once
+    The bonding index of two phrases is sharedDocumentCount/(documentCount1+documentCount2-sharedDocumentCount)
+    within the documents of the context. The boundary of a phrase is the percentile of its bonding indexes with
+    the n-1 other phrases, its related phrases the phrases whose bonding index is above the boundary.
+    The method returns the n boundaries and a sparse matrix (phrase, related phrase) of the bonding indexes
+    of the related phrases, both in the order of --lines--.
+    """
+    from scipy import sparse
+
+    n = len(lines)
+
+    """
+    --documents-- is the incidence matrix (phrase line, document column) of the documents of the phrases in the
+    context. For a block of phrases (lines i) and all the phrases (columns j), the product documents[i] x documents[j]
+    gives the sharedDocumentCount of each pair (i,j) with at least one shared document. The bonding index of the
+    pairs without shared document is 0: only the pairs with a shared document are stored, with i different from j,
+    and the denominator of their bonding index is never 0.
+    """
+    documents = phraseDocumentMatrix[lines][:, documentMask].astype(np.int32).tocsr()
+    documentCounts = np.asarray(documents.sum(axis=1)).ravel()
+
+    boundaries = []
+    relatedPhrases = []
+    for start in range(0, n, blockSize):
+        end = min(start + blockSize, n)
+        shared = (documents[start:end] @ documents.T).tocoo()
+        pair = shared.row + start != shared.col
+        phraseLines, relatedPhraseLines = shared.row[pair], shared.col[pair]
+        sharedDocumentCount = shared.data[pair]
+        bondingIndex = sharedDocumentCount / (documentCounts[phraseLines + start] + documentCounts[relatedPhraseLines] - sharedDocumentCount)
+        bondingIndexes = sparse.csr_matrix((bondingIndex, (phraseLines, relatedPhraseLines)), shape=(end - start, n))
+        bondingIndexes.sort_indices()
+
+        blockBoundaries = sparse_row_percentile(bondingIndexes, n - 1, percentile)
+        lineBoundaries = np.repeat(blockBoundaries, np.diff(bondingIndexes.indptr))
+        bondingIndexes.data[bondingIndexes.data <= lineBoundaries] = 0
+        bondingIndexes.eliminate_zeros()
+
+        boundaries.append(blockBoundaries)
+        relatedPhrases.append(bondingIndexes)
+
+    return np.concatenate(boundaries), sparse.vstack(relatedPhrases, format='csr')
+
+
+def share_arrays(arrays):
+    """
+    Copy the arrays of the dictionary --arrays-- {name: array} into shared memory.
+    Return the shared memory blocks, which the caller closes and unlinks once the worker processes are done,
+    and the description of the arrays to pass to attach_arrays.
+    """
+    from multiprocessing import shared_memory
+
+    blocks = []
+    descriptions = dict()
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        descriptions[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, descriptions
+
+
+def attach_arrays(descriptions):
+    """
+    Initializer of the worker processes: map the arrays shared by share_arrays into _shared, without copy.
+    """
+    from multiprocessing import shared_memory
+
+    for name, (blockName, shape, dtype) in descriptions.items():
+        block = shared_memory.SharedMemory(name=blockName)
+        _shared[name] = (block, np.ndarray(shape, dtype=dtype, buffer=block.buf))
+
+
+def shared_related_phrases(task):
+    """
+    related_phrases run by a worker process on the matrices shared by WordVectorSpace.createPhraseLexicalSet:
+    the phrase document matrix (arrays 'data', 'indices' and 'indptr') and the RCIndex of the context of each
+    document ('documentRCIndex').
+    --task-- is (lines, RCIndexes of the context and its descendants, percentile, blockSize).
+    """
+    from scipy import sparse
+
+    lines, subtree, percentile, blockSize = task
+    documentRCIndex = _shared['documentRCIndex'][1]
+    phraseDocumentMatrix = sparse.csr_matrix((_shared['data'][1], _shared['indices'][1], _shared['indptr'][1]),
+                                             shape=(len(_shared['indptr'][1]) - 1, len(documentRCIndex)))
+    return related_phrases(phraseDocumentMatrix, np.isin(documentRCIndex, subtree), lines, percentile, blockSize)
+
+
+def levenshtein_pairs(codes, lengths, first, second, maxDistance=None):
+    """
+    Return the Levenshtein distances of the pairs of strings (first[k], second[k]), the strings being given
+    as the lines of --codes-- (character codes, padded with any value after their --lengths-- characters).
+    The dynamic programming table of all the pairs is filled at once, one line (character of the first string)
+    at a time. Within a line, the insertions are resolved with a cumulative minimum:
+    D[i][j] = min over l <= j of (min(D[i-1][l] + 1, D[i-1][l-1] + cost) + j - l).
+    With --maxDistance--, a pair is dropped as soon as all the values of its line exceed maxDistance, and its
+    distance is returned as maxDistance + 1.
+    The pairs are best grouped by length of their first string, which gives the number of lines.
+    """
+    first = np.asarray(first)
+    second = np.asarray(second)
+    distances = lengths[second].copy()
+    if len(first) == 0:
+        return distances
+    pairs = np.arange(len(first))
+    if maxDistance is not None:
+        distances = np.minimum(distances, maxDistance + 1)
+
+        """
+        An edit changes the character counts of a string by at most 2: the pairs whose character counts differ
+        by more than 2 * maxDistance are above maxDistance.
+        """
+        valid = np.arange(codes.shape[1]) < lengths[:, None]
+        alphabet, characters = np.unique(codes[valid], return_inverse=True)
+        characterCounts = np.zeros((len(codes), len(alphabet)), dtype=np.int32)
+        np.add.at(characterCounts, (np.nonzero(valid)[0], characters), 1)
+        close = np.abs(characterCounts[first] - characterCounts[second]).sum(axis=1) <= 2 * maxDistance
+        distances[~close] = maxDistance + 1
+        pairs = pairs[close]
+        if len(pairs) == 0:
+            return distances
+
+    """
+    --pairs-- are the positions, in --first-- and --second--, of the pairs still being computed.
+    """
+    firstLengths = lengths[first]
+    secondLengths = lengths[second]
+
+    """
+    The distance of a pair whose first string is empty is the length of its second string, already in --distances--:
+    such a pair has no line and never ends.
+    """
+    pairs = pairs[firstLengths[pairs] > 0]
+    if len(pairs) == 0:
+        return distances
+    columnCount = int(secondLengths[pairs].max())
+    columns = np.arange(columnCount + 1)
+    secondCodes = codes[second[pairs], :columnCount]
+
+    previous = np.broadcast_to(columns, (len(pairs), columnCount + 1))
+    for i in range(1, int(firstLengths[pairs].max()) + 1):
+        cost = (codes[first[pairs], i - 1][:, None] != secondCodes).astype(np.int64)
+        current = np.empty_like(previous)
+        current[:, 0] = i
+        current[:, 1:] = np.minimum(previous[:, 1:] + 1, previous[:, :-1] + cost)
+        current = np.minimum.accumulate(current - columns, axis=1) + columns
+
+        ended = firstLengths[pairs] == i
+        distances[pairs[ended]] = current[ended, secondLengths[pairs[ended]]]
+        remaining = ~ended
+        if maxDistance is not None:
+            distances[pairs[ended]] = np.minimum(distances[pairs[ended]], maxDistance + 1)
+            exceeded = remaining & (current.min(axis=1) > maxDistance)
+            distances[pairs[exceeded]] = maxDistance + 1
+            remaining &= ~exceeded
+        if not remaining.all():
+            pairs = pairs[remaining]
+            current = current[remaining]
+            secondCodes = secondCodes[remaining]
+            if len(pairs) == 0:
+                break
+        previous = current
+
+    return distances
@@ -2,7 +2,10 @@ DATABASE = {
     'host': 'localhost',
     'dbname': 'contextionary',
     'user': 'postgres',
-    'password': 'postgres'
+    'password': 'postgres',
+    'minConnections': 1,  # connections kept open by the pool of each process
+    'maxConnections': 20,  # connections a process can check out at the same time
+    'checkoutTimeout': 60  # seconds open_connection waits for a free connection before raising PoolError
 }
 
 PARSE = {
@@ -10,5 +13,24 @@ PARSE = {
     'topcontexts': 5,
     'executionTime': '60 seconds',  # minutes, hours, seconds, days
     'distancePercentile': 10,
-    'bondingIndexPercentile': 90
+    'bondingIndexPercentile': 90,
+    'distanceBlockSize': 4096,  # phrases per block of the distance to context matrix
+    'distanceDtype': 'float64',  # 'float32' halves the memory of the distance to context matrix
+    'distanceCheckRows': 100,  # phrases whose distances are checked against calculateDistancePhraseToContext, 0 = none
+    'outOfCore': False,  # phrase x context matrices of WordVectorSpace in memory-mapped .npy files instead of RAM
+    'matrixFolder': '.',  # folder of the .npy matrix files
+    'memoryBudget': 1024,  # megabytes of matrix blocks held in memory by a WordVectorSpace stage
+    'percentileThreads': 4,  # threads computing the lexical set boundaries, 1 = no thread pool
+    'lexicalSetWorkers': 1,  # processes computing the related phrases of the contexts, 1 = no process pool
+    'stageWorkers': 1,  # WordVectorSpace stages run at the same time when their inputs are ready, see stageRunner.py
+    'refreshDirtyFraction': 0.2,  # largest fraction of changed phrases refreshed incrementally, 0 = always rebuild
+    'bulkIngestion': True,  # stage document phrases with COPY instead of per-phrase statements
+    'parseWorkers': 0,  # tokenizer processes used by execution.py, 0 = one per core
+    'ingestQueueSize': 64,  # bounded queues between the ingestion stages
+    'writerBatchSize': 32,  # documents written per transaction by the ingestion writer
+    'phraseCacheSize': 500000,  # phrases kept in memory by the phrase resolver
+    'manifestPath': 'ingestionManifest.json',  # documents already ingested, see ingestionManifest.py
+    'checkpointPath': 'ingestionCheckpoint.json',  # completed and pending documents of the last run
+    'ngramEngine': 'numpy',  # phrase counting of TextProcessor: 'numpy' (token IDs) or 'python'
+    'tokenizer': 'nltk'  # clause and word tokenizer of TextProcessor: 'nltk' or 'regex' (regexTokenizer.py)
 }
@@ -29,22 +29,21 @@ tables including:
     - "phrase weight by context": list of the relative weights of each phrase in each context
     - 
 """
-from psycopg2 import connect 
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT 
-#from psycopg2.extensions import ISOLATION_LEVEL_DEFAULT
+from collections.abc import Mapping, Sequence
+from databaseTools import checkout, copy_rows, release, update_rows
+import matrixFiles
 import config
 import numpy as np
 
-con = connect(dbname=config.DATABASE['dbname'],
-              user=config.DATABASE['user'],
-              password=config.DATABASE['password'])
-con.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT) 
-#con.set_isolation_level(ISOLATION_LEVEL_DEFAULT) 
+"""
+Each thread running WordVectorSpace stages uses the connection it checked out of the
+shared connection pool (see databaseTools.checkout).
+"""
 
 
 class WordVectorSpace(object):
    
-    def __init__(self, distancePercentile, bondingIndexPercentile):
+    def __init__(self, distancePercentile, bondingIndexPercentile, stages=None):
         
         """
         WordVectoSpace class builds a vector space of phrases. The base of the space is the set of all independent contexts.
@@ -58,7 +57,7 @@ class WordVectorSpace(object):
  
         
         """
-        WordVectorSpace class uses 6 class variables:
+        WordVectorSpace class uses 9 class variables:
             - contexts: dictionary of contexts {contextID:context object} from the contextionary database context table
             - phrases: dictionary of phrases {phraseID:phrase object} from the contextionary database phrase table
             - phraseVectorSpaceMatrix: Array -- phrase row -independent context column -- of the phrase vectors into the
@@ -67,6 +66,18 @@ class WordVectorSpace(object):
             into the word vector space
             - distanceToContextMatrix: Array -- phrase row - regular context column - of the phrase distance to each context
             - dimension: number of independent contexts (any context with 0 child)
+            - phraseCountPerContextMatrix: sparse array -- phrase row - regular context column -- of the phrase counts
+            per context, the count in a context including the counts in its descendants
+            - phraseDocumentMatrix: sparse array -- phrase row - document column -- of the documents of origin of the phrases
+            - documentRCIndex: array of the RCIndex of the context of each document (column of phraseDocumentMatrix)
+            - contextSubtree: sparse array -- regular context row - regular context column -- 1 when the column context is
+            the line context or one of its ancestors, in CSC format. The documents of a context and its descendants are
+            found from documentRCIndex and the column of the context (see subtreeRCIndexes)
+            - phraseCrossPresenceMatrix: sparse array -- phrase row - regular context column -- 1 when the phrase is
+            significantly present in the context (see createPhraseDictionary)
+            - contextAxes: array -- regular context row - independent context column -- of the axis of each context
+        The Phrase and Context objects are views on the lines of these matrices, so the memory of a phrase only grows
+        with the contexts where it exists.
         """
         self.contexts = dict()
         self.phrases = dict()
@@ -74,7 +85,15 @@ class WordVectorSpace(object):
         self.contextAxisMatrix = None
         self.distanceToContextMatrix = None
         self.phraseWeightByContextMatrix = None
-        cur = con.cursor()
+        self.phraseCountPerContextMatrix = None
+        self.phraseDocumentMatrix = None
+        self.phraseCrossPresenceMatrix = None
+        self.contextAxes = None
+        self.contextIDs = None
+        self.documentIDs = None
+        self.documentRCIndex = None
+        self.contextSubtree = None
+        cur = checkout().cursor()
         cur.execute(""" SELECT count(*) FROM context WHERE "context_children_id" = %s; """, (['0']),)                
         self.dimension = cur.fetchone()[0]
         print("dimension")
@@ -104,45 +123,50 @@ class WordVectorSpace(object):
         """
         
         
-        print("create context dictionary....")
-        self.createContextDictionary() 
-        
+        """
+        The tasks are run by a StageRunner (see stageRunner.py), which skips the tasks whose inputs did not
+        change since their last run and runs the independent tasks at the same time. --stages-- restricts the
+        run to some tasks (names of the methods) and the tasks they need. After an ingest, the phrase vector space,
+        the distances and the context lexical sets are only refreshed for the phrases and the contexts that changed
+        (see incrementalRefresh.py).
+        """
+        from stageRunner import StageRunner
+        StageRunner(self).run(stages)
+
+        release()
         
-        print("create phrase dictionary....")
-        self.createPhraseDictionary() 
-        print("create phrase vector space matrix....")
-        self.buildPhraseVectorSpaceMatrix()
-        print("build context axis matrix....")
-        self.buildContextAxisMatrix()
-        print("build distance to context matrix....")
-        self.buildDistanceToContextMatrix()
 
-        print("create context lexical set....")
-        self.createContextLexicalSet()
-        print("create phrase lexical set....")
-        self.createPhraseLexicalSet()
+    """
+    createMatrix returns a new matrix of zeros of shape --shape--.
+    The matrix is not held in memory when it is an artifact read by other programs (--artifact--) or in
+    the out-of-core mode (config.PARSE['outOfCore']): it is then a memory-mapped file (see matrixFiles.py)
+    which the stages write block by block and which saveMatrix publishes as --name--.npy.
+    """
+    def createMatrix(self, name, shape, dtype=np.float64, artifact=False):
 
-        
-        print("build phrase weight by context matrix....")
-        self.buildPhraseWeightByContextMatrix()
+        if artifact or config.PARSE['outOfCore']:
+            return matrixFiles.create_matrix(name, shape, dtype)
+        return np.zeros(shape, dtype=dtype)
 
-        
-        print("update shared word....")
-        self.updateSharedWord()
-        print("update context spelling similarity....")
-        self.updateContextSpellingSimilarity()
-        print("create phrase spelling similarity....")
-        self.updatePhraseSpellingSimilarity()
-        print("update frequency distance table....")
-        self.updateFrequencyDistanceTable()
-        
+    def saveMatrix(self, name, matrix, **header):
+
+        if isinstance(matrix, np.memmap):
+            matrixFiles.publish_matrix(name, matrix, **header)
+
+    """
+    blockRows returns the number of matrix lines a stage processes at once so that its blocks of lines stay within
+    config.PARSE['memoryBudget'] megabytes, --lineBytes-- being the memory used by the temporary arrays of one line.
+    """
+    def blockRows(self, lineBytes):
+
+        return max(1, int(config.PARSE['memoryBudget'] * 1000000 // max(lineBytes, 1)))
 
     """
     createContextDictionary method creates a Python dictionary {key:value} in which each entry will have
     a context ID as a key and a Context object as a value.
     The context ID comes from the contextionary database context table.
     The Context object is created using the Class Context with 8 parameters: contextName, contextID, ancestorsID, independence boolean,
-    ICIndex, RCIndex, dimension, phraseCount
+    ICIndex, RCIndex, contextAxis, phraseCount
     Note that a context immediate parent is the first ancestor of that context. The immediate parent of the
     immediate parent is the second ancestor and so on.
     """
@@ -159,103 +183,76 @@ class WordVectorSpace(object):
         RCIndex = 0
 
         """
-        contextIDList: list of IDs of contexts as recorded in the context table of the --contextionary-- database
+        The context table is read with one query: name, immediate parent and children of each context.
+        The contexts are processed in the order of that query, which sets their ICIndex and RCIndex.
         """
-        
-        cur = con.cursor()
-        cur.execute(""" SELECT "context_id" FROM context """)
-        contextIDList = cur.fetchall()
+        cur = checkout().cursor()
+        cur.execute(""" SELECT "context_id", "context_name", "context_immediate_parent_id", "context_children_id" FROM context """)
+        contextRows = cur.fetchall()
+
+        parentID = dict((contextID, cipID) for contextID, contextName, cipID, contextChildrenID in contextRows)
+
+        """
+        The axis of each context is the line RCIndex of --contextAxes--.
+        """
+        self.contextAxes = np.zeros((len(contextRows), self.dimension), dtype=np.int64)
+
+        """
+        Create the list of ancestors ID of each context called --ancestorsID--, walking up the
+        --parentID-- pointers in memory.
+        In the ancestors list you will have the immediate parent ID, the ID of its immediate
+        parent up to the most remote ancestor of all contexts: "Human activity".
+        The ancestors of a context are its parent followed by the ancestors of its parent, so the
+        list of each context is only built once.
+        """
+        ancestorsByContext = dict()
+        for contextID in parentID.keys():
+            chain = []
+            cipID = contextID
+            while cipID not in ancestorsByContext and cipID != -1:
+                chain.append(cipID)
+                cipID = parentID[cipID]
+            ancestors = [] if cipID == -1 else [cipID] + ancestorsByContext[cipID]
+            for chainID in reversed(chain):
+                ancestorsByContext[chainID] = ancestors
+                ancestors = [chainID] + ancestors
+
+        """
+        Create a phrase count dictionary {key,value} for each context where key is the length of a phrase as
+        per phrase length column in the phrase table and value is the sum of phrase count per context
+        column in phrase meaning table where length of phrase = key.
+        All the sums are computed by one GROUP BY query. A context without phrase of a given length
+        has a count of 0 for that length.
+        """
+        cur.execute(""" SELECT DISTINCT "phrase_length" FROM phrase;""")
+        phraseLengths = list([x[0] for x in cur.fetchall()])
+
+        cur.execute(""" SELECT "phrase_meaning"."context_id", phrase."phrase_length", sum("phrase_meaning"."phrase_count_per_context")
+                        FROM "phrase_meaning" JOIN phrase ON phrase."phrase_id" = "phrase_meaning"."phrase_id"
+                        GROUP BY "phrase_meaning"."context_id", phrase."phrase_length"; """)
+        phraseTotals = dict(((contextID, phraseLength), total) for contextID, phraseLength, total in cur.fetchall())
 
         """
         For each context in the database list of contexts, a context object is created from the class Context
         """
-        for contextID in contextIDList:
+        contextIndexes = []
+        for contextID, contextName, cipID, contextChildrenID in contextRows:
 
-            """
-            contextName is the name of the context as recorded in the context table of the contextionary database
-            """
-            cur = con.cursor()
-            cur.execute(""" SELECT "context_name" FROM context WHERE "context_id" = %s; """, ([contextID]))
-            contextName = cur.fetchall()[0][0]
-            
-            #print(contextName)
-                        
-            """
-            Create the list of ancestors ID of a context called --ancestorsID--.
-            In the ancestors list you will have the immediate parent ID, the ID of its immediate
-            parent up to the most remote ancestor of all contexts: "Human activity".
-            """   
-            ancestorsID = []
-            contextID = contextID[0]
-            cur = con.cursor()
-            cur.execute(""" SELECT "context_immediate_parent_id" FROM context WHERE "context_id" = %s; """, ([contextID]))
-            cipID = cur.fetchall()[0][0]
-            
-            while cipID != -1:
-                ancestorsID.append(cipID)
-                cur = con.cursor()
-                cur.execute(""" SELECT "context_immediate_parent_id" FROM context WHERE "context_id" = %s; """, ([cipID]))
-                cipID = cur.fetchall()[0][0] 
+            ancestorsID = list(ancestorsByContext[contextID])
 
-            """
-            Create a phrase count dictionary {key,value} where key is the length of a phrase as
-            per phrase length column in the phrase table and value is the sum of phrase count per context
-            column in phrase meaning table where length of phrase = key.
-            """
             phraseCount = dict()
-            cur = con.cursor()
-            cur.execute(""" SELECT DISTINCT "context_id" FROM "phrase_meaning";""")
-            phraseMeaningContextID = cur.fetchall()
-            
-            phraseMeaningContextID = list([x[0] for x in phraseMeaningContextID])
-            
-            
-            
-            """
-            For each context having phrases of varying lengths 1, 2, 3, etc.....
-            to total number of phrases per length is updated in the phraseCount dictionary
-            """
-            cur.execute(""" SELECT DISTINCT "phrase_length" FROM phrase;""")
-            phraseLengths = cur.fetchall()
-            phraseLengths = list([x[0] for x in phraseLengths])
-            if contextID in phraseMeaningContextID:
-                #print("list of contexts in phrase meaning table")
-                #print(phraseMeaningContextID)
-                print(contextName)
-                #print("context ID from phrase meaning tabe: %s"%contextID)
-                cur = con.cursor()
-                print("Phrase lengths under review")
-                for phraseLength in phraseLengths:
-                    print(phraseLength)
-                    cur = con.cursor()
-                    cur.execute(""" SELECT "phrase_id" FROM phrase WHERE "phrase_length" = %s; """, ([phraseLength]))
-                    phraseID_phraseLength = cur.fetchall()
-                    phraseID_phraseLength = tuple([x[0] for x in phraseID_phraseLength])
-                    cur = con.cursor()
-                    #print("context_id %s contains the following phrases of length %s phrase_ids :%s"%(contextID,phraseLength,phraseID_phraseLength))
-                    cur.execute(""" SELECT "phrase_count_per_context" FROM "phrase_meaning" WHERE "phrase_id" IN %s AND "context_id" = %s; """, ([phraseID_phraseLength, contextID]))
-                    pcpc = cur.fetchall()
-                    pcpc = [x[0] for x in pcpc]
-                    phraseCount.update({phraseLength:sum(pcpc)})
-            else:
-                for phraseLength in phraseLengths:
-                    phraseCount.update({phraseLength: 0})
-
-            cur = con.cursor()
-            cur.execute(""" SELECT "context_children_id" FROM context WHERE "context_id" = %s; """, ([contextID]))
-            contextChildrenID = cur.fetchall()[0][0]
+            for phraseLength in phraseLengths:
+                phraseCount.update({phraseLength: phraseTotals.get((contextID, phraseLength), 0)})
 
             if contextChildrenID == '0':
                 """
                 If the context is independent (0 child), then an independent context object is created
                 """
-                cur = con.cursor()
-                cur.execute(""" UPDATE context SET icindex= %s WHERE context_id=%s; """, ([ICIndex,contextID]))
-                cur.execute(""" UPDATE context SET rcindex= %s WHERE context_id=%s; """, ([RCIndex,contextID]))
+                contextIndexes.append((contextID, ICIndex, RCIndex))
                 self.contexts.update({contextID: Context(contextName, contextID,
                                                          ancestorsID, True,
                                                          ICIndex, RCIndex,
-                                                         self.dimension,
+                                                         self.contextAxes[RCIndex],
                                                          phraseCount)})
                 ICIndex += 1
 
@@ -263,25 +260,25 @@ class WordVectorSpace(object):
                 """
                 If the context is not independent (has at least 1 child), then a dependent context object is created
                 """
-                cur = con.cursor()
-                cur.execute(""" UPDATE context SET icindex= %s WHERE context_id=%s; """, ([defaultIndex,contextID]))
-                cur.execute(""" UPDATE context SET rcindex= %s WHERE context_id=%s; """, ([RCIndex,contextID]))
+                contextIndexes.append((contextID, defaultIndex, RCIndex))
                 self.contexts.update({contextID: Context(contextName, contextID,
                                                          ancestorsID, False,
                                                          defaultIndex, RCIndex,
-                                                         self.dimension,phraseCount)})
+                                                         self.contextAxes[RCIndex],phraseCount)})
             RCIndex += 1
-        
+
+        """
+        The ICIndex and RCIndex of all the contexts are written into the context table in one batch
+        """
+        update_rows(cur, 'context', 'context_id', ['icindex', 'rcindex'], contextIndexes)
+
         """
         For each independent context, calculate its axis coordinates in the vector space
         """
         for contextID in self.contexts.keys():
-            context=self.contexts[contextID]                     
-            cur = con.cursor()
-            cur.execute(""" SELECT "context_children_id" FROM context WHERE "context_id" = %s; """, ([contextID]))
-            contextChildrenID = cur.fetchall()[0][0]
+            context=self.contexts[contextID]
 
-            if contextChildrenID == '0':
+            if context.isIndependent():
                         
                 ICIndex = context.getICIndex()
                 ancestorsID = context.getAncestorsID()
@@ -299,124 +296,163 @@ class WordVectorSpace(object):
                 UPDATE ANCESTORS PHRASE COUNT
                 """
                 context.updateAncestorPhraseCount(context.getPhraseCount(),ancestors)
-        #print("Context Human activity and its independent descendants")
-        #print(contextID)
-        #print(self.contexts[1].getIndependentDescendantsID())
-        #print("Context Belief and its independent descendants")
-        #print(self.contexts[2].getIndependentDescendantsID())
+
+    """
+    subtreeRCIndexes returns the RCIndexes of the context --RCIndex-- and of its descendants. The documents of these
+    contexts are the columns of the phrase document matrix whose documentRCIndex is one of them.
+    """
+    def subtreeRCIndexes(self, RCIndex):
+
+        return self.contextSubtree.indices[self.contextSubtree.indptr[RCIndex]:self.contextSubtree.indptr[RCIndex+1]]
 
     """
     createPhraseDictionary method creates a Python dictionary {key:value} in which each entry will have
     a phrase ID as a key and a Phrase object as a value.
     The phrase ID comes from the contextionary database phrase table.
-    The Phrase object is created using the Class Phrase with 6 parameters: phraseName, phraseID, 
-    phraseLength,index,phraseCountPerContext,documentPerContext
+    The Phrase object is created using the Class Phrase with 5 parameters: phraseName, phraseID, 
+    phraseLength,index and the WordVectorSpace object whose matrices hold the counts, the documents
+    and the cross presence of the phrase per context
     """
     
     def createPhraseDictionary(self):
+
+        from scipy import sparse
         
         """
         index = This denotes the position of a phrase in the list of all phrases.
         """
 
-        index = 0
-
         """
         phraseIDList: list of IDs of phrases as recorded in the --phrase-- table of the --contextionary-- database
         """
 
-        cur = con.cursor()
+        cur = checkout().cursor()
         cur.execute(""" SELECT DISTINCT "phrase_id" FROM "phrase_meaning" WHERE "phrase_count_per_context">=3;""")
-        phraseIDList = cur.fetchall()
+        phraseIDList = list([x[0] for x in cur.fetchall()])
         
         print("how many phrases should we deal with?")
         print(len(phraseIDList))
-        
-        """
-        For each phrase in the database table of phrases, a phrase object is created from the class Phrase
-        """
-        
-        compteur = 0
-        
-        
-        """
-        FOR-LOOP IS TOO LONG. NEED AN ALTERNATIVE. VECTORIZATION? MULTIPROCESSING?
-        """
-        for phraseID in phraseIDList:
-
-            compteur += 1
-
-            """
-            - phraseName is the name of the phrase as recorded in the phrase table of the contextionary database
-            - phraseLength is the number of words contained by the phrase and is found in the phrase table
-            of the --contextionary-- database
-            - phraseCountPerContext is a list of the frequency of the phrase by context
-            - documentPerContext is the list of documents to which the phrase belong by context
-            """
-            cur = con.cursor()
-            cur.execute(""" UPDATE phrase SET phrase_index= %s WHERE phrase_id=%s; """, ([index,phraseID]))
-            cur = con.cursor()
-            cur.execute(""" SELECT "phrase_text" FROM phrase WHERE "phrase_id" = %s; """, ([phraseID]))
-            phraseText = cur.fetchall()[0][0]
-            cur = con.cursor()
-            cur.execute(""" SELECT "phrase_length" FROM phrase WHERE "phrase_id" = %s; """, ([phraseID]))
-            phraseLength = cur.fetchall()[0][0]   
-
-            phraseCountPerContext = dict()
-            for contextID in self.contexts.keys():
-                
-                phraseCountPerContext.update({contextID: 0})
-                
-            documentPerContext = [[]]*len(self.contexts)
 
-            """
-            For each context:
-                - the count of the phrase is collected and updated in the phraseCountPerContext list.
-                - then the documents of origin of the phrase are also gathered and updated in the documentPerContext list.
-            """
-            for contextID in self.contexts.keys():
-                
-                context = self.contexts[contextID]
-                
-                """
-                Phrase count collection from the --phrase meaning-- database
-                """
-                cur = con.cursor()
-                cur.execute(""" SELECT "phrase_count_per_context" FROM "phrase_meaning" WHERE "phrase_id" = %s AND "context_id" = %s; """, ([phraseID, contextID]))
-                count = cur.fetchall()
-                print("count")
-                print(count)
-                if count:
-                    phraseCountPerContext.update({contextID: count[0][0]})
-                    """
-                    if context is independent, the countpercontext of its ancestors should be
-                    incremented by the count of the independent context
-                    """       
-                    for ancestorID in context.getAncestorsID():
-                        ancestor = self.contexts[ancestorID]
-                        phraseCountPerContext[ancestor.getID()] += phraseCountPerContext[contextID]
-
-                """
-                Document list collection from the --phrase origin-- database
-                """ 
-                cur = con.cursor()
-                cur.execute("""SELECT "phrase_origin"."document_id" FROM "phrase_origin", document WHERE "phrase_id" = %s AND "context_id"=%s  AND "phrase_origin"."document_id"="document"."document_id"; """, ([phraseID, contextID]))
-                selection = cur.fetchall()
-                
-                if selection:
-                    documentPerContext[context.getRCIndex()] = selection
-                    for ancestorID in context.getAncestorsID():
-                            ancestor = self.contexts[ancestorID]
-                            documentPerContext[ancestor.getRCIndex()] = set(documentPerContext[ancestor.getRCIndex()]).union(selection)
+        phraseIndex = dict((phraseID, index) for index, phraseID in enumerate(phraseIDList))
+
+        """
+        The columns of the matrices below are the contexts in RCIndex order.
+        --contextIDs-- gives the context ID of each column.
+        """
+        self.contextIDs = np.zeros(len(self.contexts), dtype=np.int64)
+        for contextID, context in self.contexts.items():
+            self.contextIDs[context.getRCIndex()] = contextID
+
+        """
+        --contextSubtree-- is the context-ancestor incidence matrix: the cell of line i and column j is 1
+        when the context j is the context i or one of its ancestors.
+        """
+        lines = []
+        columns = []
+        for contextID, context in self.contexts.items():
+            for ancestorID in [contextID] + list(context.getAncestorsID()):
+                lines.append(context.getRCIndex())
+                columns.append(self.contexts[ancestorID].getRCIndex())
+        contextSubtree = sparse.csr_matrix((np.ones(len(lines), dtype=np.int64), (lines, columns)),
+                                           shape=(len(self.contexts), len(self.contexts)))
+
+        """
+        - phraseText is the name of the phrase as recorded in the phrase table of the contextionary database
+        - phraseLength is the number of words contained by the phrase and is found in the phrase table
+        of the --contextionary-- database
+        """
+        cur.execute(""" SELECT "phrase_id", "phrase_text", "phrase_length" FROM phrase
+                        WHERE "phrase_id" IN (SELECT "phrase_id" FROM "phrase_meaning" WHERE "phrase_count_per_context">=3); """)
+        phraseAttributes = dict((phraseID, (phraseText, phraseLength)) for phraseID, phraseText, phraseLength in cur.fetchall())
+
+        """
+        The phrase count per context matrix (phrase line, context column) is loaded from the --phrase meaning--
+        table with one query into a sparse matrix. The count of a phrase in a context is then incremented by its
+        count in all the descendants of the context with one sparse product with --contextSubtree--.
+        """
+        cur.execute(""" SELECT "phrase_id", "context_id", "phrase_count_per_context" FROM "phrase_meaning"
+                        WHERE "phrase_id" IN (SELECT "phrase_id" FROM "phrase_meaning" WHERE "phrase_count_per_context">=3); """)
+        counts = [(phraseIndex[phraseID], self.contexts[contextID].getRCIndex(), count)
+                  for phraseID, contextID, count in cur.fetchall() if contextID in self.contexts]
+        lines, columns, values = np.array(counts, dtype=np.int64).reshape(-1, 3).T
+        phraseCount = sparse.csr_matrix((values, (lines, columns)),
+                                        shape=(len(phraseIDList), len(self.contexts)))
+        self.phraseCountPerContextMatrix = (phraseCount @ contextSubtree).tocsr()
+        self.phraseCountPerContextMatrix.sort_indices()
+
+        """
+        The cell of the phrase cross presence matrix (phrase line, context column) is 1 when the phrase is significantly
+        present in the context. A phrase is significantly present in:
+            - an independent context where its count is not 0
+            - a dependent context where its count is not 0 and which has more than --significanceThreshold-- of its
+            independent descendants where the count of the phrase is not 0
+        The independent descendants where the count of each phrase is not 0 are counted with one sparse product with
+        the independent descendant incidence matrix --independentDescendants--. Only the cells where the phrase is
+        significantly present are stored.
+        """
+        significanceThreshold = 0.5
+        lines = []
+        columns = []
+        for contextID, context in self.contexts.items():
+            for descendantID in context.getIndependentDescendantsID():
+                lines.append(self.contexts[descendantID].getRCIndex())
+                columns.append(context.getRCIndex())
+        independentDescendants = sparse.csr_matrix((np.ones(len(lines), dtype=np.int64), (lines, columns)),
+                                                   shape=(len(self.contexts), len(self.contexts)))
+        descendantCount = np.asarray(independentDescendants.sum(axis=0)).ravel()
+        independent = np.zeros(len(self.contexts), dtype=bool)
+        for context in self.contexts.values():
+            independent[context.getRCIndex()] = context.isIndependent()
+
+        presence = (self.phraseCountPerContextMatrix != 0).astype(np.int64)
+        dependentPresence = (presence @ independentDescendants).multiply(presence).tocsr()
+        dependentPresence.data = dependentPresence.data > significanceThreshold * descendantCount[dependentPresence.indices]
+        independentPresence = presence @ sparse.diags(independent.astype(np.int64), dtype=np.int64)
+        self.phraseCrossPresenceMatrix = (independentPresence + dependentPresence).astype(np.int8).tocsr()
+        self.phraseCrossPresenceMatrix.eliminate_zeros()
+        self.phraseCrossPresenceMatrix.sort_indices()
+
+        """
+        The documents of origin of each phrase are loaded from the --phrase origin-- table with one query into
+        a sparse phrase document matrix (phrase line, document column). The documents of a phrase in a context
+        are its documents whose context is the context or one of its descendants.
+        """
+        cur.execute(""" SELECT "phrase_origin"."phrase_id", "phrase_origin"."document_id", document."context_id"
+                        FROM "phrase_origin" JOIN document ON "phrase_origin"."document_id" = document."document_id"
+                        WHERE "phrase_id" IN (SELECT "phrase_id" FROM "phrase_meaning" WHERE "phrase_count_per_context">=3); """)
+        origins = [(phraseID, documentID, contextID) for phraseID, documentID, contextID in cur.fetchall()
+                   if contextID in self.contexts]
+        documentColumn = dict()
+        documentRCIndex = []
+        for phraseID, documentID, contextID in origins:
+            if documentID not in documentColumn:
+                documentColumn[documentID] = len(documentColumn)
+                documentRCIndex.append(self.contexts[contextID].getRCIndex())
+        self.phraseDocumentMatrix = sparse.csr_matrix((np.ones(len(origins), dtype=np.int8),
+                                                       (np.array([phraseIndex[origin[0]] for origin in origins], dtype=np.int64),
+                                                        np.array([documentColumn[origin[1]] for origin in origins], dtype=np.int64))),
+                                                      shape=(len(phraseIDList), len(documentColumn)))
+        self.phraseDocumentMatrix.sort_indices()
+        self.documentIDs = np.array(list(documentColumn.keys()), dtype=np.int64)
+        self.documentRCIndex = np.array(documentRCIndex, dtype=np.int64)
+        self.contextSubtree = contextSubtree.tocsc()
+        self.contextSubtree.sort_indices()
+
+        """
+        For each phrase in the database table of phrases, a phrase object is created from the class Phrase.
+        Its phrase count per context, its documents per context and its cross presence are views on its line of
+        the matrices above.
+        """
+        phraseRows = []
+        for index, phraseID in enumerate(phraseIDList):
+
+            phraseText, phraseLength = phraseAttributes[phraseID]
 
             """
             Creation of the phrase object which is updated in the phrase dictionary
             """
-            self.phrases.update({phraseID[0]: Phrase(phraseText, phraseID[0],
-                                                     phraseLength, index,
-                                                     phraseCountPerContext,
-                                                     documentPerContext, self.contexts)})
-            index += 1
+            self.phrases.update({phraseID: Phrase(phraseText, phraseID,
+                                                  phraseLength, index, self)})
             
             """
             TASK 5:
@@ -427,18 +463,55 @@ class WordVectorSpace(object):
                 Then, update here the "phrase" table of the --contextionary-- database with the phrase redFlag attribute at the
                 phraseID entry.
             """
+            phraseRows.append((phraseID, index, self.phrases[phraseID].getFlag()))
 
-            phrase = self.phrases[phraseID[0]]
-            flag = phrase.getFlag()
-            cur = con.cursor()
-            cur.execute(""" UPDATE "phrase" SET "red_flag" = %s WHERE "phrase_id" = %s; """, ([flag, phraseID[0]]))
-            #########
+        """
+        The index and the red flag of all the phrases are written into the phrase table in one batch
+        """
+        update_rows(cur, 'phrase', 'phrase_id', ['phrase_index', 'red_flag'], phraseRows)
+
+        """
+        The relative frequencies of the phrases (see relativeFrequency) are calculated from:
+            - --totalPhraseCountMatrix--: total phrase count (phrase length line, context column in RCIndex order)
+            - --phraseLengthIndex--: line of --totalPhraseCountMatrix-- of each phrase
+        """
+        phraseLengths = [self.phrases[phraseID].getPhraseLength() for phraseID in phraseIDList]
+        lengths = sorted(set(phraseLengths))
+        self.phraseLengthIndex = np.searchsorted(lengths, phraseLengths)
+        contextsByRCIndex = sorted(self.contexts.values(), key=lambda context: context.getRCIndex())
+        self.totalPhraseCountMatrix = np.array([[context.getPhraseCount()[length] for context in contextsByRCIndex]
+                                                for length in lengths], dtype=np.float64).reshape(len(lengths), len(self.contexts))
+
+    """
+    relativeFrequency returns the relative frequencies of the phrases of index --lines-- (a slice or an array of
+    phrase indexes) in the contexts of RCIndex --RCIndexes-- (columns): the phrase count in the context divided by
+    the total phrase count of the context for the length of the phrase, 0 when that total is 0.
+    """
+    def relativeFrequency(self, lines, RCIndexes):
+
+        counts = self.phraseCountPerContextMatrix[lines][:, RCIndexes].toarray()
+        totals = self.totalPhraseCountMatrix[self.phraseLengthIndex[lines]][:, RCIndexes]
+        frequency = np.zeros(counts.shape)
+        np.divide(counts, totals, out=frequency, where=totals != 0)
+        return frequency
+
+    """
+    lineBlocks returns the blocks of at most --blockSize-- lines of a phrase x context matrix of --p-- lines that a
+    stage computes: slices of all the lines, or arrays of the indexes of the dirty lines in an incremental refresh
+    (--refresh--, see incrementalRefresh.py).
+    """
+    def lineBlocks(self, p, blockSize, refresh=None):
+
+        if refresh is None:
+            return [slice(start, min(start + blockSize, p)) for start in range(0, p, blockSize)]
+        dirtyIndexes = refresh.dirtyIndexes()
+        return [dirtyIndexes[start:start+blockSize] for start in range(0, len(dirtyIndexes), blockSize)]
 
     """
     buildPhraseVectorSpaceMatrix method creates an array containing each phrase vector with coordinates
     on each independent context axis.
     """ 
-    def buildPhraseVectorSpaceMatrix(self):    
+    def buildPhraseVectorSpaceMatrix(self, refresh=None):    
    
         import numpy as np 
 
@@ -452,13 +525,7 @@ class WordVectorSpace(object):
         phrase i getCountPerContext[j] / context j getPhraseCount[phrase i.getPhraseLength]
         """
 
-        p = 0
-        c = 0
-        
-        cur = con.cursor()
-        cur.execute("""DELETE FROM "phrase_vector_space";""")
-        
-        cur = con.cursor()
+        cur = checkout().cursor()
         cur.execute(""" SELECT "context_id" FROM "context" WHERE "context_children_id" = %s; """, (['0']))
         independentContextID = cur.fetchall()
         independentContextID = list([x[0] for x in independentContextID])
@@ -466,36 +533,41 @@ class WordVectorSpace(object):
         p = len(self.phrases) #i
         c = len(independentContextID) #j
         
-        self.phraseVectorSpaceMatrix = np.zeros((p,c))
-        
-        for phraseID in self.phrases.keys():
-            phrase = self.phrases[phraseID]
-            i = phrase.getIndex()
-            for ICID in independentContextID:
-                context = self.contexts[ICID]
-                j = context.getICIndex()
-                #k=context.getRCIndex()
-                #self.phraseVectorSpaceMatrix[(i,j)]= phrase.getPhraseCountPerContext()[k]/(context.getPhraseCount()[phrase.getPhraseLength()])
-                if context.getPhraseCount()[phrase.getPhraseLength()] == 0:
-                    self.phraseVectorSpaceMatrix[(i, j)] = 0
-                else:
-                    self.phraseVectorSpaceMatrix[(i, j)] = phrase.getPhraseCountPerContext()[ICID]/(context.getPhraseCount()[phrase.getPhraseLength()])
-
-        """
-        Delete all existing entries of table "phrase vector space".
-        Add entries phrase i, independent context j, phrase relative frequency ij
-        """
-        cur = con.cursor()
-        cur.execute("""DELETE FROM "phrase_vector_space";""")
-        
-        for phraseID in self.phrases.keys():
-            phrase = self.phrases[phraseID]
-            i = phrase.getIndex()
-            for ICID in independentContextID:
-                context = self.contexts[ICID]
-                j = context.getICIndex()
-                cur.execute("""INSERT INTO "phrase_vector_space" ("phrase_id", "context_id", "phrase_relative_frequency")
-                                VALUES (%s,%s,%s)""", ([phraseID, ICID, self.phraseVectorSpaceMatrix[(i,j)]]))
+        self.phraseVectorSpaceMatrix = self.createMatrix('phraseVectorSpaceMatrix', (p,c))
+
+        """
+        The matrix is computed by blocks of lines with relativeFrequency.
+        --independentRCIndex-- and --independentIDs-- give the RCIndex and the ID of the context of each column j.
+        """
+        independentContexts = sorted((self.contexts[ICID] for ICID in independentContextID), key=lambda context: context.getICIndex())
+        independentRCIndex = np.array([context.getRCIndex() for context in independentContexts], dtype=np.int64)
+        independentIDs = [context.getID() for context in independentContexts]
+
+        phraseIDs = [None]*p
+        for phraseID, phrase in self.phrases.items():
+            phraseIDs[phrase.getIndex()] = phraseID
+
+        """
+        Delete all existing entries of table "phrase vector space". In an incremental refresh (--refresh--), only
+        the entries of the dirty phrases are deleted and the other lines are copied from the previous matrix.
+        Add entries phrase i, independent context j, phrase relative frequency ij, one block of lines at a time
+        """
+        cur = checkout().cursor()
+        blockSize = self.blockRows(3 * 8 * c)
+        if refresh is None:
+            cur.execute("""DELETE FROM "phrase_vector_space";""")
+        else:
+            cur.execute("""DELETE FROM "phrase_vector_space" WHERE "phrase_id" = ANY(%s);""", (refresh.dirtyIDs(),))
+            refresh.copyPreviousLines('phraseVectorSpaceMatrix', self.phraseVectorSpaceMatrix, blockSize)
+
+        for lines in self.lineBlocks(p, blockSize, refresh):
+            block = self.relativeFrequency(lines, independentRCIndex)
+            self.phraseVectorSpaceMatrix[lines] = block
+
+            copy_rows(cur, '"phrase_vector_space"', ["phrase_id", "context_id", "phrase_relative_frequency"],
+                      ((phraseIDs[index], independentIDs[j], value)
+                       for index, line in zip(np.arange(p)[lines].tolist(), block.tolist()) for j, value in enumerate(line)))
+        self.saveMatrix('phraseVectorSpaceMatrix', self.phraseVectorSpaceMatrix, lines='phrase_index', columns='icindex')
 
         print("Phrase vector space matrix")
         print (self.phraseVectorSpaceMatrix)
@@ -528,11 +600,11 @@ class WordVectorSpace(object):
         Delete all existing entries of table "context axis".
         Insert entries context i, independent context j, context i coordinate on independent context j
         """
-        #cur = con.cursor()
+        #cur = checkout().cursor()
         #cur.execute("""DELETE FROM "context_axis";""")
         
         #print("Start inserting context axis coordinates into database")
-        #cur = con.cursor()
+        #cur = checkout().cursor()
         #cur.execute(""" SELECT "context_id" FROM "context" WHERE "context_children_id" = %s; """, (['0']))
         #independentContextID = cur.fetchall()
         #independentContextID = list([x[0] for x in independentContextID])
@@ -540,7 +612,7 @@ class WordVectorSpace(object):
         #   i = self.contexts[contextID].getRCIndex()
         #   for ICID in independentContextID:
         #       j = self.contexts[ICID].getICIndex()
-        #       cur = con.cursor()
+        #       cur = checkout().cursor()
         #       cur.execute("""INSERT INTO "context_axis" ("context_id", "independent_context_id", "axis_coordinate")
         #       VALUES (%s,%s,%s)""", ([contextID, ICID, int(self.contextAxisMatrix[i][j])]))
         #print("Finish inserting context axis coordinates into database")
@@ -556,35 +628,60 @@ class WordVectorSpace(object):
     on the --contextionary-- database.
     Finally, the method calculates and assigns the lexical set boundary for each context. 
     """
-    def buildDistanceToContextMatrix(self):  
+    def buildDistanceToContextMatrix(self, refresh=None):  
 
         """
-        Delete all existing entries of table "phrase_distance_to_context".
+        Delete all existing entries of table "phrase_distance_to_context", or the entries of the dirty phrases
+        in an incremental refresh (--refresh--).
         """
-        cur = con.cursor()
-        cur.execute("""DELETE FROM "phrase_distance_to_context";""")
+        cur = checkout().cursor()
+        if refresh is None:
+            cur.execute("""DELETE FROM "phrase_distance_to_context";""")
+        else:
+            cur.execute("""DELETE FROM "phrase_distance_to_context" WHERE "phrase_id" = ANY(%s);""", (refresh.dirtyIDs(),))
 
         """
-        The matrix is updated with the distance between each phrase and each context
+        The matrix is updated with the distance between each phrase and each context.
+        The distance between a phrase vector v and a context axis a is the norm of the difference between v
+        and its orthogonal projection on a, so its square is ||v||² - (a.v)²/||a||².
+        The distances of a block of phrases are computed with one matrix product of the block by the context
+        axis matrix and the norms of the phrase vectors. The blocks of at most config.PARSE['distanceBlockSize'] phrases
+        keep the temporary arrays within config.PARSE['memoryBudget']. The distances are computed in float32 instead
+        of float64 when config.PARSE['distanceDtype'] is 'float32'. In an incremental refresh, only the lines of the
+        dirty phrases are computed, the other lines are copied from the previous matrix.
         """
         import numpy as np
         import time
         
-        #p = len(self.phrases)
-        #c = len(self.contexts)
         distancematricestarttime=time.time()
-        
-        #self.distanceToContextMatrix = np.zeros((p, c))
-
 
-        normContextAxisMatrix = self.contextAxisMatrix / np.linalg.norm(self.contextAxisMatrix, axis=1).reshape(-1,1) ** 2
-        self.distanceToContextMatrix=np.concatenate(np.apply_along_axis(self.calculateDistancePhraseToContext, 1, self.phraseVectorSpaceMatrix, self.contextAxisMatrix, normContextAxisMatrix), 0)
-            
-      
+        dtype = np.dtype(config.PARSE['distanceDtype'])
+        contextAxisMatrix = np.asarray(self.contextAxisMatrix, dtype=dtype).reshape(-1, self.dimension)
+        squaredNormContextAxis = (contextAxisMatrix * contextAxisMatrix).sum(axis=1)
+
+        p = len(self.phraseVectorSpaceMatrix)
+        c = len(contextAxisMatrix)
+        self.distanceToContextMatrix = self.createMatrix('distanceToContextMatrix', (p, c), dtype)
+
+        blockSize = min(config.PARSE['distanceBlockSize'], self.blockRows(dtype.itemsize * (self.dimension + 3 * c)))
+        if refresh is not None:
+            refresh.copyPreviousLines('distanceToContextMatrix', self.distanceToContextMatrix, blockSize)
+
+        for lines in self.lineBlocks(p, blockSize, refresh):
+            phraseVectors = np.asarray(self.phraseVectorSpaceMatrix[lines], dtype=dtype)
+            squaredNormPhrase = (phraseVectors * phraseVectors).sum(axis=1)
+            products = phraseVectors.dot(contextAxisMatrix.T)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                squaredDistance = squaredNormPhrase.reshape(-1, 1) - products * products / squaredNormContextAxis
+            self.distanceToContextMatrix[lines] = np.sqrt(np.maximum(squaredDistance, 0))
+        self.saveMatrix('distanceToContextMatrix', self.distanceToContextMatrix, lines='phrase_index', columns='rcindex')
             
         distancematriceendtime=time.time()
         
         print("Time to build distanceToContextMatrix: %s" %(distancematriceendtime-distancematricestarttime))
+
+        if config.PARSE['distanceCheckRows'] > 0:
+            self.checkDistanceToContextMatrix(config.PARSE['distanceCheckRows'])
         
         
         """
@@ -606,28 +703,61 @@ class WordVectorSpace(object):
         be as high as 20%.
         The distance above which any phrase is not part of the lexical set is called
         the lexical set boundary and is calculate as the context phrases 10% distance percentile.
+        The boundaries of all the contexts are calculated by updateLexicalSetBoundaries. In an incremental refresh,
+        the boundaries of the previous run are kept for the contexts where no dirty or removed phrase exists.
         """
-        for contextID in self.contexts.keys():
-                
-            context = self.contexts[contextID]
-            j = context.getRCIndex()
-            
-            distance = []
-            for phraseID in self.phrases.keys():
-                phrase = self.phrases[phraseID]
-                i = phrase.getIndex()
-      
-                """
-                if the phrase exists in the context
-                """
-                if phrase.getPhraseCountPerContext()[contextID]>0:
-                    distance.append(self.distanceToContextMatrix[i,j])
-            
-            if not distance:
-                context.setLexicalSetBoundary(0)
+        if refresh is None:
+            self.updateLexicalSetBoundaries()
+        else:
+            for context in self.contexts.values():
+                context.setLexicalSetBoundary(refresh.previousBoundaries[context.getRCIndex()])
+            self.updateLexicalSetBoundaries(refresh.affectedRCIndexes)
+            boundaries = np.zeros(len(self.contexts))
+            for context in self.contexts.values():
+                boundaries[context.getRCIndex()] = context.getLexicalSetBoundary()
+            refresh.updateChangedBoundaries(boundaries)
+
+    """
+    updateLexicalSetBoundaries calculates the lexical set boundary of each context: the distancePercentile percentile
+    of the distances to the context of the phrases that exist in the context (phrase count in the context > 0),
+    0 when no phrase exists in the context.
+    The boundaries are calculated by blocks of columns (contexts) of the distance to context matrix with a masked
+    column percentile (analyticsKernels.masked_column_percentile), the mask being the presence of the phrases
+    in the contexts. The blocks fit into config.PARSE['memoryBudget'] and are processed by
+    config.PARSE['percentileThreads'] threads. Only the contexts of RCIndex --RCIndexes-- are calculated when it is given.
+    """
+    def updateLexicalSetBoundaries(self, RCIndexes=None):
+
+        from analyticsKernels import masked_column_percentile
+        from concurrent.futures import ThreadPoolExecutor
+
+        p, c = self.distanceToContextMatrix.shape
+        blockSize = self.blockRows(p * (3 * self.distanceToContextMatrix.itemsize + 8 + 1))
+
+        def boundaries(start):
+            if RCIndexes is None:
+                columns = slice(start, start + blockSize)
             else:
-                boundary = np.percentile(distance, self.distancePercentile)
-                context.setLexicalSetBoundary(boundary)
+                columns = RCIndexes[start:start+blockSize]
+            distances = np.asarray(self.distanceToContextMatrix[:, columns])
+            presence = self.phraseCountPerContextMatrix[:, columns].toarray() > 0
+            return masked_column_percentile(distances, presence, self.distancePercentile)
+
+        if RCIndexes is None:
+            RCIndexes = np.arange(c)
+            starts = range(0, c, blockSize)
+        else:
+            starts = range(0, len(RCIndexes), blockSize)
+        if config.PARSE['percentileThreads'] > 1:
+            with ThreadPoolExecutor(config.PARSE['percentileThreads']) as executor:
+                blocks = list(executor.map(boundaries, starts))
+        else:
+            blocks = [boundaries(start) for start in starts]
+        lexicalSetBoundaries = np.concatenate(blocks) if blocks else np.zeros(0)
+
+        contextsByRCIndex = dict((context.getRCIndex(), context) for context in self.contexts.values())
+        for RCIndex, boundary in zip(RCIndexes, lexicalSetBoundaries):
+            contextsByRCIndex[RCIndex].setLexicalSetBoundary(boundary)
 
     """
     The distance between a vector and an axis is simply the norm of the difference
@@ -644,6 +774,33 @@ class WordVectorSpace(object):
         return normVector
 
     
+
+    """
+    checkDistanceToContextMatrix compares --rowCount-- lines of the distance to context matrix, evenly spread
+    over the phrases, with the distances calculated by calculateDistancePhraseToContext.
+    It returns the largest difference found.
+    """
+    def checkDistanceToContextMatrix(self, rowCount):
+
+        contextAxisMatrix = np.asarray(self.contextAxisMatrix, dtype=np.float64).reshape(-1, self.dimension)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            normContextAxisMatrix = contextAxisMatrix / np.linalg.norm(contextAxisMatrix, axis=1).reshape(-1,1) ** 2
+
+        maxDifference = 0
+        for i in np.unique(np.linspace(0, len(self.phraseVectorSpaceMatrix) - 1, rowCount).astype(int)):
+            with np.errstate(invalid='ignore'):
+                expected = self.calculateDistancePhraseToContext(np.asarray(self.phraseVectorSpaceMatrix[i], dtype=np.float64),
+                                                                 contextAxisMatrix, normContextAxisMatrix)[0]
+            found = np.asarray(self.distanceToContextMatrix[i], dtype=np.float64)
+            """
+            A context axis of norm 0 gives a nan distance in both calculations
+            """
+            difference = np.abs(np.nan_to_num(expected, nan=-1) - np.nan_to_num(found, nan=-1))
+            maxDifference = max(maxDifference, np.max(difference, initial=0))
+
+        print("Largest difference with calculateDistancePhraseToContext: %s" % maxDifference)
+        return maxDifference
+
     def buildHMatrix(self,row):
         
         R = np.array(row)
@@ -671,46 +828,48 @@ class WordVectorSpace(object):
         """
         Delete all existing entries of table "phrase distance to context".
         """
-        cur = con.cursor()
+        cur = checkout().cursor()
         cur.execute("""DELETE FROM "phrase_weight_by_context";""")
         
         import numpy as np
-        #maxDistance=np.amax(self.distanceToContextMatrix)
         
         p = len(self.phrases)
         c = len(self.contexts)
         
-        self.phraseWeightByContextMatrix = np.zeros((p, c))
+        """
+        The matrix is the artifact phraseWeightByContextMatrix.npy read by TextComprehension.findContext
+        (see matrixFiles.py): phrase line in phrase_index order, context column in rcindex order.
+        """
+        self.phraseWeightByContextMatrix = self.createMatrix('phraseWeightByContextMatrix', (p, c), artifact=True)
         
-        #maxDistance=np.amax(self.distanceToContextMatrix)
         maxFrequency = np.amax(self.phraseVectorSpaceMatrix)
-      
-        
+
         """
-        FOR-LOOP IS TOO LONG. NEED AN ALTERNATIVE. VECTORIZATION? MULTIPROCESSING?
-        I BELIEVE VECTORIZATION IS MORE APPROPRIATE AND ELEGANT
+        The weight of a phrase in a context is 1 when the phrase belongs to the lexical set of the context,
+        its relative frequency in the context divided by --maxFrequency-- otherwise.
+        The matrix is computed by blocks of lines: the relative frequencies of the block are divided by --maxFrequency--
+        then the cells of the lexical sets are set to 1, --lexicalSetLines-- and --lexicalSetColumns-- giving the line
+        and the column of each phrase of each lexical set.
         """
+        lexicalSetLines = []
+        lexicalSetColumns = []
         for contextID in self.contexts.keys():
             context = self.contexts[contextID]
-            j = context.getRCIndex()
-             
-            #print("the context --%s-- has the following lexical set --%s--" %(context.getName(),context.getLexicalSet()))
-            for phraseID in self.phrases.keys():
-                phrase = self.phrases[phraseID]
-                i = phrase.getIndex()
-                phraseCountInContext = phrase.getPhraseCountPerContext()[contextID]
-                totalPhraseCount = context.getPhraseCount()[phrase.getPhraseLength()]
-                
-                if totalPhraseCount == 0:
-                    frequency = 0
-                else:
-                    frequency = phraseCountInContext/totalPhraseCount
-                if phrase in context.getLexicalSet().keys():
-                    weight = 1
-                    self.phraseWeightByContextMatrix[i][j] = weight
-                else:                    
-                    weight = frequency/maxFrequency
-                    self.phraseWeightByContextMatrix[i][j] = weight
+            for phrase in context.getLexicalSet().keys():
+                lexicalSetLines.append(phrase.getIndex())
+                lexicalSetColumns.append(context.getRCIndex())
+        lexicalSetLines = np.array(lexicalSetLines, dtype=np.int64)
+        lexicalSetColumns = np.array(lexicalSetColumns, dtype=np.int64)
+
+        allRCIndexes = np.arange(c)
+        blockSize = self.blockRows(3 * 8 * c)
+        for start in range(0, p, blockSize):
+            end = min(start + blockSize, p)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                weights = self.relativeFrequency(slice(start, end), allRCIndexes) / maxFrequency
+            inBlock = (lexicalSetLines >= start) & (lexicalSetLines < end)
+            weights[lexicalSetLines[inBlock] - start, lexicalSetColumns[inBlock]] = 1
+            self.phraseWeightByContextMatrix[start:end] = weights
 
         """
         Insert entries phrase i, context j, weight ij into the "phrase weight by context" table of the
@@ -721,17 +880,16 @@ class WordVectorSpace(object):
         #    i = self.phrases[phraseID].getIndex()
         #    for contextID in self.contexts.keys():
         #        j = self.contexts[contextID].getRCIndex()
-        #        cur = con.cursor()
+        #        cur = checkout().cursor()
         #        cur.execute("""INSERT INTO "phrase_weight_by_context" ("phrase_id", "context_id", "phrase_weight")
         #        VALUES (%s,%s,%s)""", ([phraseID, contextID, self.phraseWeightByContextMatrix[i][j]]))
 
         
         """
-        export phraseWeightByContextMatrix to json file
+        export phraseWeightByContextMatrix to the files phraseWeightByContextMatrix.npy and its header
+        phraseWeightByContextMatrix.json
         """
-        #import numpy
-        a = np.asarray(self.phraseWeightByContextMatrix)
-        np.savetxt("phraseWeightByContextMatrix.csv", a, delimiter=",")
+        self.saveMatrix('phraseWeightByContextMatrix', self.phraseWeightByContextMatrix, lines='phrase_index', columns='rcindex')
         
         print(self.phraseWeightByContextMatrix)
     
@@ -741,76 +899,164 @@ class WordVectorSpace(object):
     also called here semantic field of a context.
     The method also reset the "context semantic field" table of the --contextionary-- database
     and records the lexical set entries by context 
+    In an incremental refresh (--refresh--, see incrementalRefresh.py), the lexical sets are updated by
+    refreshContextLexicalSet instead.
     """
             
-    def createContextLexicalSet(self):
+    def createContextLexicalSet(self, refresh=None):
+
+        if refresh is not None:
+            return self.refreshContextLexicalSet(refresh)
+
+        contextsByRCIndex = dict((context.getRCIndex(), context) for context in self.contexts.values())
+        phrasesByIndex = dict((phrase.getIndex(), phrase) for phrase in self.phrases.values())
+        p, c = self.distanceToContextMatrix.shape
+        boundaries = np.array([contextsByRCIndex[RCIndex].getLexicalSetBoundary() for RCIndex in range(c)], dtype=np.float64)
+        independent = np.array([contextsByRCIndex[RCIndex].isIndependent() for RCIndex in range(c)], dtype=bool)
 
         """
         Delete all existing entries of table "context semantic field".
         "context semantic field" table is a table consisting of 2 columns: context and phrase.
         To each context correspond all phrases that qualify as their lexical field.
         """
-        cur = con.cursor()
+        cur = checkout().cursor()
         cur.execute("""DELETE FROM "context_phrase";""")
 
         """
+        The phrases are reviewed by blocks of lines of the distance to context matrix, and --lexicalSetRCIndexes--
+        and --lexicalSetIndexes-- collect the (context, phrase) entries of the lexical sets.
         INDEPENDENT CONTEXTS METHODOLOGY
-        Lexical set construction methodology with independent contexts.
-        """
-        cur.execute(""" SELECT "context_id" FROM "context" WHERE "context_children_id" = %s; """, (['0']))
-        independentContextID = cur.fetchall()
-
-        for contextID in independentContextID:
-            contextID = contextID[0]
-            context = self.contexts[contextID]
-            lexicalSet = dict()
-            for phraseID in self.phrases.keys():
-                phrase = self.phrases[phraseID]
-                
-                if phrase.getPhraseCrossPresenceOverContextChildren()[contextID] == 1:
-                
-                    d = self.distanceToContextMatrix[phrase.getIndex()][context.getRCIndex()]
-                    if d <= context.getLexicalSetBoundary():
-                        lexicalSet.update({phrase:d})
-                        
-                        """
-                        Add entries context ID, phrase ID into the table "context semantic field".
-                        """
-                    
-                        ######### revised 05/30/2018
-                        cur = con.cursor()
-                        cur.execute("""INSERT INTO "context_phrase" ("context_id", "phrase_id")
-                        VALUES (%s,%s)""", ([contextID, phraseID]))
-            context.setLexicalSet(lexicalSet)
-        
-        """
+        A phrase belongs to the lexical set of an independent context when it is significantly present in the context
+        and its distance to the context is at most the lexical set boundary of the context.
         DEPENDENT CONTEXTS METHODOLOGY
-        Lexical set construction methodology with dependent contexts.
-        """    
-        
-        cur.execute(""" SELECT "context_id" FROM "context" WHERE "context_children_id" != %s; """, (['0']))
-        dependentContextID = cur.fetchall()
-        
-        for phraseID in self.phrases.keys():
-            #phraseID=phraseID[0]
-            phrase = self.phrases[phraseID]
-            for contextID in dependentContextID:
-                contextID = contextID[0]
-                context = self.contexts[contextID]
-                ancestorsID = context.getAncestorsID()
-                #lexicalSet=dict()
-                if phrase.isSignificantlyPresentInContext(contextID):
-                    belongsToLexicalSet = True
-                    for ancestorID in ancestorsID:
-                        if phrase.isSignificantlyPresentInContext(ancestorID):
-                            belongsToLexicalSet = False
-                    if belongsToLexicalSet:
-                        cur = con.cursor()
-                        cur.execute("""INSERT INTO "context_phrase" ("context_id", "phrase_id")
-                        VALUES (%s,%s)""", ([contextID, phraseID]))
-                        distance=self.distanceToContextMatrix[phrase.getIndex()][context.getRCIndex()]
-                        #lexicalSet.update({phrase:d})
-                        context.updateLexicalSet(phrase,distance)
+        A phrase belongs to the lexical set of a dependent context when it is significantly present in the context
+        and in none of its ancestors (see dependentLexicalSetEntries).
+        """
+        lexicalSetRCIndexes = [np.zeros(0, dtype=np.int64)]
+        lexicalSetIndexes = [np.zeros(0, dtype=np.int64)]
+        independentRCIndexes = np.flatnonzero(independent)
+        blockSize = self.blockRows((self.distanceToContextMatrix.itemsize + 1 + 3 * 8) * c)
+        for lines in self.lineBlocks(p, blockSize):
+            indexes = np.arange(lines.start, lines.stop)
+            distances = np.asarray(self.distanceToContextMatrix[lines])[:, independentRCIndexes]
+            presence = self.phraseCrossPresenceMatrix[lines][:, independentRCIndexes].toarray() > 0
+            blockLines, columns = np.nonzero(presence & (distances <= boundaries[independentRCIndexes]))
+            lexicalSetRCIndexes.append(independentRCIndexes[columns])
+            lexicalSetIndexes.append(indexes[blockLines])
+            dependentRCIndexes, dependentIndexes = self.dependentLexicalSetEntries(indexes, independent)
+            lexicalSetRCIndexes.append(dependentRCIndexes)
+            lexicalSetIndexes.append(dependentIndexes)
+
+        """
+        The entries are recorded in the table "context semantic field" with one COPY, and the phrases of each
+        lexical set are in the order of their index.
+        """
+        lexicalSetRCIndexes = np.concatenate(lexicalSetRCIndexes)
+        lexicalSetIndexes = np.concatenate(lexicalSetIndexes)
+        order = np.lexsort((lexicalSetIndexes, lexicalSetRCIndexes))
+        lexicalSetRCIndexes = lexicalSetRCIndexes[order]
+        lexicalSetIndexes = lexicalSetIndexes[order]
+        phraseIDs = np.zeros(p, dtype=np.int64)
+        for phraseID, phrase in self.phrases.items():
+            phraseIDs[phrase.getIndex()] = phraseID
+        copy_rows(cur, '"context_phrase"', ["context_id", "phrase_id"],
+                  zip(self.contextIDs[lexicalSetRCIndexes].tolist(), phraseIDs[lexicalSetIndexes].tolist()))
+        distances = np.asarray(self.distanceToContextMatrix[lexicalSetIndexes, lexicalSetRCIndexes])
+
+        for context in self.contexts.values():
+            context.setLexicalSet(dict())
+        for RCIndex, index, distance in zip(lexicalSetRCIndexes.tolist(), lexicalSetIndexes.tolist(), distances):
+            contextsByRCIndex[RCIndex].updateLexicalSet(phrasesByIndex[index], distance)
+
+    """
+    dependentLexicalSetEntries returns the RCIndexes and the phrase indexes of the entries of the lexical sets of the
+    dependent contexts for the phrases of index --indexes--. The cell of line i and column j of --ancestors-- is 1
+    when the context i is an ancestor of the context j, so that one sparse product of the cross presence lines of
+    the phrases with --ancestors-- counts the ancestors of each context where each phrase is significantly present.
+    """
+    def dependentLexicalSetEntries(self, indexes, independent):
+
+        from scipy import sparse
+
+        c = len(independent)
+        crossPresence = self.phraseCrossPresenceMatrix[indexes].astype(np.int64)
+        ancestors = (self.contextSubtree - sparse.identity(c, dtype=np.int64, format='csc')).T.tocsr()
+        presentInAncestors = ((crossPresence @ ancestors) > 0).astype(np.int64)
+        dependentPresence = (crossPresence @ sparse.diags((~independent).astype(np.int64), dtype=np.int64)).tocsr()
+        entries = (dependentPresence - dependentPresence.multiply(presentInAncestors)).tocoo()
+        keep = entries.data != 0
+        return entries.col[keep].astype(np.int64), indexes[entries.row[keep]]
+
+    """
+    refreshContextLexicalSet updates the lexical sets of the previous run (see createContextLexicalSet) in an incremental
+    refresh (--refresh--). The lexical sets of the previous run are kept for the phrases that are not dirty. The dirty
+    phrases are reviewed in all the contexts, and all the phrases are reviewed in the independent contexts whose
+    boundary changed, with the rules of createContextLexicalSet:
+        - independent context: the phrase exists in the context and its distance to the context is at most the
+        lexical set boundary of the context
+        - dependent context: the phrase is significantly present in the context and in none of its ancestors
+    The phrases of each lexical set are in the order of their index, as in createContextLexicalSet. Only the entries
+    of the phrases and the contexts reviewed are replaced in the "context semantic field" table.
+    """
+    def refreshContextLexicalSet(self, refresh):
+
+        contextsByRCIndex = dict((context.getRCIndex(), context) for context in self.contexts.values())
+        phrasesByIndex = dict((phrase.getIndex(), phrase) for phrase in self.phrases.values())
+        p, c = self.distanceToContextMatrix.shape
+        boundaries = np.array([contextsByRCIndex[RCIndex].getLexicalSetBoundary() for RCIndex in range(c)], dtype=np.float64)
+        independent = np.array([contextsByRCIndex[RCIndex].isIndependent() for RCIndex in range(c)], dtype=bool)
+
+        cur = checkout().cursor()
+        cur.execute("""DELETE FROM "context_phrase" WHERE "phrase_id" = ANY(%s) OR "context_id" = ANY(%s);""",
+                    (refresh.dirtyIDs(), [contextsByRCIndex[RCIndex].getID() for RCIndex in refresh.changedBoundaryRCIndexes.tolist()]))
+
+        """
+        --lexicalSetRCIndexes-- and --lexicalSetIndexes-- collect the (context, phrase) entries of the phrases and
+        the contexts reviewed.
+        """
+        lexicalSetRCIndexes = [np.zeros(0, dtype=np.int64)]
+        lexicalSetIndexes = [np.zeros(0, dtype=np.int64)]
+        for RCIndex in refresh.changedBoundaryRCIndexes.tolist():
+            distances = np.asarray(self.distanceToContextMatrix[:, RCIndex])
+            presence = self.phraseCountPerContextMatrix[:, RCIndex].toarray().ravel() > 0
+            indexes = np.flatnonzero(presence & (distances <= boundaries[RCIndex]))
+            lexicalSetRCIndexes.append(np.full(len(indexes), RCIndex, dtype=np.int64))
+            lexicalSetIndexes.append(indexes)
+
+        otherRCIndexes = np.flatnonzero(independent & ~np.isin(np.arange(c), refresh.changedBoundaryRCIndexes))
+        blockSize = self.blockRows((self.distanceToContextMatrix.itemsize + 1 + 3 * 8) * c)
+        for lines in self.lineBlocks(p, blockSize, refresh):
+            distances = np.asarray(self.distanceToContextMatrix[lines])[:, otherRCIndexes]
+            presence = self.phraseCountPerContextMatrix[lines][:, otherRCIndexes].toarray() > 0
+            blockLines, columns = np.nonzero(presence & (distances <= boundaries[otherRCIndexes]))
+            lexicalSetRCIndexes.append(otherRCIndexes[columns])
+            lexicalSetIndexes.append(lines[blockLines])
+            dependentRCIndexes, dependentIndexes = self.dependentLexicalSetEntries(lines, independent)
+            lexicalSetRCIndexes.append(dependentRCIndexes)
+            lexicalSetIndexes.append(dependentIndexes)
+
+        lexicalSetRCIndexes = np.concatenate(lexicalSetRCIndexes)
+        lexicalSetIndexes = np.concatenate(lexicalSetIndexes)
+        contextIDs = np.array([contextsByRCIndex[RCIndex].getID() for RCIndex in range(c)], dtype=np.int64)
+        copy_rows(cur, '"context_phrase"', ["context_id", "phrase_id"],
+                  zip(contextIDs[lexicalSetRCIndexes].tolist(), refresh.phraseIDs[lexicalSetIndexes].tolist()))
+
+        """
+        The entries reviewed and the entries kept from the previous run make the lexical sets.
+        """
+        previousRCIndexes, previousIndexes = refresh.previousLexicalSets()
+        lexicalSetRCIndexes = np.concatenate([previousRCIndexes, lexicalSetRCIndexes])
+        lexicalSetIndexes = np.concatenate([previousIndexes, lexicalSetIndexes])
+        order = np.lexsort((lexicalSetIndexes, lexicalSetRCIndexes))
+        lexicalSetRCIndexes = lexicalSetRCIndexes[order]
+        lexicalSetIndexes = lexicalSetIndexes[order]
+        distances = np.asarray(self.distanceToContextMatrix[lexicalSetIndexes, lexicalSetRCIndexes])
+
+        for context in self.contexts.values():
+            context.setLexicalSet(dict())
+        for RCIndex, index, distance in zip(lexicalSetRCIndexes.tolist(), lexicalSetIndexes.tolist(), distances):
+            contextsByRCIndex[RCIndex].updateLexicalSet(phrasesByIndex[index], distance)
+        print("lexical sets refreshed: %s entries reviewed" % (len(lexicalSetIndexes) - len(previousIndexes)))
 
     """
     createPhraseLexicalSet method creates a phrase lexical set (semantic field).
@@ -840,186 +1086,121 @@ class WordVectorSpace(object):
         all phrases related to it along with the strengh of their bonding/relation
         """   
     
-        cur = con.cursor()
+        cur = checkout().cursor()
         cur.execute("""DELETE FROM "related_phrase";""")       
         
-        contextPhraseDocumentCount=0
-        relatedPhraseDocumentCount=0
-        sharedDocumentCount=0
-        phraseBondingIndex=0
+        from analyticsKernels import related_phrases, share_arrays, attach_arrays, shared_related_phrases
+        from concurrent.futures import ProcessPoolExecutor
        
         """
         For each context, the lexical set is explored and a bonding index is calculated
         between each pair of phrase within the lexical set. In that way, the terms related
         to any context phrase can be determines.
-        """
+        The bonding indexes of a context are computed by analyticsKernels.related_phrases from the phrase document
+        matrix: only the phrases of the lexical set (--lines--) and the RCIndex of the context are needed.
+        The contexts are independent: with config.PARSE['lexicalSetWorkers'] > 1, they are dispatched to a pool of
+        processes which map the phrase document matrix and the RCIndex of the documents from shared memory.
+        The results come back in the order of the contexts, as with one process.
+        """
+        contextIDs = []
+        tasks = []
         for contextID in self.contexts.keys():
             context = self.contexts[contextID]
-            
+            lexicalSet = list(context.getLexicalSet().keys())
+            print("%s: %s context phrases" % (context.getName(), len(lexicalSet)))
+            if len(lexicalSet) < 2:
+                continue
+            contextIDs.append(contextID)
+            tasks.append((np.array([contextPhrase.getIndex() for contextPhrase in lexicalSet], dtype=np.int64),
+                          self.subtreeRCIndexes(context.getRCIndex()), self.bondingIndexPercentile,
+                          self.blockRows(24 * len(lexicalSet))))
+
+        if config.PARSE['lexicalSetWorkers'] > 1 and len(tasks) > 1:
+            blocks, descriptions = share_arrays({'data': self.phraseDocumentMatrix.data,
+                                                 'indices': self.phraseDocumentMatrix.indices,
+                                                 'indptr': self.phraseDocumentMatrix.indptr,
+                                                 'documentRCIndex': self.documentRCIndex})
+            try:
+                with ProcessPoolExecutor(config.PARSE['lexicalSetWorkers'], initializer=attach_arrays,
+                                         initargs=(descriptions,)) as executor:
+                    results = list(executor.map(shared_related_phrases, tasks))
+            finally:
+                for block in blocks:
+                    block.close()
+                    block.unlink()
+        else:
+            results = (related_phrases(self.phraseDocumentMatrix, np.isin(self.documentRCIndex, subtree), lines, percentile, blockSize)
+                       for lines, subtree, percentile, blockSize in tasks)
+
+        results = dict(zip(contextIDs, results))
+
+        relatedPhraseRows = []
+        for contextID in self.contexts.keys():
+            context = self.contexts[contextID]
+            lexicalSet = list(context.getLexicalSet().keys())
             """
-            Explore lexical set
+            The lexical set by context of a context phrase is initialized by every context whose lexical set contains it.
             """
-      
-            counter = 0
-            for contextPhrase in context.getLexicalSet().keys():
-                    
-                counter += 1
-                
-                if counter % 100 == 0:
-                    print(contextPhrase.getText())
-                    print(counter)
-    
-                contextPhrase.initializeLexicalSetByContext(len(self.contexts))                
-                contextPhraseLexicalSet = dict()
-                
-                """
-                Define contextPhraseDocumentCount by calculating its integer value from the
-                "phrase origin" table
-                """
-                #counter2 = 0
-                contextPhraseDocument = contextPhrase.getDocumentPerContext()[context.getRCIndex()]
-                contextPhraseDocumentCount = len(contextPhraseDocument)
-                
-                for relatedPhrase in context.getLexicalSet().keys():
-                    
-                    """   
-                    if contextPhrase is different from relatedPhrase. 
-                    We do want to compare relatedPhrase to all other phrases except itself.
-                    """   
-                
-                    if contextPhrase != relatedPhrase:
-
-                        """
-                        Under the if condition above, define relatedPhraseDocumentCount by calculating 
-                        its integer value from the "phrase origin" table 
-                        From "phrase origin" table, define sharedDocumentCount which is the number of documents
-                        shared by the two phrases contextPhrase and relatedPhrase
-                        Calculate phraseBondingIndex using the formula:
-                        phraseBondingIndex = sharedDocumentCount/(contextPhraseDocumentCount+relatedPhraseDocumentCount-sharedDocumentCount)
-                        Record the entry into contextPhrasLexicalSet with {key:value}={relatedPhrase:phraseBondingIndex}    
-                        """
-
-                        relatedPhraseDocument=relatedPhrase.getDocumentPerContext()[context.getRCIndex()]
-                        relatedPhraseDocumentCount=len(relatedPhraseDocument)
-                        
-                        sharedDocument=set(contextPhraseDocument).intersection(relatedPhraseDocument)
-                        sharedDocumentCount = len(sharedDocument)
-                        
-                        if(contextPhraseDocumentCount+relatedPhraseDocumentCount-sharedDocumentCount==0):
-                        
-                            print("SharedDocumentCount: %s" %sharedDocumentCount)
-                            
-                            print("context phrase: %s . related phrase: %s" %(contextPhrase.getText(),relatedPhrase.getText()))
-                            
-                            print("These 2 phrases share no document together.")
-                            
-                            print("contextPhraseDocumentCount: %s" %contextPhraseDocumentCount)
-                            if contextPhraseDocumentCount==0:
-                                print("context phrase appears in no document")
-                            
-                            print("relatedPhraseDocumentCount: %s" %relatedPhraseDocumentCount)
-                            if relatedPhraseDocumentCount==0:
-                                print("related phrase appears in no document")
-                            
-                            """
-                            FIXING AN ANOMALY.
-                            IF THE DATABASE INTEGRITY WAS COMPROMISED, IT WILL HAPPEN THAT contextPhraseDocumentCount=0
-                            0 IS NOT A LOGICAL VALUE FOR THIS VARIABLE.
-                            TO CORRECT THE ANOMALY, WE WILL ASSIGN AN INCORRECT BUT MORE PLAUSIBLE VALUE TO THE
-                            VARIABLE AND THAT VALUE WILL BE 1.
-                            THEREFORE, WE WILL NOT EXPECT A DIVISION BY ZERO ANYMORE.
-                            """
-                            contextPhraseDocumentCount=1
-                        
-                        
-                        
-                        
-                        phraseBondingIndex = sharedDocumentCount/(contextPhraseDocumentCount+relatedPhraseDocumentCount-sharedDocumentCount)
-                     
-                        contextPhraseLexicalSet.update({relatedPhrase:phraseBondingIndex})
-                        
+            for contextPhrase in lexicalSet:
+                contextPhrase.initializeLexicalSetByContext(len(self.contexts))
+            if contextID not in results:
+                continue
+            boundaries, relatedPhrases = results[contextID]
+
+            for line, contextPhrase in enumerate(lexicalSet):
+
                 """
-                Calculate the 90% percentile of the contextPhraseLexicalSet values.
+                The boundary is the 90% percentile of the bonding indexes of the context phrase.
                 It is assumed here that 90% of the connections between a phrase and others are not strong enough.
+                Only the phrases with phraseBondingIndex > boundary are added into the lexicalSetByContext list.
                 """
-                #import numpy as np
-                ######### revised 06/03/2018
-                lst = list(contextPhraseLexicalSet.values())
-                if lst:
-                #########
-                    boundary = np.percentile(list(contextPhraseLexicalSet.values()),self.bondingIndexPercentile)
-                    contextPhrase.setLexicalSetBoundary(boundary)      
-                    
-                    """
-                    Cut the contextPhraseSemanticField dictionary down to only the phrases with phraseBondingIndex > boundary
-                    """
-                
-                    keepkeys = []
-                    for key in contextPhraseLexicalSet.keys():
-                        if contextPhraseLexicalSet[key] > boundary:
-                            keepkeys.append(key)
-                    
-                    contextPhraseLexicalSet = {k: contextPhraseLexicalSet[k] for k in keepkeys}
-                         
-                    """
-                    After the semanticField dictionary has been filtered down, it can now be added into the lexicalSetByContext list
-                    """
-                    
-                    contextPhrase.updateLexicalSetByContext(contextPhraseLexicalSet,context.getRCIndex())
-                    
-                    """
-                    Update the "phrase semantic field" with the following entries:
-                    context ID, context Phrase ID, related Phrase ID and phrase bonding strength
-                    Note that related Phrase ID and phrase bonding strength will simply come from above
-                    contextPhraseSemanticField dictionary while context ID and context Phrase ID are fixed and known
-                    """
-                
-                    for relatedPhrase in contextPhraseLexicalSet.keys():
-                        cur = con.cursor()
-                        cur.execute("""INSERT INTO "related_phrase" ("context_id", "context_phrase_id", "related_phrase_id", "phrase_bonding_index")
-                        VALUES (%s,%s, %s,%s)""", ([contextID, contextPhrase.getPhraseID(), relatedPhrase.getPhraseID(), contextPhraseLexicalSet[relatedPhrase]]))
+                contextPhrase.setLexicalSetBoundary(boundaries[line])
+                columns = relatedPhrases.indices[relatedPhrases.indptr[line]:relatedPhrases.indptr[line+1]]
+                values = relatedPhrases.data[relatedPhrases.indptr[line]:relatedPhrases.indptr[line+1]]
+                contextPhraseLexicalSet = {lexicalSet[column]: value for column, value in zip(columns.tolist(), values.tolist())}
+                contextPhrase.updateLexicalSetByContext(contextPhraseLexicalSet, context.getRCIndex())
+
+                relatedPhraseRows.extend((contextID, contextPhrase.getPhraseID(), relatedPhrase.getPhraseID(), value)
+                                         for relatedPhrase, value in contextPhraseLexicalSet.items())
+
+        """
+        Update the "phrase semantic field" with the following entries:
+        context ID, context Phrase ID, related Phrase ID and phrase bonding strength
+        """
+        copy_rows(cur, 'related_phrase', ['context_id', 'context_phrase_id', 'related_phrase_id', 'phrase_bonding_index'],
+                  relatedPhraseRows)
 
     ######### revised 06/04/2018
     def updateSharedWord(self):
         
         # Delete all existing entries in shared word table
-        cur = con.cursor()
+        cur = checkout().cursor()
         cur.execute("""DELETE FROM "shared_word";""")
         
         # Get complete list of phrase IDs which have phrase length >= 2
         # GUY: Threshold should be 2 instead of 1 right?
         phraseLengthThreshold = 2
-        cur = con.cursor()
+        cur = checkout().cursor()
         cur.execute(""" SELECT "phrase_id" FROM "phrase" WHERE "phrase_length" >= %s AND "red_flag"=0; """, ([phraseLengthThreshold]))
         allLongPhraseID = cur.fetchall()
 
         # Get list of long phrase IDs in context semantic field table
         # GUY: added DISTINCT
-        cur = con.cursor()
+        cur = checkout().cursor()
         cur.execute(""" SELECT DISTINCT "phrase_id" FROM "context_phrase" ;""" )
         csfPhraseID = cur.fetchall()
         csfLongPhraseID = set(csfPhraseID).intersection(allLongPhraseID)
         print("long phrase size: %s" % (len(csfLongPhraseID)))
-        # Create dictionary {longPhraseID: phraseText}
-        longPhraseText = dict()
-        counter=0
-        for lpid in csfLongPhraseID:
-            counter+=1
-            
-            phraseID = lpid[0]
-            #phrase = self.phrases[phraseID]
-            #if phrase.getFlag()==0:
-            cur.execute(""" SELECT "phrase_text" FROM phrase WHERE "phrase_id"=%s;""",([phraseID]) )
-            phraseText = cur.fetchall()
-            #longPhraseText.update({phraseID:phrase.getText()})
-            longPhraseText.update({phraseID:phraseText[0][0]})
-            if counter % 1000 == 0:
-                print(counter)
-                #print(phraseText)
-                print(phraseText[0][0])
+
+        # Create dictionary {longPhraseID: phraseText} with one query, in the order of csfLongPhraseID
+        longPhraseIDs = [lpid[0] for lpid in csfLongPhraseID]
+        cur.execute(""" SELECT "phrase_id", "phrase_text" FROM phrase WHERE "phrase_id" = ANY(%s);""", (longPhraseIDs,))
+        phraseTexts = dict(cur.fetchall())
+        longPhraseText = {phraseID: phraseTexts[phraseID] for phraseID in longPhraseIDs}
 
         # Update shared word table
         from nltk import word_tokenize
+        from itertools import combinations
         
         """
         GUY: It seems postgresql consider {key2:key1} a violation of {key1:key2}
@@ -1027,168 +1208,112 @@ class WordVectorSpace(object):
         Another issue is that we would violate primary constraints when two words share multiple words.
         Hence, Primary key should consist of 3 columns to be unique: "longPhraseID, siblingID, sharedWord"
         """
-        donotpermute=[]
-        counter=0
-        for lp1 in longPhraseText.keys():
-            counter+=1
-            if counter % 1000 ==0:
-                print("counter: %s" % counter)
-            tokens_1 = word_tokenize(longPhraseText[lp1])
-            tokens_1b=list(set(tokens_1))
-            donotpermute.append(lp1)
-            #print("list of phrase ID not to permute")
-            #print(donotpermute)
-            counter2=0
-            for lp2 in longPhraseText.keys():
-                counter2+=1
-                if lp2 not in donotpermute:
-                    tokens_2 = word_tokenize(longPhraseText[lp2])
-                    tokens_2b=list(set(tokens_2))
-                    for token in tokens_1b:
-                        if token in tokens_2b:
-                            longPhraseID = lp1
-                            siblingID = lp2
-                            sharedWord = token
-                            swpilp = tokens_1.index(token)
-                            swpis = tokens_2.index(token)
-                            cur = con.cursor()
-                            cur.execute("""INSERT INTO "shared_word" ("long_phrase_id", "sibling_id", "shared_word", "shared_word_position_in_long_phrase", "shared_word_position_in_sibling")
-                            VALUES (%s,%s,%s,%s,%s)""", ([longPhraseID, siblingID, sharedWord, swpilp, swpis]))  
-                            if counter2 % 1000==0:
-                                print("counter 1: %s, tokens_1: %s, tokens_2: %s, shared word:%s, pos 1: %s, pos 2: %s" %(counter,tokens_1,tokens_2,sharedWord,swpilp,swpis))
+
+        """
+        Each long phrase is tokenized once. --wordPosition-- gives for each long phrase (in the order of
+        --longPhraseText--) the position of the first occurrence of each of its words, and --phrasesByWord--
+        is the inverted index {word: long phrases containing the word, in the same order}.
+        Two long phrases share a word when they are both in the list of the word: each pair of the list gives
+        one entry, the long phrase being the first of the two phrases in the order of --longPhraseText--
+        and the sibling the second one.
+        """
+        wordPosition = []
+        phrasesByWord = dict()
+        for rank, phraseID in enumerate(longPhraseText.keys()):
+            tokens = word_tokenize(longPhraseText[phraseID])
+            positions = dict()
+            for position, token in enumerate(tokens):
+                if token not in positions:
+                    positions[token] = position
+                    phrasesByWord.setdefault(token, []).append(rank)
+            wordPosition.append(positions)
+
+        sharedWordRows = []
+        for sharedWord, ranks in phrasesByWord.items():
+            for rank1, rank2 in combinations(ranks, 2):
+                sharedWordRows.append((longPhraseIDs[rank1], longPhraseIDs[rank2], sharedWord,
+                                       wordPosition[rank1][sharedWord], wordPosition[rank2][sharedWord]))
+        print("shared words: %s" % len(sharedWordRows))
+
+        copy_rows(cur, 'shared_word', ['long_phrase_id', 'sibling_id', 'shared_word', 'shared_word_position_in_long_phrase',
+                                       'shared_word_position_in_sibling'], sharedWordRows)
                             
     def updateContextSpellingSimilarity(self):
         
-        # Define Levenshtein distance
-        def levenshtein(s, t):
-            """ 
-                Returns the Levenshtein distance between the strings s and t.
-                Source: https://www.python-course.eu/levenshtein_distance.php
-            """
-            rows = len(s)+1
-            cols = len(t)+1
-            dist = [[0 for x in range(cols)] for x in range(rows)]
-            for i in range(1, rows):
-                dist[i][0] = i
-            for i in range(1, cols):
-                dist[0][i] = i
-            for col in range(1, cols):
-                for row in range(1, rows):
-                    if s[row-1] == t[col-1]:
-                        cost = 0
-                    else:
-                        cost = 1
-                    dist[row][col] = min(dist[row-1][col] + 1,      # deletion
-                                         dist[row][col-1] + 1,      # insertion
-                                         dist[row-1][col-1] + cost) # substitution
-    
-            return dist[row][col]
+        from analyticsKernels import levenshtein_pairs
         
         # Delete all existing entries in context spelling similarity table
-        cur = con.cursor()
+        cur = checkout().cursor()
         cur.execute("""DELETE FROM "context_spelling_similarity";""")
         
-        # Create dictionary {contextID: contextName}
+        # Create the array of the character codes of the context names, one line per context
+        contextIDs = list(self.contexts.keys())
+        contextNames = [self.contexts[contextID].getName().lower() for contextID in contextIDs]
+        lengths = np.array([len(contextName) for contextName in contextNames], dtype=np.int64)
+        codes = np.zeros((len(contextNames), max([1] + lengths.tolist())), dtype=np.int64)
+        for line, contextName in enumerate(contextNames):
+            codes[line, :len(contextName)] = [ord(character) for character in contextName]
+
         """
-        contextName = dict()
-        for contextID in self.contexts.keys():
-            context=self.contexts[contextID]
-            contextName.update({contextID:context.getName()})     
-        """ 
-            
-        cur.execute(""" SELECT "context_id" FROM context;""" )
-        contextIDs = cur.fetchall()
-        
+        The Levenshtein distance is symmetric: it is computed once for each pair of contexts (line_1 < line_2)
+        and both directions are written. A distance of at most 3 requires lengths that differ by at most 3.
+        The distances are computed by levenshtein_pairs on blocks of pairs sorted by length of the first name,
+        the pairs above 3 being dropped as soon as possible.
+        """
+        lines_1, lines_2 = np.triu_indices(len(contextNames), 1)
+        close = np.abs(lengths[lines_1] - lengths[lines_2]) <= 3
+        lines_1, lines_2 = lines_1[close], lines_2[close]
+        order = np.argsort(lengths[lines_1], kind='stable')
+        lines_1, lines_2 = lines_1[order], lines_2[order]
+
         # Update context spelling similarity table
-        for contextID_1 in contextIDs:
-            cur.execute(""" SELECT "context_name" FROM context WHERE "context_id"=%s;""",(contextID_1))
-            contextName_1 = cur.fetchall()
-            for contextID_2 in contextIDs:
-                if contextID_1[0] != contextID_2[0]:
-                    cur.execute(""" SELECT "context_name" FROM context WHERE "context_id"=%s;""",(contextID_2))
-                    contextName_2 = cur.fetchall()
-                    similarityIndex = levenshtein(contextName_1[0][0].lower(), contextName_2[0][0].lower())
-                    if similarityIndex <= 3:
-                        cur = con.cursor()
-                        cur.execute("""INSERT INTO "context_spelling_similarity" ("context_id", "similar_spelling_context_id", "similarity_index")
-                        VALUES (%s,%s,%s)""", ([contextID_1[0], contextID_2[0], similarityIndex]))
-                        print("context ID1 %s, %s, context IDs2 %s, %s, similarity index %s" %(contextID_1[0], contextName_1[0][0], contextID_2[0], contextName_2[0][0], similarityIndex))
+        similarityRows = []
+        blockSize = self.blockRows(3 * 8 * codes.shape[1])
+        for start in range(0, len(lines_1), blockSize):
+            block_1, block_2 = lines_1[start:start + blockSize], lines_2[start:start + blockSize]
+            similarityIndexes = levenshtein_pairs(codes, lengths, block_1, block_2, 3)
+            similar = similarityIndexes <= 3
+            for line_1, line_2, similarityIndex in zip(block_1[similar].tolist(), block_2[similar].tolist(),
+                                                       similarityIndexes[similar].tolist()):
+                similarityRows.append((contextIDs[line_1], contextIDs[line_2], similarityIndex))
+                similarityRows.append((contextIDs[line_2], contextIDs[line_1], similarityIndex))
+        print("similar spelling contexts: %s" % len(similarityRows))
+
+        copy_rows(cur, 'context_spelling_similarity', ['context_id', 'similar_spelling_context_id', 'similarity_index'],
+                  similarityRows)
                           
     def updatePhraseSpellingSimilarity(self):
         
-        # Define Levenshtein distance
-        def levenshtein(s, t):
-            """ 
-                Returns the Levenshtein distance between the strings s and t.
-                Source: https://www.python-course.eu/levenshtein_distance.php
-            """
-            rows = len(s)+1
-            cols = len(t)+1
-            dist = [[0 for x in range(cols)] for x in range(rows)]
-            for i in range(1, rows):
-                dist[i][0] = i
-            for i in range(1, cols):
-                dist[0][i] = i
-            for col in range(1, cols):
-                for row in range(1, rows):
-                    if s[row-1] == t[col-1]:
-                        cost = 0
-                    else:
-                        cost = 1
-                    dist[row][col] = min(dist[row-1][col] + 1,      # deletion
-                                         dist[row][col-1] + 1,      # insertion
-                                         dist[row-1][col-1] + cost) # substitution
-    
-            return dist[row][col] 
+        from spellingSimilarity import similar_pairs
         
         # Delete all existing entries in phrase spelling similarity table
-        cur = con.cursor()
+        cur = checkout().cursor()
         cur.execute("""DELETE FROM "phrase_spelling_similarity";""")
 
-        # Create dictionary {phraseID: phraseText}
-        phraseText = dict()
-        
         """
         Revision from Guy. We do not need to apply the methods to all phrases of the universe
         but only to those phrases found into the context semantic field table
         """
-        cur = con.cursor()
-        cur.execute("""SELECT DISTINCT "context_phrase"."phrase_id" FROM phrase,"context_phrase" WHERE "red_flag"=0 AND phrase."phrase_id"="context_phrase"."phrase_id";""" )
-        csfPhraseID = cur.fetchall()
+        cur = checkout().cursor()
+        cur.execute("""SELECT DISTINCT "context_phrase"."phrase_id", "phrase_text" FROM phrase,"context_phrase" WHERE "red_flag"=0 AND phrase."phrase_id"="context_phrase"."phrase_id";""" )
+        csfPhrases = cur.fetchall()
+        phraseIDs = [phraseID for phraseID, text in csfPhrases]
+        phraseTexts = [text for phraseID, text in csfPhrases]
         
-        for phraseID in csfPhraseID:
-            cur.execute(""" SELECT "phrase_text" FROM phrase WHERE "phrase_id"=%s;""",([phraseID[0]]) )
-            text = cur.fetchall()
-            if text:
-                phraseText.update({phraseID:text[0][0]})
-        
-        """
-        for phraseID in self.phrases.keys():
-            phrase=self.phrases[phraseID]
-            phraseText.update({phraseID:phrase.getText()})
-        """
-        
-        # Update phrase spelling similarity table    
-        counter=0
-        print("phrasetext size: %s" % len(phraseText))
-        for phraseID_1 in phraseText.keys():
-            counter+=1
-            if counter % 1000 ==0:
-                print("counter: %s" % counter)
-            phraseText_1 = phraseText[phraseID_1]
-            counter2=0
-            for phraseID_2 in phraseText.keys():
-                counter2+=1
-                if phraseID_1 != phraseID_2:
-                    phraseText_2 = phraseText[phraseID_2]
-                    similarityIndex = levenshtein(phraseText_1, phraseText_2)
-                    if similarityIndex <= 3:
-                        cur = con.cursor()
-                        cur.execute("""INSERT INTO "phrase_spelling_similarity" ("phrase_id", "similar_spelling_phrase_id", "similarity_index")
-                        VALUES (%s,%s,%s)""", ([phraseID_1, phraseID_2, similarityIndex]))
-                        if counter2 % 1000==0:
-                                print("counter 1: %s, phrase 1: %s, phrase 2: %s, similarity index %s" %(counter,phraseText[phraseID_1],phraseText[phraseID_2],similarityIndex))
-   
+        """
+        Update phrase spelling similarity table with the pairs of phrases whose Levenshtein distance is at most 3.
+        similar_pairs (see spellingSimilarity.py) only verifies the candidate pairs of an index of the phrase
+        segments, and each pair once: the two directions of a pair are written with the same similarity index.
+        """
+        print("phrasetext size: %s" % len(phraseTexts))
+        similarityRows = []
+        for index_1, index_2, similarityIndex in similar_pairs(phraseTexts, 3):
+            similarityRows.append((phraseIDs[index_1], phraseIDs[index_2], similarityIndex))
+            similarityRows.append((phraseIDs[index_2], phraseIDs[index_1], similarityIndex))
+        print("similar spelling pairs: %s" % len(similarityRows))
+
+        copy_rows(cur, 'phrase_spelling_similarity', ['phrase_id', 'similar_spelling_phrase_id', 'similarity_index'],
+                  similarityRows)
     
     """
     NEW NEW NEW NEW NEW NEW
@@ -1198,75 +1323,73 @@ class WordVectorSpace(object):
     def updateFrequencyDistanceTable(self):   
 
         # Delete all existing entries in frequency distance table
-        cur = con.cursor()
+        cur = checkout().cursor()
         cur.execute("""DELETE FROM "phrase_frequency_and_distance";""")
 
         cur.execute(""" SELECT DISTINCT "phrase_id" FROM "context_phrase";""" )
         phraseIDs = cur.fetchall()
 
-        cur.execute(""" SELECT "context_id" FROM context;""" )
-        contextIDs = cur.fetchall()
-
-        counter=0
-
+        """
+        The relative frequency of a context phrase in a context (relativeFrequency), its distance to the context
+        (distanceToContextMatrix) and its difficulty (phraseDifficulty) are computed by blocks of phrases
+        for all the contexts at once. Only the cells with a relative frequency above 0 are written, with one COPY.
+        """
+        p = len(self.phrases)
+        c = len(self.contexts)
+        isContextPhrase = np.zeros(p, dtype=bool)
         for phraseID in phraseIDs:
-            
-            phraseID=phraseID[0]
-            
-            phrase=self.phrases[phraseID]
-            
-            if counter % 500 == 0:
-                print(counter)
-                print(phrase.getText())
-            counter+=1
-            for contextID in contextIDs:
-                contextID=contextID[0]
-                context=self.contexts[contextID]
-                cur.execute(""" SELECT "phrase_distance_to_context" FROM "phrase_distance_to_context" WHERE "phrase_id"=%s AND "context_id"=%s;""",([phraseID,contextID]))
-                distance = cur.fetchall()[0][0]
-                
-                phraseCountInContext=phrase.getPhraseCountPerContext()[contextID]
-                totalPhraseCount=context.getPhraseCount()[phrase.getPhraseLength()]
-                
-                if totalPhraseCount==0:
-                    phraserelativefrequency=0
-                else:
-                    phraserelativefrequency=phraseCountInContext/totalPhraseCount
-               
-                if totalPhraseCount>0 and phraserelativefrequency>0:
-                    cur.execute("""INSERT INTO "phrase_frequency_and_distance" ("phrase_id", "context_id", "phrase_relative_frequency","phrase_distance_to_context")
-                    VALUES (%s,%s,%s,%s)""", ([phraseID, contextID,phraseCountInContext/totalPhraseCount,distance]))
-                
-                print("contextID")
-                print(contextID)
-                cur.execute(""" SELECT "phrase_relative_frequency" FROM "phrase_frequency_and_distance" WHERE "phrase_id" = %s AND "context_id"=%s; """, ([phraseID,contextID]))
-                frequency = cur.fetchall()
-                if frequency:
-                    frequency =frequency[0][0]
-                    cur.execute(""" UPDATE "phrase_frequency_and_distance" SET "phrase_difficulty" = %s WHERE "phrase_id" = %s AND "context_id"=%s; """, ([self.phraseDifficulty(frequency),phraseID,contextID]))
+            isContextPhrase[self.phrases[phraseID[0]].getIndex()] = True
+        phraseIDsByIndex = np.zeros(p, dtype=np.int64)
+        for phraseID, phrase in self.phrases.items():
+            phraseIDsByIndex[phrase.getIndex()] = phraseID
+        contextIDsByRCIndex = np.zeros(c, dtype=np.int64)
+        for contextID, context in self.contexts.items():
+            contextIDsByRCIndex[context.getRCIndex()] = contextID
+        allRCIndexes = np.arange(c)
+
+        frequencyDistanceRows = []
+        blockSize = self.blockRows(4 * 8 * c)
+        for start in range(0, p, blockSize):
+            end = min(start + blockSize, p)
+            lines = np.flatnonzero(isContextPhrase[start:end])
+            if len(lines) == 0:
+                continue
+            frequencies = self.relativeFrequency(slice(start, end), allRCIndexes)[lines]
+            phraseLines, RCIndexes = np.nonzero(frequencies > 0)
+            frequencies = frequencies[phraseLines, RCIndexes]
+            distances = np.asarray(self.distanceToContextMatrix[start + lines[phraseLines], RCIndexes])
+            frequencyDistanceRows.extend(zip(phraseIDsByIndex[start + lines[phraseLines]].tolist(),
+                                             contextIDsByRCIndex[RCIndexes].tolist(),
+                                             frequencies.tolist(), distances.tolist(),
+                                             self.phraseDifficulty(frequencies).tolist()))
+        print("phrase frequency and distance: %s" % len(frequencyDistanceRows))
+
+        copy_rows(cur, 'phrase_frequency_and_distance', ['phrase_id', 'context_id', 'phrase_relative_frequency',
+                                                         'phrase_distance_to_context', 'phrase_difficulty'],
+                  frequencyDistanceRows)
 
+    """
+    phraseDifficulty returns the difficulty (1 to 4) of a phrase of relative frequency --frequency--, or of each
+    frequency of an array: 1 when the frequency is at least 40 per 100000 phrases, 2 at least 20, 3 at least 1, 4 below.
+    """
     def phraseDifficulty(self, frequency):
         
-        index = frequency * 100000
-
-        if index >= 40:
-            return 1
-        elif index >= 20:
-            return 2
-        elif index >= 1:
-            return 3
-        else:
-            return 4
+        frequency = np.asarray(frequency)
+        return 4 - (frequency >= 1 / 100000).astype(np.int64) - (frequency >= 20 / 100000) - (frequency >= 40 / 100000)
             
 
 class Context(object):
 
-    def __init__(self, contextName, contextID, ancestorsID, independent, ICIndex, RCIndex, dimension, phraseCount):
+    __slots__ = ('contextName', 'contextID', 'ancestorsID', 'independent', 'independentDescendantsID', 'ICIndex',
+                 'RCIndex', 'contextAxis', 'phraseCount', 'lexicalSetBoundary', 'lexicalSet')
+
+    def __init__(self, contextName, contextID, ancestorsID, independent, ICIndex, RCIndex, contextAxis, phraseCount):
         """
         NOTE:
             A context is defined by an ID, a list of ancestors, an independence status,
-            an index if the context is independent, and a dimension. The dimension is the dimension
-            of the phrase vector space. It is the count of all independent contexts.
+            an index if the context is independent, and an axis. The axis is an array whose dimension
+            is the dimension of the phrase vector space. It is the count of all independent contexts.
+            The axis is the line RCIndex of the contextAxes array of WordVectorSpace.
         """
         
         self.contextName=contextName
@@ -1276,8 +1399,7 @@ class Context(object):
         self.independentDescendantsID=[]
         self.ICIndex=ICIndex
         self.RCIndex=RCIndex
-        self.dimension=dimension
-        self.contextAxis = []
+        self.contextAxis = contextAxis
         self.phraseCount=phraseCount
         self.lexicalSetBoundary=0
         self.lexicalSet=dict()
@@ -1303,7 +1425,7 @@ class Context(object):
         return self.contextID
 
     def initializeAxis(self):
-        self.contextAxis=[0]*self.dimension
+        self.contextAxis[:]=0
     
     def updateAxis(self,ICIndex,ancestors):
         
@@ -1380,28 +1502,29 @@ The class Phrase defines a phrase.
 
 class Phrase(object):
 
-    def __init__(self, phraseText, phraseID, phraseLength, index, phraseCountPerContext, documentPerContext, contexts):
+    __slots__ = ('phraseText', 'phraseID', 'phraseLength', 'index', 'wordVectorSpace', 'lexicalSetBoundary',
+                 'lexicalSetByContext', 'redFlag')
+
+    def __init__(self, phraseText, phraseID, phraseLength, index, wordVectorSpace):
         
         """
         NOTE:
             A phrase is defined by an ID and an index which is its position
-            in the self.phrases dictionary
+            in the self.phrases dictionary.
+            Its counts, documents and cross presence per context are read from the line --index-- of the
+            matrices of --wordVectorSpace-- (see PhraseCountPerContext), which only hold the contexts where
+            the phrase exists.
         """
         self.phraseText = phraseText
         self.phraseID = phraseID
         self.phraseLength = phraseLength
         self.index = index
-        self.phraseCountPerContext = phraseCountPerContext
-        self.phraseCrossPresenceOverContextChildren = dict()
-        self.documentPerContext = documentPerContext
+        self.wordVectorSpace = wordVectorSpace
         self.lexicalSetBoundary = 0
         self.lexicalSetByContext = None
-        self.contexts = contexts
         
         self.redFlag = 0
         self.assignFlag()
-
-        self.updatePresenceOverContextChildren()
     
     def assignFlag(self):
         """
@@ -1495,11 +1618,14 @@ class Phrase(object):
     
     def getPhraseCountPerContext(self):
         
-        return self.phraseCountPerContext
+        space = self.wordVectorSpace
+        return PhraseCountPerContext(space.phraseCountPerContextMatrix, self.index, space.contexts, space.contextIDs)
     
     def getDocumentPerContext(self):
         
-        return self.documentPerContext
+        space = self.wordVectorSpace
+        return DocumentPerContext(space.phraseDocumentMatrix, self.index, space.documentIDs, space.documentRCIndex,
+                                  space.contextSubtree)
     
     def setLexicalSetBoundary(self,boundary): 
      
@@ -1510,7 +1636,7 @@ class Phrase(object):
         return self.lexicalSetBoundary
 
     def initializeLexicalSetByContext(self,contextCount):
-        self.lexicalSetByContext=[dict()]*contextCount
+        self.lexicalSetByContext=LexicalSetByContext(contextCount)
     
     def updateLexicalSetByContext(self,lexicalSet,contextRCIndex):
         
@@ -1520,37 +1646,167 @@ class Phrase(object):
     
         return self.lexicalSetByContext
 
-    def updatePresenceOverContextChildren(self):
-        
-        significanceThreshold=0.5
-
-        for contextID in self.phraseCountPerContext.keys():
-            context=self.contexts[contextID]
-            presenceCount=0
-            if self.phraseCountPerContext[contextID]==0:
-                self.phraseCrossPresenceOverContextChildren.update({contextID:0})
-            else:
-                if context.isIndependent():
-                    self.phraseCrossPresenceOverContextChildren.update({contextID:1})
-                else:
-                    for descendantID in context.getIndependentDescendantsID():
-                        if self.phraseCountPerContext[descendantID]>0:
-                            presenceCount+=1
-                    if presenceCount/len(context.getIndependentDescendantsID())>significanceThreshold:
-                        self.phraseCrossPresenceOverContextChildren.update({contextID:1})
-                    else:
-                        self.phraseCrossPresenceOverContextChildren.update({contextID:0})
-
     def getPhraseCrossPresenceOverContextChildren(self):
 
-        return self.phraseCrossPresenceOverContextChildren      
+        """
+        The cross presence of the phrase is computed for all the phrases by WordVectorSpace.createPhraseDictionary.
+        """
+        space = self.wordVectorSpace
+        return PhraseCrossPresence(space.phraseCrossPresenceMatrix, self.index, space.contexts, space.contextIDs)
 
     def isSignificantlyPresentInContext(self,contextID):
         
-        if self.phraseCrossPresenceOverContextChildren[contextID]==0:
+        if self.getPhraseCrossPresenceOverContextChildren()[contextID]==0:
             return False
         return True
 
     def __str__(self):    
         
         return "I am the Phrase class"
+
+
+"""
+The classes PhraseCountPerContext, PhraseCrossPresence and DocumentPerContext are read-only views on one line of the
+sparse matrices built by WordVectorSpace.createPhraseDictionary. They replace the dictionaries and the list of each
+Phrase object and are created when a getter of the phrase is called.
+"""
+
+
+class PhraseCountPerContext(Mapping):
+
+    __slots__ = ('columns', 'counts', 'contexts', 'contextIDs')
+
+    def __init__(self, matrix, index, contexts, contextIDs):
+
+        """
+        NOTE:
+            - matrix: phrase count per context matrix (phrase line, context column in RCIndex order), in CSR format
+            with sorted indices
+            - index: line of the phrase in the matrix
+            - contexts: dictionary of contexts {contextID:context object}
+            - contextIDs: array of the context ID of each column of the matrix
+            The view behaves as the dictionary {contextID: phrase count} over all the contexts.
+        """
+        self.columns = matrix.indices[matrix.indptr[index]:matrix.indptr[index+1]]
+        self.counts = matrix.data[matrix.indptr[index]:matrix.indptr[index+1]]
+        self.contexts = contexts
+        self.contextIDs = contextIDs
+
+    def __getitem__(self, contextID):
+
+        RCIndex = self.contexts[contextID].getRCIndex()
+        position = np.searchsorted(self.columns, RCIndex)
+        if position < len(self.columns) and self.columns[position] == RCIndex:
+            return int(self.counts[position])
+        return 0
+
+    def __iter__(self):
+
+        return iter(self.contexts)
+
+    def __len__(self):
+
+        return len(self.contexts)
+
+    def nonzeroItems(self):
+
+        """
+        Return the (contextID, phrase count) pairs of the contexts where the count of the phrase is not 0.
+        """
+        nonzero = self.counts != 0
+        return zip(self.contextIDs[self.columns[nonzero]].tolist(), self.counts[nonzero].tolist())
+
+    def __str__(self):
+
+        return "I am the PhraseCountPerContext class"
+
+
+class PhraseCrossPresence(PhraseCountPerContext):
+
+    """
+    The view behaves as the dictionary {contextID: 1 if the phrase is significantly present in the context, 0 otherwise}
+    over all the contexts, on a line of the phrase cross presence matrix.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+
+        return "I am the PhraseCrossPresence class"
+
+
+class DocumentPerContext(Sequence):
+
+    __slots__ = ('documents', 'documentIDs', 'documentRCIndex', 'contextSubtree')
+
+    def __init__(self, matrix, index, documentIDs, documentRCIndex, contextSubtree):
+
+        """
+        NOTE:
+            - matrix: phrase document matrix (phrase line, document column), in CSR format
+            - index: line of the phrase in the matrix
+            - documentIDs: array of the document ID of each column of the matrix
+            - documentRCIndex: array of the RCIndex of the context of each column of the matrix
+            - contextSubtree: sparse array, 1 at line i and column j when the context of RCIndex j is the
+            context of RCIndex i or one of its ancestors, in CSC format
+            The view behaves as the list, indexed by RCIndex, of the sets of the documents of the phrase
+            in each context and its descendants.
+        """
+        self.documents = matrix.indices[matrix.indptr[index]:matrix.indptr[index+1]]
+        self.documentIDs = documentIDs
+        self.documentRCIndex = documentRCIndex
+        self.contextSubtree = contextSubtree
+
+    def __getitem__(self, RCIndex):
+
+        subtree = self.contextSubtree.indices[self.contextSubtree.indptr[RCIndex]:self.contextSubtree.indptr[RCIndex+1]]
+        inContext = np.isin(self.documentRCIndex[self.documents], subtree)
+        return set(self.documentIDs[self.documents[inContext]].tolist())
+
+    def __len__(self):
+
+        return self.contextSubtree.shape[1]
+
+    def __str__(self):
+
+        return "I am the DocumentPerContext class"
+
+
+class LexicalSetByContext(Sequence):
+
+    __slots__ = ('lexicalSets', 'contextCount')
+
+    def __init__(self, contextCount):
+
+        """
+        NOTE:
+            - contextCount: number of contexts
+            The object behaves as the list, indexed by RCIndex, of the lexical sets {related phrase: bonding index}
+            of a context phrase in each context. Only the lexical sets set by Phrase.updateLexicalSetByContext are
+            stored, the lexical set of the other contexts is empty.
+        """
+        self.lexicalSets = dict()
+        self.contextCount = contextCount
+
+    def position(self, RCIndex):
+
+        if RCIndex < 0:
+            RCIndex += self.contextCount
+        if not 0 <= RCIndex < self.contextCount:
+            raise IndexError("RCIndex out of range")
+        return RCIndex
+
+    def __getitem__(self, RCIndex):
+
+        return self.lexicalSets.get(self.position(RCIndex), dict())
+
+    def __setitem__(self, RCIndex, lexicalSet):
+
+        self.lexicalSets[self.position(RCIndex)] = lexicalSet
+
+    def __len__(self):
+
+        return self.contextCount
+
+    def __str__(self):
+
+        return "I am the LexicalSetByContext class"
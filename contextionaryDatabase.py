@@ -25,16 +25,238 @@ from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 from pathlib import Path
 import platform
 import config
+from databaseTools import copy_rows, open_connection, close_connection, close_pool
+from phraseResolver import PhraseResolver
+
+
+def document_phrase_rows(doc_id, cont_id, phraseCount):
+    """
+    Flatten the phrase count per length of a document ({length: {phrase: count}}, as returned by
+    TextProcessor.getPhraseCount) into (document_id, context_id, phrase_text, phrase_length, count)
+    rows, keeping the first length seen for a phrase text.
+    """
+    rows = dict()
+    for length in sorted(phraseCount.keys()):
+        for phrase, count in phraseCount[length].items():
+            if phrase not in rows:
+                rows[phrase] = (doc_id, cont_id, phrase, length, count)
+    return list(rows.values())
+
+
+def log_changes(cur, query, parameters=None):
+    """
+    Record the (phrase ID, context ID) rows returned by the SELECT --query-- into the analytics change log:
+    the count of these phrases in these contexts changed since WordVectorSpace last ran, which lets the next
+    run refresh the phrases and the contexts that changed only (see incrementalRefresh.py).
+    """
+    cur.execute('INSERT INTO "analytics_change_log" ("phrase_id", "context_id") ' + query, parameters)
+
+
+def stage_phrase_counts(cur, phraseRows, phraseResolver):
+    """
+    Update the phrase, phrase origin and phrase meaning tables for --phraseRows-- as returned by
+    document_phrase_rows, possibly for several documents at once:
+        - the phrase IDs are resolved with --phraseResolver-- which inserts the unknown phrases
+        - the (document ID, context ID, phrase ID, count) rows are loaded with COPY into a temporary table
+        - the phrase origin rows are inserted and the phrase count per context of the
+        inserted rows is added to the phrase meaning table
+        - the phrase-context pairs are recorded into the analytics change log
+    The caller owns the transaction and has to pass the returned {phrase text: phrase ID} of the
+    inserted phrases to phraseResolver.remember once the transaction is committed.
+    """
+    phrases = dict()
+    for row in phraseRows:
+        phrases.setdefault(row[2], row[3])
+    phraseIDs, inserted = phraseResolver.resolve(cur, phrases)
+
+    cur.execute('''CREATE TEMP TABLE "phrase_stage" (
+                   "document_id" bigint,
+                   "context_id" bigint,
+                   "phrase_id" bigint,
+                   "phrase_count" integer) ON COMMIT DROP''')
+    copy_rows(cur, '"phrase_stage"', ["document_id", "context_id", "phrase_id", "phrase_count"],
+              ((doc_id, cont_id, phraseIDs[phrase], count) for doc_id, cont_id, phrase, length, count in phraseRows))
+
+    cur.execute('''
+                WITH origin AS (
+                    INSERT INTO "phrase_origin"
+                    ("phrase_id", "document_id", "phrase_count_per_document")
+                    SELECT "phrase_id", "document_id", "phrase_count" FROM "phrase_stage"
+                    ON CONFLICT ("phrase_id", "document_id") DO NOTHING
+                    RETURNING "phrase_id", "document_id", "phrase_count_per_document")
+                INSERT INTO "phrase_meaning"
+                ("phrase_id", "context_id", "phrase_count_per_context")
+                SELECT o."phrase_id", s."context_id", sum(o."phrase_count_per_document")
+                FROM origin o JOIN "phrase_stage" s
+                ON s."phrase_id" = o."phrase_id" AND s."document_id" = o."document_id"
+                GROUP BY o."phrase_id", s."context_id"
+                ON CONFLICT ("phrase_id", "context_id") DO UPDATE SET
+                "phrase_count_per_context" = "phrase_meaning"."phrase_count_per_context"
+                + EXCLUDED."phrase_count_per_context"
+                ''')
+    log_changes(cur, '''SELECT DISTINCT "phrase_id", "context_id" FROM "phrase_stage"''')
+
+    return inserted
+
+
+def subtract_phrase_counts(cur):
+    """
+    Subtract the (phrase ID, context ID, count) rows of the temporary table "phrase_unstage" from the
+    phrase meaning table and delete the phrase meaning rows whose count drops to 0.
+    Only the phrase-context pairs listed in "phrase_unstage" are touched, they are recorded into the
+    analytics change log.
+    """
+    log_changes(cur, '''SELECT DISTINCT "phrase_id", "context_id" FROM "phrase_unstage"''')
+    cur.execute('''
+                UPDATE "phrase_meaning" pm
+                SET "phrase_count_per_context" = pm."phrase_count_per_context" - u."phrase_count"
+                FROM "phrase_unstage" u
+                WHERE pm."phrase_id" = u."phrase_id" AND pm."context_id" = u."context_id"
+                ''')
+    cur.execute('''
+                DELETE FROM "phrase_meaning" pm
+                USING "phrase_unstage" u
+                WHERE pm."phrase_id" = u."phrase_id" AND pm."context_id" = u."context_id"
+                AND (pm."phrase_count_per_context" <= 0 OR pm."phrase_count_per_context" IS NULL)
+                ''')
+
+
+def phrase_references(cur):
+    """
+    Return the (table, column) pairs of the foreign keys that reference the phrase table: the phrase
+    origin and phrase meaning tables and the analytics tables written by WordVectorSpace.
+    """
+    cur.execute('''
+                SELECT c."conrelid"::regclass::text, a."attname"
+                FROM pg_constraint c
+                JOIN pg_attribute a ON a."attrelid" = c."conrelid" AND a."attnum" = ANY(c."conkey")
+                WHERE c."contype" = 'f' AND c."confrelid" = 'phrase'::regclass
+                ''')
+    return cur.fetchall()
+
+
+def unstage_documents(cur, docIDs):
+    """
+    Remove the documents --docIDs-- and their phrases with a few set-based statements:
+        - the phrase origin rows of the documents are deleted and summed per phrase and context
+        into a temporary table
+        - these sums are subtracted from the phrase meaning table
+        - the phrases of the documents that are not used by any other document are deleted, unless
+        an analytics table still references them: these phrases are kept and the next run of
+        WordVectorSpace, a rebuild or an incremental refresh, drops their analytics rows
+        - the documents are deleted
+    The caller owns the transaction. Return the texts of the deleted phrases, which have to be
+    passed to PhraseResolver.forget once the transaction is committed.
+    """
+    cur.execute('''CREATE TEMP TABLE "phrase_unstage" (
+                   "phrase_id" bigint,
+                   "context_id" bigint,
+                   "phrase_count" bigint) ON COMMIT DROP''')
+    cur.execute('''
+                WITH removed AS (
+                    DELETE FROM "phrase_origin" po
+                    USING document d
+                    WHERE po."document_id" = d."document_id" AND d."document_id" = ANY(%s)
+                    RETURNING po."phrase_id", d."context_id", po."phrase_count_per_document")
+                INSERT INTO "phrase_unstage" ("phrase_id", "context_id", "phrase_count")
+                SELECT "phrase_id", "context_id", sum("phrase_count_per_document")
+                FROM removed
+                GROUP BY "phrase_id", "context_id"
+                ''', (list(docIDs),))
+
+    subtract_phrase_counts(cur)
+
+    cur.execute('''
+                DELETE FROM phrase p
+                WHERE p."phrase_id" IN (SELECT "phrase_id" FROM "phrase_unstage")
+                %s
+                RETURNING p."phrase_text"
+                ''' % '\n'.join('AND NOT EXISTS (SELECT 1 FROM %s r WHERE r."%s" = p."phrase_id")' % reference
+                                for reference in phrase_references(cur)))
+    deleted = [row[0] for row in cur.fetchall()]
+
+    cur.execute('''DELETE FROM document WHERE "document_id" = ANY(%s)''', (list(docIDs),))
+    cur.execute('''DROP TABLE "phrase_unstage"''')
+
+    return deleted
+
+
+def move_documents(cur, docIDs, cont_id):
+    """
+    Move the documents --docIDs-- to the context --cont_id-- with a few set-based statements:
+    the phrase counts of the documents are subtracted from the phrase meaning rows of their
+    current contexts and added to the phrase meaning rows of the new context.
+    The caller owns the transaction. Return the number of documents moved.
+    """
+    cur.execute('''CREATE TEMP TABLE "phrase_unstage" (
+                   "phrase_id" bigint,
+                   "context_id" bigint,
+                   "phrase_count" bigint) ON COMMIT DROP''')
+    cur.execute('''
+                INSERT INTO "phrase_unstage" ("phrase_id", "context_id", "phrase_count")
+                SELECT po."phrase_id", d."context_id", sum(po."phrase_count_per_document")
+                FROM "phrase_origin" po JOIN document d ON d."document_id" = po."document_id"
+                WHERE d."document_id" = ANY(%s) AND d."context_id" <> %s
+                GROUP BY po."phrase_id", d."context_id"
+                ''', (list(docIDs), cont_id))
+
+    subtract_phrase_counts(cur)
+
+    cur.execute('''
+                INSERT INTO "phrase_meaning" ("phrase_id", "context_id", "phrase_count_per_context")
+                SELECT "phrase_id", %s, sum("phrase_count")
+                FROM "phrase_unstage"
+                GROUP BY "phrase_id"
+                ON CONFLICT ("phrase_id", "context_id") DO UPDATE SET
+                "phrase_count_per_context" = "phrase_meaning"."phrase_count_per_context"
+                + EXCLUDED."phrase_count_per_context"
+                ''', (cont_id,))
+    log_changes(cur, '''SELECT DISTINCT "phrase_id", %s FROM "phrase_unstage"''', (cont_id,))
+
+    cur.execute('''UPDATE document SET "context_id" = %s WHERE "document_id" = ANY(%s) AND "context_id" <> %s''',
+                (cont_id, list(docIDs), cont_id))
+    moved = cur.rowcount
+    cur.execute('''DROP TABLE "phrase_unstage"''')
+
+    return moved
+
+
+
+def context_tree_rows(data_list):
+    """
+    Return the rows of the context table for --data_list--, the rows of 'Context list.csv'
+    (context ID, context name, immediate parent ID), level by level starting from the root contexts.
+    Each row is (context ID, immediate parent ID, context name, children IDs, picture, level),
+    the children IDs being a comma separated list of the child context IDs in the order of the file,
+    or '0' for a leaf context. Contexts that cannot be reached from a root context are left out.
+    The contexts of a level are listed in the order of the file.
+    """
+    children = dict()
+    position = dict()
+    for index, data in enumerate(data_list):
+        children.setdefault(int(data[2]), []).append(data)
+        position[data[0]] = index
+
+    rows = []
+    level = 1
+    frontier = children.get(-1, [])
+    while frontier:
+        nextFrontier = []
+        for data in frontier:
+            context_id = int(data[0])
+            context_children = children.get(context_id, [])
+            context_children_id = ','.join(child[0] for child in context_children) or '0'
+            context_picture = '{}-{}.jpg'.format(str(context_id), data[1])
+            rows.append((context_id, int(data[2]), data[1], context_children_id, context_picture, level))
+            nextFrontier.extend(context_children)
+        frontier = sorted(nextFrontier, key=lambda data: position[data[0]])
+        level += 1
 
-
-usr = config.DATABASE['user']
-password = config.DATABASE['password']
-dbname = config.DATABASE['dbname']
-host = config.DATABASE['host']
+    return rows
 
 
 class Document(object):
-    def __init__(self, doc_id, documentlocation, phraseMaxLength, contextname):
+    def __init__(self, doc_id, documentlocation, phraseMaxLength, contextname, phraseResolver=None):
 
         import os.path
         from textProcessing import TextProcessor
@@ -57,6 +279,12 @@ class Document(object):
         self.contextname = contextname
         self.phraseTable = []
 
+        """
+        --phraseResolver-- translates phrase texts into phrase IDs in the bulk ingestion.
+        It is usually shared by all the documents of the Database object.
+        """
+        self.phraseResolver = phraseResolver or PhraseResolver(warm=False)
+
         """
         Once we have a text, we want to split it in clauses. A sentence is usually divided
         in many clauses often separated by commas.
@@ -90,8 +318,7 @@ class Document(object):
 
     def updatePhraseTables(self):
 
-        con = connect("host=%s dbname=%s user=%s password=%s" % (host, dbname, usr, password))
-        con.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        con = open_connection()
         cur = con.cursor()
         try:
             for length in range(1, self.phraseMaxLength + 1):
@@ -120,13 +347,39 @@ class Document(object):
 
         finally:
             cur.close()
-            con.close()
+            close_connection(con)
             print('table phrase updated')
 
+    def bulkUpdatePhraseTables(self):
+
+        """
+        Bulk version of updatePhraseTables.
+        Instead of a few statements per phrase, the phrases of the document are staged
+        with COPY into a temporary table and the phrase, phrase origin and phrase meaning
+        tables are updated with set-based statements, all in one transaction.
+        """
+        for length in range(1, self.phraseMaxLength + 1):
+            for phrase, count in self.textProcessor.getPhraseCount()[length].items():
+                self.phraseTable.append([phrase, length, count])
+
+        con = open_connection(autocommit=False)
+        cur = con.cursor()
+        try:
+            with con:
+                cur.execute('''SELECT "context_id" FROM document WHERE "document_id" = %s;''', self.doc_id)
+                cont_id = cur.fetchone()
+
+                phraseRows = document_phrase_rows(self.doc_id[0], cont_id[0], self.textProcessor.getPhraseCount())
+                inserted = stage_phrase_counts(cur, phraseRows, self.phraseResolver)
+            self.phraseResolver.remember(inserted)
+            print('tables phrase, phrase origin and phrase meaning updated for %s phrases' % len(phraseRows))
+        finally:
+            cur.close()
+            close_connection(con)
+
     def updatePhraseOrigin(self, phrase_id, phrase, length):
 
-        con = connect("host=%s dbname=%s user=%s password=%s" % (host, dbname, usr, password))
-        con.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        con = open_connection()
         cur = con.cursor()
 
         cur.execute('''SELECT "phrase_id" FROM "phrase_origin"
@@ -147,13 +400,12 @@ class Document(object):
                         )
 
         cur.close()
-        con.close()
+        close_connection(con)
         print('table phrase origin updated')
 
     def updatePhraseMeaning(self, phr_id):
 
-        con = connect("host=%s dbname=%s user=%s password=%s" % (host, dbname, usr, password))
-        con.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        con = open_connection()
         cur = con.cursor()
 
         cur.execute("""SELECT "context_id" FROM document WHERE "document_id" = %s;  """, self.doc_id)
@@ -214,9 +466,10 @@ class Document(object):
                         AND "context_id" = %s
                 ''', (cont_new_count, phr_id, cont_id[0])
                     )
+        log_changes(cur, '''SELECT %s, %s''', (phr_id, cont_id[0]))
 
         cur.close()
-        con.close()
+        close_connection(con)
         print('table phrase meaning updated')
 
     def getPhraseTable(self):
@@ -268,12 +521,21 @@ class Database(object):
         self.libraryFolderPath = self.createLibraryContextPath()
         self.documents = []
 
+        """
+        The phrase resolver is shared by all the documents added through this object
+        """
+        self.phraseResolver = PhraseResolver()
+
         if createDatabase == 1:
             if self.database_exist():
                 self.drop()
             self.create()
             self.create_tables()
             self.add_contexts()
+        else:
+            self.add_change_log()
+            if not self.phrase_text_index_exist():
+                self.add_phrase_text_index()
 
     def database_exist(self):
         con = connect(user=self.usr, host=self.host, password=self.password)
@@ -308,8 +570,7 @@ class Database(object):
 
     def create_tables(self):
 
-        con = connect(dbname=self.dbname, user=self.usr, host=self.host, password=self.password)
-        con.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        con = open_connection()
         cur = con.cursor()
 
         try:
@@ -320,7 +581,9 @@ class Database(object):
                         "context_name" varchar(255), 
                         "context_children_id" text, 
                         "context_picture" varchar(255),
-                        "context_level" integer)''')
+                        "context_level" integer,
+                        "icindex" integer,
+                        "rcindex" integer)''')
 
             cur.execute('''CREATE TABLE document (
                         "document_id" serial PRIMARY KEY, 
@@ -331,9 +594,10 @@ class Database(object):
 
             cur.execute('''CREATE TABLE phrase (
                         "phrase_id" serial PRIMARY KEY, 
-                        "phrase_text" varchar(255), 
+                        "phrase_text" varchar(255) UNIQUE, 
                         "phrase_length" smallint, 
-                        "red_flag" smallint)''')
+                        "red_flag" smallint,
+                        "phrase_index" integer)''')
 
             cur.execute('''CREATE TABLE "phrase_origin" (
                         "phrase_id" bigint references phrase("phrase_id"),
@@ -462,21 +726,121 @@ class Database(object):
                         PRIMARY KEY ("input_text_id", "context_id", "keyword_id")
                         )''')
 
+            cur.execute('''CREATE TABLE "analytics_change_log" (
+                        "change_id" bigserial PRIMARY KEY,
+                        "phrase_id" bigint,
+                        "context_id" bigint
+                        )''')
+
         finally:
             cur.close()
-            con.close()
+            close_connection(con)
             print('tables created')
 
-    def add_contexts(self):
+    def add_change_log(self):
 
-        con = connect("host=%s dbname=%s user=%s password=%s" % (host, dbname, usr, password))
-        con.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        """
+        Add the analytics change log, the (phrase ID, context ID) pairs whose count changed since
+        WordVectorSpace last ran (see log_changes), to a database created before the log existed.
+        """
+        con = open_connection()
         cur = con.cursor()
         try:
+            cur.execute('''CREATE TABLE IF NOT EXISTS "analytics_change_log" (
+                        "change_id" bigserial PRIMARY KEY,
+                        "phrase_id" bigint,
+                        "context_id" bigint
+                        )''')
+        finally:
+            cur.close()
+            close_connection(con)
 
-            data_list = []
-            completed_list = []
+    def phrase_text_index_exist(self):
 
+        """
+        Check for the unique index on "phrase_text" (named "phrase_phrase_text_key" by the UNIQUE
+        constraint of create_tables and by add_phrase_text_index).
+        """
+        con = open_connection()
+        cur = con.cursor()
+        try:
+            cur.execute("SELECT to_regclass('phrase_phrase_text_key') IS NOT NULL;")
+            result = cur.fetchone()[0]
+        finally:
+            cur.close()
+            close_connection(con)
+        return result
+
+    def add_phrase_text_index(self):
+
+        """
+        Add the unique index on "phrase_text" used by the phrase resolver to a database created
+        before the index existed.
+        Duplicate phrases (same text, several phrase IDs) are first merged into the phrase with the lowest
+        ID: their phrase origin and phrase meaning counts are added to that phrase and the rows of the
+        analytics tables that refer to them are removed (these tables are rebuilt by WordVectorSpace).
+        """
+        self.add_change_log()
+        con = open_connection(autocommit=False)
+        cur = con.cursor()
+        try:
+            with con:
+                cur.execute('''CREATE TEMP TABLE "phrase_duplicate" ON COMMIT DROP AS
+                               SELECT "phrase_id", "keep_id" FROM (
+                                   SELECT "phrase_id", min("phrase_id") OVER (PARTITION BY "phrase_text") AS "keep_id"
+                                   FROM phrase) p
+                               WHERE "phrase_id" <> "keep_id"''')
+                log_changes(cur, '''SELECT DISTINCT d."keep_id", m."context_id"
+                                   FROM "phrase_meaning" m JOIN "phrase_duplicate" d USING ("phrase_id")''')
+
+                cur.execute('''INSERT INTO "phrase_origin" ("phrase_id", "document_id", "phrase_count_per_document")
+                               SELECT d."keep_id", o."document_id", sum(o."phrase_count_per_document")
+                               FROM "phrase_origin" o JOIN "phrase_duplicate" d USING ("phrase_id")
+                               GROUP BY d."keep_id", o."document_id"
+                               ON CONFLICT ("phrase_id", "document_id") DO UPDATE SET
+                               "phrase_count_per_document" = "phrase_origin"."phrase_count_per_document"
+                               + EXCLUDED."phrase_count_per_document"''')
+                cur.execute('''INSERT INTO "phrase_meaning" ("phrase_id", "context_id", "phrase_count_per_context")
+                               SELECT d."keep_id", m."context_id", sum(m."phrase_count_per_context")
+                               FROM "phrase_meaning" m JOIN "phrase_duplicate" d USING ("phrase_id")
+                               GROUP BY d."keep_id", m."context_id"
+                               ON CONFLICT ("phrase_id", "context_id") DO UPDATE SET
+                               "phrase_count_per_context" = "phrase_meaning"."phrase_count_per_context"
+                               + EXCLUDED."phrase_count_per_context"''')
+
+                for table, columns in [("phrase_origin", ["phrase_id"]),
+                                       ("phrase_meaning", ["phrase_id"]),
+                                       ("phrase_vector_space", ["phrase_id"]),
+                                       ("phrase_distance_to_context", ["phrase_id"]),
+                                       ("phrase_weight_by_context", ["phrase_id"]),
+                                       ("phrase_frequency_and_distance", ["phrase_id"]),
+                                       ("context_phrase", ["phrase_id"]),
+                                       ("related_phrase", ["context_phrase_id", "related_phrase_id"]),
+                                       ("shared_word", ["long_phrase_id", "sibling_id"]),
+                                       ("phrase_spelling_similarity", ["phrase_id", "similar_spelling_phrase_id"])]:
+                    for column in columns:
+                        cur.execute('''DELETE FROM "%s" WHERE "%s" IN (SELECT "phrase_id" FROM "phrase_duplicate")'''
+                                    % (table, column))
+                cur.execute('''DELETE FROM phrase WHERE "phrase_id" IN (SELECT "phrase_id" FROM "phrase_duplicate")''')
+
+                cur.execute('''CREATE UNIQUE INDEX IF NOT EXISTS "phrase_phrase_text_key" ON phrase ("phrase_text")''')
+        finally:
+            cur.close()
+            close_connection(con)
+            print('unique index on phrase text created')
+
+    def add_contexts(self):
+
+        """
+        Load the context tree of 'Context list.csv' (context ID, context name, immediate parent ID) into
+        the context table.
+        The tree is built in one pass with a parent -> children index and walked level by level from the
+        root contexts (immediate parent ID -1), so it can be of any depth. The contexts are written with COPY.
+        """
+        con = open_connection(autocommit=False)
+        cur = con.cursor()
+        try:
+            data_list = []
             file = 'Context list.csv'
             with open(file, encoding="latin-1") as csvfile:
                 reader = csv.reader(csvfile)
@@ -484,139 +848,23 @@ class Database(object):
                 for row in reader:
                     data_list.append(row)
 
-            context_children_id_list1_all = []
-            context_children_id_list2_all = []
-            context_children_id_list3_all = []
-            context_children_id_list4_all = []
-            context_children_id_list5_all = []
-            context_children_id_list6_all = []
-            context_children_id_list7_all = []
-            context_children_id_list8_all = []
-            context_children_id_list9_all = []
-            context_children_id_list10_all = []
-            context_children_id_list11_all = []
-            context_children_id_list12_all = []
-            context_children_id_list13_all = []
-            context_children_id_list14_all = []
-            context_children_id_list15_all = []
-            context_children_id_list16_all = []
-
-            self.get_parent_id(data_list, context_children_id_list1_all, completed_list)
-
-            self.get_sub_child_id(data_list, context_children_id_list1_all, context_children_id_list2_all, completed_list, 2)
-
-            self.get_sub_child_id(data_list, context_children_id_list2_all, context_children_id_list3_all, completed_list, 3)
-
-            self.get_sub_child_id(data_list, context_children_id_list3_all, context_children_id_list4_all, completed_list, 4)
-
-            self.get_sub_child_id(data_list, context_children_id_list4_all, context_children_id_list5_all,
-                                  completed_list, 5)
-
-            self.get_sub_child_id(data_list, context_children_id_list5_all, context_children_id_list6_all,
-                                  completed_list, 6)
-
-            self.get_sub_child_id(data_list, context_children_id_list6_all, context_children_id_list7_all,
-                                  completed_list, 7)
-
-            self.get_sub_child_id(data_list, context_children_id_list7_all, context_children_id_list8_all,
-                                  completed_list, 8)
-
-            self.get_sub_child_id(data_list, context_children_id_list8_all, context_children_id_list9_all,
-                                  completed_list, 9)
-
-            self.get_sub_child_id(data_list, context_children_id_list9_all, context_children_id_list10_all,
-                                  completed_list, 10)
-
-            self.get_sub_child_id(data_list, context_children_id_list10_all, context_children_id_list11_all,
-                                  completed_list, 11)
-
-            self.get_sub_child_id(data_list, context_children_id_list11_all, context_children_id_list12_all,
-                                  completed_list, 12)
-
-            self.get_sub_child_id(data_list, context_children_id_list12_all, context_children_id_list13_all,
-                                  completed_list, 13)
-
-            self.get_sub_child_id(data_list, context_children_id_list13_all, context_children_id_list14_all,
-                                  completed_list, 14)
-
-            self.get_sub_child_id(data_list, context_children_id_list14_all, context_children_id_list15_all,
-                                  completed_list, 15)
-
-            self.get_sub_child_id(data_list, context_children_id_list15_all, context_children_id_list16_all,
-                                  completed_list, 16)
-
-            self.get_last_child_id(data_list, context_children_id_list16_all, completed_list, 17)
-
-            for c_list in completed_list:
-                context_id = c_list[0]
-                context_immediate_parent_id = c_list[1]
-                context_name = c_list[2]
-                context_children_id = c_list[3]
-                if not context_children_id:
-                    context_children_id = 0
-                context_picture = c_list[4]
-                context_level = c_list[5]
-                cur.execute('''insert into context 
-                                ("context_id", "context_immediate_parent_id", "context_name", "context_children_id", 
-                                "context_picture","context_level") 
-                                VALUES (%s, %s, %s, %s, %s, %s)''', (
-                    context_id,
-                    context_immediate_parent_id,
-                    context_name, context_children_id, context_picture, context_level))
+            completed_list = context_tree_rows(data_list)
+
+            with con:
+                copy_rows(cur, 'context', ["context_id", "context_immediate_parent_id", "context_name",
+                                           "context_children_id", "context_picture", "context_level"], completed_list)
+                cur.execute('''SELECT setval(pg_get_serial_sequence('context', 'context_id'),
+                               (SELECT max("context_id") FROM context))''')
+            print('table context updated with %s contexts' % len(completed_list))
         finally:
             cur.close()
-            con.close()
-
-    def get_parent_id(self, data_list, context_children_id_list, completed_list):
-        for data in data_list:
-            context_id = int(data[0])
-            context_immediate_parent_id = int(data[2])
-            context_name = data[1]
-            context_picture = '{}-{}.jpg'.format(str(context_id), context_name)
-
-            if context_immediate_parent_id == -1:
-                context_level = 1
-                for sub_data in data_list:
-                    if context_id == int(sub_data[2]):
-                        context_children_id_list.append(sub_data[0])
-                context_children_id = ','.join(context_children_id_list)
-                completed_list.append([context_id, context_immediate_parent_id, context_name,
-                                       context_children_id, context_picture, context_level])
-
-    def get_sub_child_id(self, data_list, context_children_id_list, context_child_id_total, completed_list, level):
-        for data in data_list:
-            for context_child_id in context_children_id_list:
-                context_id = int(data[0])
-                context_immediate_parent_id = int(data[2])
-                context_name = data[1]
-                context_picture = '{}-{}.jpg'.format(str(context_id), context_name)
-                context_level = level
-
-                context_children_id_list2 = []
-
-                if context_id == int(context_child_id):
-                    for sub_data in data_list:
-                        if context_id == int(sub_data[2]):
-                            context_children_id_list2.append(sub_data[0])
-                    context_children_id = ','.join(context_children_id_list2)
-                    completed_list.append([context_id, context_immediate_parent_id, context_name,
-                                           context_children_id, context_picture, context_level])
-                context_child_id_total.extend(context_children_id_list2)
-
-    def get_last_child_id(self, data_list, context_children_id_list, completed_list, level):
-        for data in data_list:
-            for context_child_id in context_children_id_list:
-                context_id = int(data[0])
-                context_immediate_parent_id = int(data[2])
-                context_name = data[1]
-                context_picture = '{}-{}.jpg'.format(str(context_id), context_name)
-                context_level = level
-                context_children_id = '0'
-                if context_id == int(context_child_id):
-                    completed_list.append([context_id, context_immediate_parent_id, context_name,
-                                           context_children_id, context_picture, context_level])
+            close_connection(con)
 
-    def add_document(self, file_path):
+    def document_path(self, file_path):
+        """
+        Split the path of a document file into its folder, its file name, the name of its
+        context folder and the document path recorded in the document table (relative to "Context tree").
+        """
         name = Path(file_path).parts[-1]
         if 'Linux' in platform.platform():
             temp_name = '/' + name
@@ -625,15 +873,19 @@ class Database(object):
 
         root = file_path.split(temp_name)[0]
         rootdirname = Path(root).parts[-1]
-        con = connect("host=%s dbname=%s user=%s password=%s" % (host, dbname, usr, password))
-        con.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
-        cur = con.cursor()
 
         if 'Linux' in platform.platform():
             doc_path = root.split('Context tree')[1][1:] + '/' + name
         else:
             doc_path = root.split('Context tree')[1][1:] + '\\' + name
 
+        return root, name, rootdirname, doc_path
+
+    def add_document(self, file_path):
+        root, name, rootdirname, doc_path = self.document_path(file_path)
+        con = open_connection()
+        cur = con.cursor()
+
         cur.execute(""" SELECT count(*) FROM document WHERE "document_path" = %s; """,
                     ([doc_path]), )
         docpathcount = cur.fetchone()
@@ -653,7 +905,8 @@ class Database(object):
                 doc_id = cur.fetchone()
 
                 filelocation = os.path.join(root, name)
-                document = Document(doc_id, filelocation, self.phraseMaximumLength, rootdirname)
+                document = Document(doc_id, filelocation, self.phraseMaximumLength, rootdirname,
+                                    self.phraseResolver)
                 self.documents.append(document)
 
                 b = document.getContext()
@@ -672,11 +925,84 @@ class Database(object):
                     ''', (name, cont_id[0], document.getText(), doc_path, doc_id))
 
                 # update entries in phrase table, phrase origin table and phrase meaning table
-                document.updatePhraseTables()
+                if config.PARSE['bulkIngestion']:
+                    document.bulkUpdatePhraseTables()
+                else:
+                    document.updatePhraseTables()
                 print('table document updated')
         finally:
             cur.close()
-            con.close()
+            close_connection(con)
+
+    def add_documents(self, payloads):
+        """
+        Add a batch of already parsed documents in one transaction.
+        Each payload is a dictionary with the document file path ('path'), its text ('text') and
+        its phrase count per length ('phraseCount') as built by ingestionPipeline.parse_document.
+        Documents already recorded in the document table are skipped.
+        Return {document path: document ID} for the documents added.
+        """
+        documents = dict()
+        documentIDs = dict()
+        for payload in payloads:
+            root, name, rootdirname, doc_path = self.document_path(payload['path'])
+            if name.endswith(".txt"):
+                documents[doc_path] = (name, rootdirname, payload)
+
+        con = open_connection(autocommit=False)
+        cur = con.cursor()
+        try:
+            with con:
+                cur.execute(""" SELECT "document_path" FROM document WHERE "document_path" = ANY(%s); """,
+                            (list(documents.keys()),))
+                for existing in cur.fetchall():
+                    documents.pop(existing[0], None)
+
+                cur.execute(""" SELECT "context_name", "context_id" FROM context WHERE "context_name" = ANY(%s); """,
+                            (list(set(document[1] for document in documents.values())),))
+                contextIDs = dict(cur.fetchall())
+
+                phraseRows = []
+                for doc_path, (name, rootdirname, payload) in documents.items():
+                    if rootdirname not in contextIDs:
+                        print('No context named %s for document %s' % (rootdirname, doc_path))
+                        continue
+
+                    cur.execute(
+                        '''
+                        INSERT INTO document
+                        ("document_title", "context_id", "document_content", "document_path")
+                        VALUES (%s, %s, %s, %s) RETURNING "document_id"
+                        ''', (name, contextIDs[rootdirname], payload['text'], doc_path))
+                    doc_id = cur.fetchone()[0]
+                    documentIDs[doc_path] = doc_id
+
+                    phraseRows.extend(document_phrase_rows(doc_id, contextIDs[rootdirname], payload['phraseCount']))
+
+                # update entries in phrase table, phrase origin table and phrase meaning table
+                inserted = stage_phrase_counts(cur, phraseRows, self.phraseResolver)
+            self.phraseResolver.remember(inserted)
+            return documentIDs
+        finally:
+            cur.close()
+            close_connection(con)
+            print('table document updated with a batch of %s documents' % len(documents))
+
+    def document_manifest(self):
+        """
+        Return the ingestion manifest {document path: entry} of the documents recorded in the
+        document table, with one query. The size and modification time of the files are unknown,
+        the hash is the MD5 digest of "document_content" (see ingestionManifest).
+        """
+        con = open_connection()
+        cur = con.cursor()
+        try:
+            cur.execute('''SELECT "document_path", "document_id", md5("document_content") FROM document;''')
+            return {doc_path: {'size': None, 'mtime': None, 'hash': digest, 'document_id': doc_id}
+                    for doc_path, doc_id, digest in cur.fetchall()}
+        finally:
+            cur.close()
+            close_connection(con)
 
     def delete_entry(self):
 
@@ -686,8 +1012,7 @@ class Database(object):
         print(s1)
         table = input()
 
-        con = connect("host=%s dbname=%s user=%s password=%s" % (host, dbname, usr, password))
-        con.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        con = open_connection()
         cur = con.cursor()
 
         try:
@@ -702,160 +1027,92 @@ class Database(object):
 
         finally:
             cur.close()
-            con.close()
+            close_connection(con)
             print('The entry was deleted')
 
     def delete_context(self, cont_for_del):
 
-        con = connect("host=%s dbname=%s user=%s password=%s" % (host, dbname, usr, password))
-        con.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        """
+        Delete the context --cont_for_del-- and all its documents in one transaction.
+        """
+        con = open_connection(autocommit=False)
         cur = con.cursor()
-
-        cur.execute('''SELECT "document_id" FROM document WHERE "context_id" = %s;''', cont_for_del)
-        doc_for_del = cur.fetchall()
-
-        for dfd in doc_for_del:
-            self.delete_document(dfd)
-
-        cur.execute('DELETE FROM context WHERE "context_id" = %s;', cont_for_del)
-
-        cur.close()
-        con.close()
+        try:
+            with con:
+                cur.execute('''SELECT "document_id" FROM document WHERE "context_id" = %s;''', (int(cont_for_del),))
+                deleted = unstage_documents(cur, [row[0] for row in cur.fetchall()])
+                cur.execute('DELETE FROM context WHERE "context_id" = %s;', (int(cont_for_del),))
+            self.phraseResolver.forget(deleted)
+        finally:
+            cur.close()
+            close_connection(con)
 
     def delete_document(self, doc_id_for_del):
 
-        con = connect("host=%s dbname=%s user=%s password=%s" % (host, dbname, usr, password))
-        con.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
-        cur = con.cursor()
-
         """
-        Get the context ID for the document to delete
+        Delete the document --doc_id_for_del--, see delete_documents.
         """
-        cur.execute("""SELECT "context_id" FROM document WHERE "document_id" = %s;  """, doc_id_for_del)
-        cont_id = cur.fetchone()
-
-        try:
+        if isinstance(doc_id_for_del, (tuple, list)):
+            doc_id_for_del = doc_id_for_del[0]
 
-            """
-            Get the list of phrases of the document to delete.
-            All these phrases-document have to be deleted from the phrase origin table
-            And the phrases-context count per context have to be updated in the phrase meaning table
-            """
-            cur.execute('''SELECT "Phrase ID" FROM "phrase origin" WHERE "document_id" = %s;''', doc_id_for_del, )
-            phrases_for_del = cur.fetchall()
+        self.delete_documents([int(doc_id_for_del)])
 
-            for phr in phrases_for_del:
+    def delete_documents(self, doc_ids_for_del):
 
-                """
-                Record the phrase count per document to delete
-                """
-                cur.execute(
-                    '''SELECT "phrase_count_per_document"
-                       FROM "phrase_origin"
-                       WHERE "phrase_id" = %s 
-                       AND "document_id" = %s
-                    ''', (phr, doc_id_for_del))
-                doc_count = cur.fetchone()
-
-                """
-                Recall the phrase count per context. This count needs to be
-                reduced by the phrase count per document.
-                """
-                cur.execute(
-                    '''SELECT "phrase_count_per_context" 
-                       FROM "phrase_meaning" 
-                       WHERE "phrase_id" = %s 
-                       AND "context_id" = %s
-                    ''', (phr, cont_id[0]))
-                cont_old_count = cur.fetchone()
-
-                """
-                Calculate the new phrase count per context and update the count into
-                the phrase meaning table.
-                """
-                cont_new_count = cont_old_count[0] - doc_count[0]
-
-                cur.execute('''
-                        UPDATE "phrase_meaning"
-                        SET "phrase_count_per_context" = %s
-                        WHERE "phrase_id" = %s 
-                        AND "context_id" = %s
-                        ''', (cont_new_count, phr, cont_id))
-
-                """
-                Delete the phrase-document to delete entry from the phrase origin table
-                """
-                self.delete_phrase_origin(int(phr[0]), doc_id_for_del)
-
-                """
-                Delete the phrase-context entry from the phrase meaning table
-                only if the phrase count per context is equal to 0.
-                """
-                cur.execute(
-                    '''SELECT "phrase_id" 
-                       FROM "phrase_meaning" 
-                       WHERE "context_id"=%s 
-                       AND "phrase_count_per_context"=0
-                    ''', cont_id)
-                phrase_meaning_for_del = cur.fetchall()
-
-                for phrm_for_del in phrase_meaning_for_del:
-                    self.delete_phrase_meaning(phrm_for_del, cont_id)
-
-                """
-                Delete phrase from phrase table in case the phrase does not exist anymore in
-                the phrase origin table
-                """
-                cur.execute('''SELECT "phrase_id" FROM "phrase_origin" WHERE "phrase_id"=%s''', phr)
-                exist = cur.fetchone()
-                if not exist:
-                    cur.execute('''DELETE FROM phrase WHERE "phrase_id"=%s ''', phr)
-
-            """
-            The document can now be deleted from the document table
-            """
-            cur.execute('DELETE FROM document WHERE "document_id" = %s;', doc_id_for_del, )
+        """
+        Delete the documents --doc_ids_for_del-- in one transaction.
+        Their phrase-document counts are deleted from the phrase origin table and subtracted from
+        the phrase-context counts of the phrase meaning table, the phrase-context entries whose count
+        drops to 0 are deleted, as well as the phrases that do not exist in any other document and
+        that no analytics table references.
+        """
+        con = open_connection(autocommit=False)
+        cur = con.cursor()
+        try:
+            with con:
+                deleted = unstage_documents(cur, doc_ids_for_del)
+            self.phraseResolver.forget(deleted)
+            print('%s documents deleted, %s phrases deleted' % (len(doc_ids_for_del), len(deleted)))
         finally:
             cur.close()
-            con.close()
+            close_connection(con)
 
     def delete_phrase(self, phrase_id_for_del):
 
-        con = connect("host=%s dbname=%s user=%s password=%s" % (host, dbname, usr, password))
-        con.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        con = open_connection()
         cur = con.cursor()
 
         cur.execute('DELETE FROM phrase WHERE "phrase_id" = %s;', ([phrase_id_for_del]))
 
         cur.close()
-        con.close()
+        close_connection(con)
 
     def delete_phrase_origin(self, phrase_id_for_del, doc_id_for_del):
 
-        con = connect("host=%s dbname=%s user=%s password=%s" % (host, dbname, usr, password))
-        con.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        con = open_connection()
         cur = con.cursor()
 
         cur.execute('DELETE FROM "phrase_origin" WHERE "phrase_id" = %s AND "document_id" = %s;',
                     (phrase_id_for_del, doc_id_for_del))
 
         cur.close()
-        con.close()
+        close_connection(con)
 
     def delete_phrase_meaning(self, phrase_id_for_del, cont_id_for_del):
 
-        con = connect("host=%s dbname=%s user=%s password=%s" % (host, dbname, usr, password))
-        con.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        con = open_connection()
         cur = con.cursor()
 
+        log_changes(cur, '''SELECT %s, %s''', (phrase_id_for_del, cont_id_for_del))
         cur.execute('DELETE FROM "phrase_meaning" WHERE "phrase_id" = %s AND "context_id" =%s;',
                     (phrase_id_for_del, cont_id_for_del))
 
         cur.close()
-        con.close()
+        close_connection(con)
 
     def drop(self):
 
+        close_pool()
         con = connect(user=self.usr, host=self.host, password=self.password)
         dbname = self.dbname
         con.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
@@ -871,81 +1128,49 @@ class Database(object):
             con.close()
             print('Database deleted')
 
-    def change_context(self):
+    def change_context(self, doc_n=None, new_cont_name=None):
 
-        print('Please enter document number')
-        doc_n = input()
+        """
+        Move the document --doc_n-- to the context named --new_cont_name--, see change_documents_context.
+        The document number and the context name are asked for when they are not given.
+        """
+        if doc_n is None:
+            print('Please enter document number')
+            doc_n = input()
 
-        print('Please provide the new context name')
-        new_cont_name = input()
-        con = connect(dbname=self.dbname, user=self.usr, host=self.host, password=self.password)
-        con.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        if new_cont_name is None:
+            print('Please provide the new context name')
+            new_cont_name = input()
+
+        self.change_documents_context([int(doc_n)], new_cont_name)
+
+    def change_documents_context(self, doc_ids, new_cont_name):
+
+        """
+        Move the documents --doc_ids-- to the context named --new_cont_name-- in one transaction.
+        The phrase-context counts of the phrase meaning table are moved from the previous contexts
+        of the documents to the new context.
+        """
+        con = open_connection(autocommit=False)
         cur = con.cursor()
         try:
-            cur.execute('''SELECT "context_id" FROM "context" WHERE "context_name" = %s''', ([new_cont_name]))
-            new_cont_id = cur.fetchone()
-            print(new_cont_id[0])
+            with con:
+                cur.execute('''SELECT "context_id" FROM "context" WHERE "context_name" = %s''', ([new_cont_name]))
+                new_cont_id = cur.fetchone()
+                if new_cont_id is None:
+                    print('No context named %s' % new_cont_name)
+                    return
 
-            cur.execute('''SELECT "context_id" FROM "document" WHERE "document_id" = %s''', ([doc_n]))
-            old_cont_id = cur.fetchone()
+                moved = move_documents(cur, doc_ids, new_cont_id[0])
 
-            print('new_cont_id = ', new_cont_id[0], ' old_cont_id = ', old_cont_id[0])
-
-            if new_cont_id[0] == old_cont_id[0]:
+            if moved == 0:
                 print('Context name is the same. No changes required.')
             else:
-
-                cur.execute('''SELECT "phrase_id" FROM "phrase_origin" WHERE "document_id" = %s''', doc_n)
-                phr_in_doc = cur.fetchall()
-
-                for phr in phr_in_doc:
-                    cur.execute('''
-                            UPDATE "phrase_meaning" 
-                            SET "phrase_count_per_context" = "phrase_count_per_context" 
-                            - (SELECT "phrase_count_per_document"
-                            FROM "phrase_origin" 
-                            WHERE ("phrase_id" = %s AND "document_id" = %s))
-                            WHERE "phrase_id" = %s AND "context_id" = %s
-                            '''
-                                , (phr, doc_n, phr, old_cont_id[0])
-                                )
-                    cur.execute(
-                        '''DELETE FROM "phrase_meaning" 
-                           WHERE "phrase_count_per_context" <= 0 OR "phrase_count_per_context" IS NULL''')
-
-                    cur.execute(
-                        '''UPDATE "document" SET "context_id" = %s
-                           WHERE "document_id" = %s''', (new_cont_id, doc_n))
-
-                    cur.execute('''SELECT count(*) FROM "phrase_meaning" WHERE
-                            "phrase_id" = %s
-                            AND "context_id" = %s''', (phr, new_cont_id))
-                    exist = cur.fetchone()
-
-                    if exist[0] == 0:
-                        cur.execute(
-                            '''INSERT INTO "phrase_meaning" 
-                                ("phrase_id", "context_id", "phrase_count_per_context")
-                                VALUES (%s, %s, (SELECT SUM("phrase_count_per_document") 
-                                FROM "phrase_origin" 
-                                WHERE ("phrase_id" = %s) 
-                                AND ("document_id" IN (SELECT "document_id" FROM "document" WHERE "dontext_id" = %s)
-                                )))''', (phr, new_cont_id, phr, new_cont_id))
-
-                    else:
-                        cur.execute('''
-                            UPDATE "phrase_meaning" 
-                            SET "phrase_count_per_context" = (SELECT SUM("phrase_count_per_document") 
-                            FROM "phrase_origin" 
-                            WHERE "phrase_id" = %s AND ("document_id" IN (SELECT "document_id" FROM "document" WHERE "context_id" = %s)))
-                            WHERE "phrase_id" = %s AND "context_id" = %s
-                            ''', (phr, new_cont_id[0], phr, new_cont_id[0]))
-
-                print('Document context was changed')
+                print('Document context was changed for %s documents' % moved)
 
         finally:
             cur.close()
-            con.close()
+            close_connection(con)
 
     def __str__(self):
 
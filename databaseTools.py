@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers shared by the modules that read from and write to the "contextionary" database.
+
+All the connections to the "contextionary" database come from one connection pool per process,
+configured from config.DATABASE:
+    - open_connection() checks out a connection and close_connection() gives it back.
+    An autocommit connection is checked out once per thread (worker) and shared by the nested
+    open_connection() calls of that thread. A transactional connection (autocommit=False) is
+    always a dedicated connection.
+    - checkout() keeps the autocommit connection of the current thread checked out until release()
+    is called. It is meant for long running workers such as the WordVectorSpace stages.
+    - connection() is a context manager around open_connection() and close_connection().
+When all the connections of the pool are in use, open_connection() waits for one to be given back,
+at most config.DATABASE['checkoutTimeout'] seconds: a thread which already holds a connection and
+asks for another one could otherwise wait forever for the connections held by threads doing the same.
+A process created with fork does not reuse the connections of its parent, it opens its own pool.
+"""
+import io
+import os
+import threading
+from contextlib import contextmanager
+import config
+
+
+_pool = None
+_poolPid = None
+_poolSlots = None
+_poolLock = threading.Lock()
+_local = threading.local()
+
+
+def get_pool():
+    """
+    Return the connection pool of the current process, creating it on first use.
+    """
+    global _pool, _poolPid, _poolSlots
+    with _poolLock:
+        if _pool is None or _poolPid != os.getpid():
+            from psycopg2.pool import ThreadedConnectionPool
+            _pool = ThreadedConnectionPool(config.DATABASE['minConnections'],
+                                           config.DATABASE['maxConnections'],
+                                           host=config.DATABASE['host'],
+                                           dbname=config.DATABASE['dbname'],
+                                           user=config.DATABASE['user'],
+                                           password=config.DATABASE['password'])
+            _poolSlots = threading.BoundedSemaphore(config.DATABASE['maxConnections'])
+            _poolPid = os.getpid()
+        return _pool
+
+
+def close_pool():
+    """
+    Close all the connections of the pool of the current process, for instance before
+    the database is dropped.
+    """
+    global _pool
+    with _poolLock:
+        if _pool is not None and _poolPid == os.getpid():
+            _pool.closeall()
+        _pool = None
+    _local.held = None
+    _local.checkedOut = None
+
+
+def open_connection(autocommit=True):
+    """
+    Check out a connection of the pool. Give it back with close_connection().
+    """
+    held = getattr(_local, 'held', None)
+    if autocommit and held is not None and held[0] == os.getpid() and not held[1].closed:
+        _local.depth += 1
+        return held[1]
+
+    pool = get_pool()
+    if not _poolSlots.acquire(timeout=config.DATABASE['checkoutTimeout']):
+        from psycopg2.pool import PoolError
+        raise PoolError("no connection given back to the pool within %s seconds" % config.DATABASE['checkoutTimeout'])
+    try:
+        con = pool.getconn()
+        con.autocommit = autocommit
+    except Exception:
+        _poolSlots.release()
+        raise
+
+    if autocommit:
+        _local.held = (os.getpid(), con)
+        _local.depth = 1
+    return con
+
+
+def close_connection(con):
+    """
+    Give a connection obtained with open_connection() back to the pool.
+    """
+    held = getattr(_local, 'held', None)
+    if held is not None and held[1] is con:
+        _local.depth -= 1
+        if _local.depth > 0:
+            return
+        _local.held = None
+
+    if _pool is not None and _poolPid == os.getpid():
+        _pool.putconn(con, close=bool(con.closed))
+        _poolSlots.release()
+
+
+@contextmanager
+def connection(autocommit=True):
+    """
+    Check out a connection of the pool for the duration of a with block.
+    """
+    con = open_connection(autocommit)
+    try:
+        yield con
+    finally:
+        close_connection(con)
+
+
+def checkout():
+    """
+    Return the autocommit connection of the current thread, checking it out of the pool
+    the first time. The connection stays checked out until release() is called.
+    """
+    checkedOut = getattr(_local, 'checkedOut', None)
+    if checkedOut is not None and checkedOut[0] == os.getpid():
+        if not checkedOut[1].closed:
+            return checkedOut[1]
+        release()
+    _local.checkedOut = (os.getpid(), open_connection())
+    return _local.checkedOut[1]
+
+
+def release():
+    """
+    Give the connection checked out by checkout() back to the pool.
+    """
+    checkedOut = getattr(_local, 'checkedOut', None)
+    _local.checkedOut = None
+    if checkedOut is not None and checkedOut[0] == os.getpid():
+        close_connection(checkedOut[1])
+
+
+def copy_value(value):
+    """
+    Format a single value for the text format of the PostgreSQL COPY command.
+    None becomes NULL, backslashes, tabs and line breaks are escaped.
+    """
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+
+def copy_rows(cur, table, columns, rows):
+    """
+    Load --rows-- into --table-- with one COPY ... FROM STDIN statement instead of
+    one INSERT per row. --columns-- lists the column names in the order of the row values.
+    Return the number of rows sent to the database.
+    """
+    buffer = io.StringIO()
+    count = 0
+    for row in rows:
+        buffer.write('\t'.join(copy_value(value) for value in row))
+        buffer.write('\n')
+        count += 1
+    buffer.seek(0)
+    cur.copy_expert('COPY %s (%s) FROM STDIN' % (table, ', '.join('"%s"' % column for column in columns)),
+                    buffer)
+    return count
+
+
+def update_rows(cur, table, keyColumn, columns, rows):
+    """
+    Set --columns-- of the rows of --table-- identified by --keyColumn-- with one COPY into a temporary
+    table and one UPDATE ... FROM instead of one UPDATE per row. Each row of --rows-- is the key value
+    followed by the values of --columns--.
+    Return the number of rows updated.
+    """
+    stage = '"%s_update"' % table.strip('"')
+    cur.execute('DROP TABLE IF EXISTS %s' % stage)
+    cur.execute('CREATE TEMP TABLE %s AS SELECT %s FROM %s WITH NO DATA' %
+                (stage, ', '.join('"%s"' % column for column in [keyColumn] + columns), table))
+    try:
+        copy_rows(cur, stage, [keyColumn] + columns, rows)
+        cur.execute('UPDATE %s SET %s FROM %s WHERE %s."%s" = %s."%s"' %
+                    (table, ', '.join('"%s" = %s."%s"' % (column, stage, column) for column in columns),
+                     stage, table, keyColumn, stage, keyColumn))
+        count = cur.rowcount
+    finally:
+        cur.execute('DROP TABLE IF EXISTS %s' % stage)
+    return count
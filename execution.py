@@ -18,17 +18,13 @@ database for the program, called "contextionary". The "contextionary" database c
 """
 
 from contextionaryDatabase import Database
+from ingestionPipeline import IngestionPipeline
+from ingestionManifest import IngestionManifest
+from ingestionScheduler import IngestionScheduler
 import os
-from psycopg2 import connect
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from databaseTools import open_connection, close_connection
 from pathlib import Path
-import multiprocessing
-from multiprocessing import Process
-from threading import Thread, Event
-from queue import Queue, Empty
-import platform
 import time
-from random import shuffle
 import config
 
 
@@ -37,11 +33,6 @@ projectPath = os.getcwd()
 
 start_time = time.time()
 createDatabase = 0
-db = Database(libraryName, config.PARSE['phraseLength'], projectPath, createDatabase)
-
-libraryFolderPath = db.libraryFolderPath
-
-stop_event = Event()
 
 
 def time_variable_process(t_var):
@@ -58,85 +49,97 @@ def time_variable_process(t_var):
     return result_time
 
 
-def add_document_process(filepath):
-    db.add_document(filepath)
-
-
-class AddDocumentThread(Thread):
-    def __init__(self, queue):
-        Thread.__init__(self)
-        self.queue = queue
-
-    def run(self):
-        while True:
-            try:
-                filepath = self.queue.get_nowait()
-                add_document_process(filepath)
-                if stop_event.is_set():
-                    break
-            except Empty:
-                print("Execution Time:", str(time.time() - start_time))
-                os._exit(10)
-        return
-
-
-file_list = []
-
-for root, dirs, files in os.walk(libraryFolderPath):
-    rootdirname = Path(root).parts[-1]
-
-    con = connect(dbname=config.DATABASE['dbname'],
-                  user=config.DATABASE['user'],
-                  password=config.DATABASE['password'])
-    con.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+def collect_file_list(libraryFolderPath):
+    """
+    Return the paths of the documents (.txt files) stored in the folders of the leaf contexts.
+    The names of the leaf contexts are read with one query.
+    """
+    con = open_connection()
     cur = con.cursor()
+    try:
+        cur.execute(""" SELECT "context_name" FROM context WHERE "context_children_id" = '0'; """)
+        leafContexts = set(row[0] for row in cur.fetchall())
+    finally:
+        cur.close()
+        close_connection(con)
 
-    cur.execute(""" SELECT count(*) FROM context WHERE "context_name" = %s; """,
-                ([rootdirname]), )
-    dircount = cur.fetchone()
+    file_list = []
+    for root, dirs, files in os.walk(libraryFolderPath):
+        if Path(root).parts[-1] in leafContexts:
+            file_list.extend(os.path.join(root, file) for file in files if file.endswith(".txt"))
 
-    cur.execute(""" SELECT "context_children_id" FROM context WHERE "context_name" = %s; """,
-                ([rootdirname]), )
-    childlist = cur.fetchone()
+    return file_list
 
+
+def delete_documents(db, documentIDs):
+    """
+    Delete the documents {file path: document ID} --documentIDs-- in one transaction. When that fails,
+    each document is deleted in its own transaction and the documents that cannot be deleted are skipped.
+    Return the file paths of the deleted documents.
+    """
     try:
-        if (dircount[0] > 0) and (childlist[0] == '0'):
-            file_list.extend([[files, root]])
+        db.delete_documents(list(documentIDs.values()))
+        return list(documentIDs.keys())
+    except Exception as error:
+        print("Could not delete %s documents: %r. Deleting them one by one" % (len(documentIDs), error))
 
-    finally:
-        cur.close()
-        con.close()
+    deleted = []
+    for filepath, documentID in documentIDs.items():
+        try:
+            db.delete_documents([documentID])
+            deleted.append(filepath)
+        except Exception as error:
+            print("Could not delete %s, it is skipped: %r" % (filepath, error))
+    return deleted
 
 
 def main():
-    if file_list:
+    db = Database(libraryName, config.PARSE['phraseLength'], projectPath, createDatabase)
+
+    """
+    The ingestion manifest tells which documents are new or were modified since they were added.
+    Unchanged documents are skipped without reading them, modified documents are deleted and added again.
+    A modified document that cannot be deleted is kept as it is until the next run.
+    """
+    manifest = IngestionManifest(db)
+    manifest.load()
+    newFiles, modifiedFiles = manifest.scan(collect_file_list(db.libraryFolderPath))
+
+    deletedFiles = []
+    if modifiedFiles:
+        print("Deleting modified documents.....")
+        deletedFiles = delete_documents(db, modifiedFiles)
+        for filepath in deletedFiles:
+            manifest.remove(db.document_path(filepath)[3])
+
+    """
+    The scheduler puts the documents left pending by the previous run first and the largest documents
+    first. It logs the progress and the manifest after each batch written to the database, and the logs
+    are compacted at the end of the run.
+    """
+    scheduler = IngestionScheduler(manifest)
+    scheduler.load()
+    scheduled_list = scheduler.schedule(newFiles + deletedFiles)
+
+    if scheduled_list:
         print("Updating documents.....")
-        random_ordered_list = []
-
-        for files in file_list:
-            for file in files[0]:
-                if 'Linux' in platform.platform():
-                    random_ordered_list.append(files[1] + '/' + file)
-                else:
-                    random_ordered_list.append(files[1] + '\\' + file)
-
-        shuffle(random_ordered_list)
-
-        while float(time.time() - start_time) <= float(time_variable_process(config.PARSE['executionTime'])):
-            q = Queue()
-            for rand_file in random_ordered_list:
-                q.put(rand_file)
-
-            new_threads = []
-            t = AddDocumentThread(q)
-            new_threads.append(t)
-            t.start()
-
-            for t in new_threads:
-                t.join(float(time_variable_process(config.PARSE['executionTime'])) - float(time.time() - start_time))
-        else:
-            stop_event.set()
-            print("Timed Out")
+
+        """
+        Documents are tokenized in parallel by config.PARSE['parseWorkers'] processes and
+        written to the database in batches by a single writer. Each batch is one transaction,
+        so a document is either fully added or not at all. A failed batch is written again one
+        document at a time. No document is parsed after the deadline.
+        """
+        pipeline = IngestionPipeline(db, config.PARSE['phraseLength'])
+        deadline = start_time + time_variable_process(config.PARSE['executionTime'])
+        try:
+            pipeline.run(scheduled_list, deadline, scheduler)
+        finally:
+            scheduler.save()
+        print("Documents added:", pipeline.written)
+        print("Documents pending:", len(scheduler.pending))
+
+    manifest.save()
 
 
 if __name__ == '__main__':
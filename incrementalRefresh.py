@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental refresh of WordVectorSpace (contextionaryAnalytics.py) after new documents are ingested.
+
+A document only changes the phrase counts of its context, so the ingest records the (phrase ID, context ID)
+pairs whose count changed into the "analytics_change_log" table (see contextionaryDatabase.log_changes).
+After a complete run, StageRunner records the last change of the log taken into account and the phrase
+of each line of the matrices (phraseIDs artifact). The next run then refreshes the outputs of the previous
+run instead of building them again:
+    - the changed contexts are the contexts of the log and their ancestors, whose counts include the counts
+    of their descendants. The relative frequencies of a phrase only change when its count changed (phrase
+    of the log) or when it exists in a changed independent context, whose total phrase count changed
+    - the dirty lines are the lines of these phrases and of the new phrases of the phrase dictionary: only
+    they are computed again in the phrase vector space and distance to context matrices, the other lines
+    are copied from the previous matrices
+    - the lexical set boundary of a context is computed again when a dirty phrase or a phrase removed from
+    the phrase dictionary exists in the context
+    - the lexical set of a context is computed again for the dirty phrases only, or for all the phrases when
+    its boundary changed
+When the dirty phrases are more than config.PARSE['refreshDirtyFraction'] of the phrases, the stages are
+built again instead.
+"""
+import numpy as np
+import matrixFiles
+
+
+def last_change(cur):
+    """
+    Return the ID of the last change of the analytics change log, 0 when the log is empty and None when the
+    database has no change log.
+    """
+    cur.execute("""SELECT to_regclass('"analytics_change_log"')""")
+    if cur.fetchone()[0] is None:
+        return None
+    cur.execute("""SELECT coalesce(max("change_id"), 0) FROM "analytics_change_log";""")
+    return cur.fetchone()[0]
+
+
+def changed_cells(cur, firstChange, lastChange):
+    """
+    Return the (phrase ID, context ID) pairs recorded by the changes of ID above --firstChange-- up to
+    --lastChange--.
+    """
+    cur.execute("""SELECT DISTINCT "phrase_id", "context_id" FROM "analytics_change_log"
+                   WHERE "change_id" > %s AND "change_id" <= %s;""", (firstChange, lastChange))
+    return cur.fetchall()
+
+
+def purge_changes(cur, lastChange):
+    """
+    Delete the changes of ID up to --lastChange--, which the matrices of WordVectorSpace include.
+    """
+    cur.execute("""DELETE FROM "analytics_change_log" WHERE "change_id" <= %s;""", (lastChange,))
+
+
+class IncrementalRefresh(object):
+
+    def __init__(self, wordVectorSpace, previousPhraseIDs, cells, cur):
+
+        """
+        NOTE:
+            - wordVectorSpace: the WordVectorSpace object whose phrase and context dictionaries are loaded
+            - previousPhraseIDs: phrase ID of each line of the matrices of the previous run
+            - cells: (phrase ID, context ID) pairs changed since the previous run, see changed_cells
+            - cur: cursor used to find the contexts of the phrases removed from the phrase dictionary
+        """
+        space = wordVectorSpace
+        self.wordVectorSpace = wordVectorSpace
+        self.contextsByRCIndex = dict((context.getRCIndex(), context) for context in space.contexts.values())
+
+        """
+        --previousIndexes-- gives the line of each phrase in the previous matrices (-1 for a new phrase) and
+        --newIndexes-- the line of each previous phrase in the new matrices (-1 for a removed phrase).
+        """
+        self.phraseIDs = np.zeros(len(space.phrases), dtype=np.int64)
+        for phraseID, phrase in space.phrases.items():
+            self.phraseIDs[phrase.getIndex()] = phraseID
+        previousPhraseIDs = np.asarray(previousPhraseIDs, dtype=np.int64)
+        previousIndex = dict((phraseID, index) for index, phraseID in enumerate(previousPhraseIDs.tolist()))
+        self.previousIndexes = np.array([previousIndex.get(phraseID, -1) for phraseID in self.phraseIDs.tolist()],
+                                        dtype=np.int64)
+        self.newIndexes = np.full(len(previousPhraseIDs), -1, dtype=np.int64)
+        kept = np.flatnonzero(self.previousIndexes >= 0)
+        self.newIndexes[self.previousIndexes[kept]] = kept
+        self.removedIDs = previousPhraseIDs[self.newIndexes < 0].tolist()
+
+        """
+        Changed contexts (RCIndex) and dirty lines.
+        """
+        contextIDs = set(contextID for phraseID, contextID in cells if contextID in space.contexts)
+        self.changedRCIndexes = self.withAncestors(contextIDs)
+        independentRCIndexes = np.array([RCIndex for RCIndex in self.changedRCIndexes
+                                         if self.contextsByRCIndex[RCIndex].isIndependent()], dtype=np.int64)
+
+        self.dirtyLines = self.previousIndexes < 0
+        self.dirtyLines[[space.phrases[phraseID].getIndex() for phraseID, contextID in cells
+                         if phraseID in space.phrases]] = True
+        if len(independentRCIndexes):
+            self.dirtyLines |= space.phraseCountPerContextMatrix[:, independentRCIndexes].getnnz(axis=1) > 0
+
+        """
+        Contexts whose lexical set boundary is computed again: the changed contexts, the contexts of the dirty
+        phrases and the contexts where the removed phrases still have a count.
+        """
+        affected = set(self.changedRCIndexes)
+        affected.update(np.unique(space.phraseCountPerContextMatrix[self.dirtyIndexes()].indices).tolist())
+        cur.execute("""SELECT DISTINCT "context_id" FROM "phrase_meaning" WHERE "phrase_id" = ANY(%s);""",
+                    (self.removedIDs,))
+        affected.update(self.withAncestors(set(row[0] for row in cur.fetchall() if row[0] in space.contexts)))
+        self.affectedRCIndexes = np.array(sorted(affected), dtype=np.int64)
+
+        """
+        The boundaries and the lexical sets of the previous run are read now: their files are replaced once
+        the stages that build them are done.
+        """
+        self.previousBoundaries = np.array(matrixFiles.load_matrix('contextLexicalSetBoundaries'))
+        self.previousLexicalSetIndexes = np.array(matrixFiles.load_matrix('contextLexicalSetIndexes'))
+        self.changedBoundaryRCIndexes = None
+
+    def withAncestors(self, contextIDs):
+
+        """
+        Return the sorted RCIndexes of the contexts --contextIDs-- and of their ancestors.
+        """
+        contexts = self.wordVectorSpace.contexts
+        RCIndexes = set()
+        for contextID in contextIDs:
+            for ID in [contextID] + list(contexts[contextID].getAncestorsID()):
+                RCIndexes.add(contexts[ID].getRCIndex())
+        return sorted(RCIndexes)
+
+    def dirtyIndexes(self):
+
+        return np.flatnonzero(self.dirtyLines)
+
+    def dirtyIDs(self):
+
+        """
+        IDs of the dirty phrases and of the removed phrases, whose rows of the analytics tables are replaced.
+        """
+        return self.phraseIDs[self.dirtyLines].tolist() + self.removedIDs
+
+    def dirtyFraction(self):
+
+        return (np.count_nonzero(self.dirtyLines) + len(self.removedIDs)) / max(len(self.phraseIDs), 1)
+
+    def copyPreviousLines(self, name, matrix, blockSize):
+
+        """
+        Copy into --matrix-- the lines of the phrases which are not dirty from the previous matrix --name--.
+        """
+        previous = matrixFiles.load_matrix(name)
+        lines = np.flatnonzero(~self.dirtyLines)
+        for start in range(0, len(lines), blockSize):
+            block = lines[start:start+blockSize]
+            matrix[block] = previous[self.previousIndexes[block]]
+        del previous
+
+    def updateChangedBoundaries(self, boundaries):
+
+        """
+        Record the independent contexts whose lexical set boundary (--boundaries-- by RCIndex) changed since
+        the previous run: their lexical sets are computed again for all the phrases.
+        """
+        changed = boundaries != self.previousBoundaries
+        self.changedBoundaryRCIndexes = np.array([RCIndex for RCIndex in np.flatnonzero(changed).tolist()
+                                                  if self.contextsByRCIndex[RCIndex].isIndependent()], dtype=np.int64)
+
+    def previousLexicalSets(self):
+
+        """
+        Return the (RCIndex, phrase index) lines of the previous lexical sets which are still valid: the lines
+        of the phrases which are not dirty, out of the independent contexts whose boundary changed.
+        """
+        RCIndexes = self.previousLexicalSetIndexes[:, 0]
+        indexes = self.newIndexes[self.previousLexicalSetIndexes[:, 1]]
+        valid = indexes >= 0
+        valid[valid] = ~self.dirtyLines[indexes[valid]]
+        valid &= ~np.isin(RCIndexes, self.changedBoundaryRCIndexes)
+        return RCIndexes[valid], indexes[valid]
+
+    def __str__(self):
+
+        return "I am the IncrementalRefresh class"
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+The IngestionManifest class records which documents of the library are already in the
+"contextionary" database, so that a new run of execution.py only touches new or modified files.
+
+The manifest is a dictionary keyed by the document path recorded in the document table
+(the file path relative to "Context tree"). Each entry holds:
+    - size: size of the file in bytes
+    - mtime: last modification time of the file
+    - hash: MD5 digest of the UTF-8 text of the document, as stored in "document_content"
+    - document_id: ID of the document in the document table
+The manifest is saved as a JSON file (config.PARSE['manifestPath']). When there is no such file,
+it is rebuilt from the document table with a single query, the hash of each document being
+computed by PostgreSQL from its content.
+During a run, the documents recorded and removed are appended to a log (manifest path + '.log')
+instead of rewriting the manifest. load() replays the log and save() compacts it into the manifest.
+"""
+import os
+import json
+import hashlib
+
+
+def text_hash(text):
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+
+def read_text(filepath):
+    file = open(filepath, "r", encoding="UTF-8-sig")
+    text = file.read()
+    file.close()
+    return text
+
+
+class IngestionManifest(object):
+
+    def __init__(self, db, manifestPath=None):
+
+        """
+        - db: Database object, used to compute the document paths and to load the manifest
+        from the document table
+        - manifestPath: path of the manifest file (config.PARSE['manifestPath'] by default)
+        """
+        import config
+
+        self.db = db
+        self.manifestPath = manifestPath or config.PARSE['manifestPath']
+        self.logPath = self.manifestPath + '.log'
+        self.entries = dict()
+        self.pending = dict()
+
+    def load(self):
+
+        if os.path.exists(self.manifestPath):
+            with open(self.manifestPath, encoding="UTF-8") as manifestFile:
+                self.entries = json.load(manifestFile)
+            print("Ingestion manifest loaded from %s: %s documents" % (self.manifestPath, len(self.entries)))
+        else:
+            self.entries = self.db.document_manifest()
+            print("Ingestion manifest loaded from the document table: %s documents" % len(self.entries))
+
+        """
+        The changes of the log are replayed, a removed document having a None entry. The last line is
+        incomplete when the run was killed while writing it.
+        """
+        if os.path.exists(self.logPath):
+            with open(self.logPath, encoding="UTF-8") as logFile:
+                for line in logFile:
+                    try:
+                        changes = json.loads(line)
+                    except ValueError:
+                        break
+                    for doc_path, entry in changes.items():
+                        if entry is None:
+                            self.entries.pop(doc_path, None)
+                        else:
+                            self.entries[doc_path] = entry
+
+    def save(self):
+
+        """
+        The manifest is written to a temporary file first so that an interrupted run never
+        leaves a truncated manifest behind. The log is then included in the manifest.
+        """
+        temporaryPath = self.manifestPath + '.tmp'
+        with open(temporaryPath, 'w', encoding="UTF-8") as manifestFile:
+            json.dump(self.entries, manifestFile)
+        os.replace(temporaryPath, self.manifestPath)
+        if os.path.exists(self.logPath):
+            os.remove(self.logPath)
+
+    def log(self, changes):
+
+        """
+        Append the changes {document path: entry or None} to the log, as one JSON line.
+        """
+        if changes:
+            with open(self.logPath, 'a', encoding="UTF-8") as logFile:
+                logFile.write(json.dumps(changes) + '\n')
+
+    def scan(self, filepaths):
+
+        """
+        Compare --filepaths-- with the manifest and return (new file paths, {file path: document ID}
+        of the modified files).
+        The size and modification time of a file are checked first. The file is only read and hashed
+        when one of them changed or is unknown, for instance when the manifest comes from the database.
+        """
+        newFiles = []
+        modifiedFiles = dict()
+
+        for filepath in filepaths:
+            doc_path = self.db.document_path(filepath)[3]
+            stat = os.stat(filepath)
+            entry = self.entries.get(doc_path)
+
+            if entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+                continue
+
+            digest = text_hash(read_text(filepath))
+            self.pending[doc_path] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': digest}
+
+            if entry is None:
+                newFiles.append(filepath)
+            elif entry['hash'] == digest:
+                entry.update(size=stat.st_size, mtime=stat.st_mtime)
+                del self.pending[doc_path]
+            else:
+                modifiedFiles[filepath] = entry['document_id']
+
+        print("Ingestion manifest: %s new documents, %s modified documents" % (len(newFiles), len(modifiedFiles)))
+        return newFiles, modifiedFiles
+
+    def remove(self, doc_path):
+
+        self.entries.pop(doc_path, None)
+        self.log({doc_path: None})
+
+    def record(self, documentIDs):
+
+        """
+        Record the documents written to the database, --documentIDs-- being {document path: document ID}.
+        """
+        changes = dict()
+        for doc_path, document_id in documentIDs.items():
+            entry = self.pending.pop(doc_path, None)
+            if entry is not None:
+                entry['document_id'] = document_id
+                self.entries[doc_path] = entry
+                changes[doc_path] = entry
+        self.log(changes)
+
+    def __str__(self):
+
+        return "I am the IngestionManifest class"
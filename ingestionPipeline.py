@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+The ingestion pipeline adds the documents of the library to the "contextionary" database in 3 stages:
+    - a feeder puts the document file paths into a task queue
+    - a pool of worker processes runs the TextProcessor on each document and puts a compact
+    payload (path, text and phrase count per length) into a result queue
+    - a single writer takes the payloads from the result queue and adds them to the database
+    in batches using Database.add_documents
+Both queues are bounded: when the writer falls behind, the workers block on the result queue
+and the feeder blocks on the task queue, so the memory used by the pipeline stays constant.
+When the writer fails, the feeder stops and the writer keeps emptying the result queue until
+the workers stop, then the error is raised by IngestionPipeline.run.
+"""
+import os
+import time
+from multiprocessing import Process, Queue
+from threading import Event, Thread
+from queue import Empty
+
+
+def parse_document(filepath, phraseMaxLength):
+    """
+    Read and tokenize a document. This is the CPU bound part of the ingestion and
+    it runs inside the worker processes.
+    """
+    from textProcessing import TextProcessor
+
+    file = open(filepath, "r", encoding="UTF-8-sig")
+    text = file.read()
+    file.close()
+
+    textProcessor = TextProcessor(text, phraseMaxLength)
+
+    return {'path': filepath,
+            'text': text,
+            'phraseCount': textProcessor.getPhraseCount()}
+
+
+def parse_worker(taskQueue, resultQueue, phraseMaxLength, deadline=None):
+    """
+    Worker process loop. A None task means there is no more work to do.
+    Once the --deadline-- has passed, the remaining tasks are handed back unparsed.
+    """
+    while True:
+        filepath = taskQueue.get()
+        if filepath is None:
+            break
+        if deadline is not None and time.time() > deadline:
+            resultQueue.put({'path': filepath, 'skipped': True})
+            continue
+        try:
+            resultQueue.put(parse_document(filepath, phraseMaxLength))
+        except Exception as error:
+            resultQueue.put({'path': filepath, 'error': repr(error)})
+    resultQueue.put(None)
+
+
+class IngestionPipeline(object):
+
+    def __init__(self, db, phraseMaxLength, workers=None, queueSize=None, batchSize=None):
+
+        """
+        - db: Database object used by the writer
+        - workers: number of tokenizer processes, all the cores of the machine when None or 0
+        - queueSize: maximum number of items waiting in each queue
+        - batchSize: maximum number of documents written by the writer in one transaction
+        """
+        import config
+
+        self.db = db
+        self.phraseMaxLength = phraseMaxLength
+        self.workers = workers or config.PARSE['parseWorkers'] or os.cpu_count()
+        self.queueSize = queueSize or config.PARSE['ingestQueueSize']
+        self.batchSize = batchSize or config.PARSE['writerBatchSize']
+        self.written = 0
+        self.documentIDs = dict()
+        self.failed = []
+        self.skipped = []
+        self.scheduler = None
+        self.error = None
+        self.stopped = Event()
+
+    def run(self, filepaths, deadline=None, scheduler=None):
+
+        """
+        Ingest --filepaths--. When a --deadline-- (time.time() value) is given, no new document
+        is parsed after that time, the documents already parsed are still written.
+        Each committed batch and each failure is reported to the IngestionScheduler --scheduler--.
+        """
+        self.scheduler = scheduler
+        self.error = None
+        self.stopped.clear()
+        taskQueue = Queue(self.queueSize)
+        resultQueue = Queue(self.queueSize)
+
+        processes = [Process(target=parse_worker, args=(taskQueue, resultQueue, self.phraseMaxLength, deadline))
+                     for _ in range(self.workers)]
+        for process in processes:
+            process.daemon = True
+            process.start()
+
+        writer = Thread(target=self.write, args=(resultQueue, len(processes)))
+        writer.start()
+
+        try:
+            for filepath in filepaths:
+                if deadline is not None and time.time() > deadline:
+                    print("Timed Out")
+                    break
+                if self.stopped.is_set():
+                    break
+                taskQueue.put(filepath)
+        finally:
+            for _ in processes:
+                taskQueue.put(None)
+
+            writer.join()
+            for process in processes:
+                process.join()
+
+        if self.error is not None:
+            raise self.error
+        return self.written
+
+    def write(self, resultQueue, producerCount):
+
+        """
+        Writer loop. Payloads are written as soon as a batch is full or when no other payload
+        arrives for a second. Each worker sends None when it stops.
+        After an error, the payloads are only taken out of the result queue so that the workers
+        do not block on it.
+        """
+        batch = []
+        while producerCount > 0:
+            try:
+                payload = resultQueue.get(timeout=1)
+            except Empty:
+                self.flush(batch)
+                continue
+
+            if payload is None:
+                producerCount -= 1
+            elif self.error is not None:
+                continue
+            elif 'skipped' in payload:
+                self.skipped.append(payload['path'])
+            elif 'error' in payload:
+                print("Could not parse %s: %s" % (payload['path'], payload['error']))
+                self.failed.append(payload['path'])
+                if self.scheduler is not None:
+                    try:
+                        self.scheduler.fail([payload['path']])
+                    except Exception as error:
+                        self.stop(error)
+            else:
+                batch.append(payload)
+                if len(batch) >= self.batchSize:
+                    self.flush(batch)
+
+        self.flush(batch)
+
+    def flush(self, batch):
+
+        """
+        Write --batch--. An error of the scheduler (checkpoint or manifest file) stops the pipeline.
+        """
+        if batch and self.error is None:
+            try:
+                self.writeBatch(batch)
+            except Exception as error:
+                self.stop(error)
+        del batch[:]
+
+    def stop(self, error):
+
+        print("Ingestion stopped: %r" % (error,))
+        self.error = error
+        self.stopped.set()
+
+    def writeBatch(self, batch):
+
+        """
+        Only the documents added by Database.add_documents are counted and reported as completed:
+        the documents already in the database or without context are skipped by add_documents.
+        When a batch fails, its documents are written again one by one, each in its own transaction,
+        so that only the failing documents are reported as failed.
+        """
+        filepaths = [payload['path'] for payload in batch]
+        try:
+            documentIDs = self.db.add_documents(batch)
+        except Exception as error:
+            if len(batch) > 1:
+                print("Could not write a batch of %s documents: %r. Writing them one by one" % (len(batch), error))
+                for payload in batch:
+                    self.writeBatch([payload])
+                return
+            print("Could not write %s: %r" % (filepaths[0], error))
+            self.failed.extend(filepaths)
+            if self.scheduler is not None:
+                self.scheduler.fail(filepaths)
+        else:
+            self.documentIDs.update(documentIDs)
+            self.written += len(documentIDs)
+            writtenPaths = [filepath for filepath in filepaths if self.db.document_path(filepath)[3] in documentIDs]
+            if self.scheduler is not None:
+                self.scheduler.complete(writtenPaths, documentIDs)
+
+    def __str__(self):
+
+        return "I am the IngestionPipeline class"
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+The IngestionScheduler class orders the documents to ingest within the time budget of
+execution.py (config.PARSE['executionTime']) and keeps a checkpoint of the progress.
+
+    - The documents left pending by the previous run are scheduled first, so that every run
+    makes progress on the same backlog instead of starting over.
+    - Within each group, the largest documents are scheduled first: the long documents are
+    parsed while there is time left and the short ones fill the end of the time window.
+    - Each batch committed by the ingestion writer moves its documents from pending to completed.
+    The batch is appended to the completion log (checkpoint path + '.log') and its documents to the
+    log of the ingestion manifest, so the cost of a batch does not grow with the number of documents.
+    save() compacts the log into the checkpoint file (config.PARSE['checkpointPath']) at the start and
+    at the end of a run. A run stopped at any point, even killed, resumes from the last committed batch:
+    load() replays the completion log over the checkpoint.
+"""
+import os
+import json
+import threading
+
+
+class IngestionScheduler(object):
+
+    def __init__(self, manifest=None, checkpointPath=None):
+
+        """
+        - manifest: IngestionManifest updated with the documents of each committed batch
+        - checkpointPath: path of the checkpoint file (config.PARSE['checkpointPath'] by default)
+        """
+        import config
+
+        self.manifest = manifest
+        self.checkpointPath = checkpointPath or config.PARSE['checkpointPath']
+        self.logPath = self.checkpointPath + '.log'
+        self.completed = []
+        self.pending = []
+        self.failed = []
+        self.finished = set()
+        self.lock = threading.Lock()
+
+    def load(self):
+
+        if os.path.exists(self.checkpointPath):
+            with open(self.checkpointPath, encoding="UTF-8") as checkpointFile:
+                checkpoint = json.load(checkpointFile)
+            self.completed = checkpoint['completed']
+            self.pending = checkpoint['pending']
+            self.failed = checkpoint['failed']
+        self.finished = set(self.completed).union(self.failed)
+
+        """
+        The batches of the completion log are replayed. The last line is incomplete when the run
+        was killed while writing it.
+        """
+        if os.path.exists(self.logPath):
+            with open(self.logPath, encoding="UTF-8") as logFile:
+                for line in logFile:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    filepaths = [filepath for filepath in entry['filepaths'] if filepath not in self.finished]
+                    (self.completed if entry['status'] == 'completed' else self.failed).extend(filepaths)
+                    self.finished.update(filepaths)
+        self.pending = [filepath for filepath in self.pending if filepath not in self.finished]
+        if os.path.exists(self.checkpointPath) or os.path.exists(self.logPath):
+            print("Ingestion checkpoint loaded: %s completed, %s pending" % (len(self.completed), len(self.pending)))
+
+    def save(self):
+
+        """
+        Compact the completion log into the checkpoint file.
+        """
+        with self.lock:
+            self.pending = [filepath for filepath in self.pending if filepath not in self.finished]
+            checkpoint = {'completed': self.completed, 'pending': self.pending, 'failed': self.failed}
+            temporaryPath = self.checkpointPath + '.tmp'
+            with open(temporaryPath, 'w', encoding="UTF-8") as checkpointFile:
+                json.dump(checkpoint, checkpointFile)
+            os.replace(temporaryPath, self.checkpointPath)
+            if os.path.exists(self.logPath):
+                os.remove(self.logPath)
+
+    def log(self, status, filepaths):
+
+        """
+        Append a batch of documents --filepaths-- to the completion log, as one JSON line.
+        """
+        with open(self.logPath, 'a', encoding="UTF-8") as logFile:
+            logFile.write(json.dumps({'status': status, 'filepaths': filepaths}) + '\n')
+
+    def schedule(self, filepaths):
+
+        """
+        Return --filepaths-- in ingestion order: the documents pending from the previous run first,
+        then the others, the largest documents first in each group.
+        When nothing was pending, a new cycle starts and the completed documents are forgotten.
+        """
+        previous = set(self.pending)
+        sizes = dict((filepath, os.path.getsize(filepath)) for filepath in filepaths)
+        ordered = sorted(filepaths, key=lambda filepath: (filepath not in previous, -sizes[filepath], filepath))
+
+        if not previous:
+            self.completed = []
+        self.pending = ordered
+        self.failed = []
+        self.finished = set()
+        self.save()
+
+        print("Ingestion scheduled: %s documents, %s resumed from the previous run" %
+              (len(ordered), len(previous.intersection(sizes))))
+        return ordered
+
+    def complete(self, filepaths, documentIDs):
+
+        """
+        Record the documents of a committed batch, --documentIDs-- being {document path: document ID}
+        as returned by Database.add_documents.
+        """
+        with self.lock:
+            self.completed.extend(filepaths)
+            self.finished.update(filepaths)
+            if self.manifest is not None:
+                self.manifest.record(documentIDs)
+            self.log('completed', filepaths)
+
+    def fail(self, filepaths):
+
+        """
+        Record the documents that could not be parsed or written. They are not in the manifest,
+        so the next run schedules them again.
+        """
+        with self.lock:
+            self.failed.extend(filepaths)
+            self.finished.update(filepaths)
+            self.log('failed', filepaths)
+
+    def __str__(self):
+
+        return "I am the IngestionScheduler class"
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Binary files of the phrase x context matrices of WordVectorSpace (contextionaryAnalytics.py).
+
+A matrix --name-- is stored in the folder config.PARSE['matrixFolder'] as two files:
+    - <name>.npy: the matrix in NumPy format, which np.load opens with mmap_mode='r'
+    - <name>.json: its header: format version (FORMAT_VERSION), shape, dtype and the index of the
+    database giving the lines and the columns of the matrix (for instance "phrase_index" and "rcindex")
+A matrix is written into temporary files which replace the files of the matrix once the matrix is
+complete, so that a reader such as TextComprehension.findContext never maps a partly written matrix.
+"""
+import os
+import json
+import numpy as np
+import config
+
+
+FORMAT_VERSION = 1
+
+
+def matrix_path(name, extension='.npy'):
+
+    return os.path.join(config.PARSE['matrixFolder'], name + extension)
+
+
+def create_matrix(name, shape, dtype=np.float64):
+    """
+    Return a new memory-mapped matrix of zeros, written into the temporary file of the matrix --name--.
+    """
+    os.makedirs(config.PARSE['matrixFolder'], exist_ok=True)
+    from numpy.lib.format import open_memmap
+    return open_memmap(matrix_path(name, '.tmp.npy'), mode='w+', dtype=dtype, shape=shape)
+
+
+def publish_matrix(name, matrix, **header):
+    """
+    Write the header of the memory-mapped --matrix-- created by create_matrix and replace the files of
+    the matrix --name-- with its temporary files. --header-- completes the header, for instance with
+    the index of the lines and the columns. The file name of --matrix-- becomes the file of the matrix
+    --name--, which save_matrix then leaves as it is.
+    """
+    matrix.flush()
+    header = dict(header, version=FORMAT_VERSION, shape=list(matrix.shape), dtype=matrix.dtype.str)
+    with open(matrix_path(name, '.tmp.json'), 'w', encoding="UTF-8") as headerFile:
+        json.dump(header, headerFile)
+    os.replace(matrix_path(name, '.tmp.npy'), matrix_path(name))
+    os.replace(matrix_path(name, '.tmp.json'), matrix_path(name, '.json'))
+    matrix.filename = os.path.abspath(matrix_path(name))
+
+
+def save_matrix(name, matrix, **header):
+    """
+    Save the array --matrix-- as the matrix --name--, with its header. A memory-mapped matrix already
+    published as the matrix --name-- is left as it is.
+    """
+    if isinstance(matrix, np.memmap) and matrix.filename is not None and \
+            os.path.abspath(matrix.filename) == os.path.abspath(matrix_path(name)):
+        return
+    published = create_matrix(name, np.shape(matrix), np.asarray(matrix).dtype)
+    published[...] = matrix
+    publish_matrix(name, published, **header)
+    del published
+
+
+def load_matrix(name, mmap_mode='r'):
+    """
+    Return the matrix --name-- mapped in memory. A ValueError is raised when its header has another
+    format version or another shape: the matrix must then be built again by postexecution.py.
+    A matrix without header, saved before the headers existed, is loaded as it is.
+    """
+    matrix = np.load(matrix_path(name), mmap_mode=mmap_mode)
+    if os.path.exists(matrix_path(name, '.json')):
+        with open(matrix_path(name, '.json'), encoding="UTF-8") as headerFile:
+            header = json.load(headerFile)
+        if header.get('version') != FORMAT_VERSION:
+            raise ValueError("%s has the format version %s instead of %s" % (matrix_path(name), header.get('version'), FORMAT_VERSION))
+        if header.get('shape') != list(matrix.shape):
+            raise ValueError("%s has the shape %s instead of %s" % (matrix_path(name), list(matrix.shape), header.get('shape')))
+    return matrix
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+The PhraseResolver class translates phrase texts into phrase IDs during ingestion.
+
+Resolving a phrase text into its phrase ID is the most frequent operation of the ingestion.
+The resolver keeps the most recently used phrases in a size-bounded in-memory dictionary
+{phrase text: phrase ID}, warmed from the phrase table the first time it is used.
+The phrases that are not in the dictionary are resolved in one statement per batch:
+an INSERT ... ON CONFLICT DO NOTHING RETURNING on the unique index of "phrase_text", combined
+with the lookup of the phrases that already existed.
+"""
+import threading
+from collections import OrderedDict
+
+
+class PhraseResolver(object):
+
+    def __init__(self, capacity=None, warm=True):
+
+        """
+        - capacity: maximum number of phrases kept in memory (config.PARSE['phraseCacheSize'] by default)
+        - warm: load the phrase table into memory the first time the resolver is used
+        """
+        import config
+
+        self.capacity = capacity or config.PARSE['phraseCacheSize']
+        self.phraseIDs = OrderedDict()
+        self.lock = threading.Lock()
+        self.warmed = not warm
+        self.hits = 0
+        self.misses = 0
+
+    def warm(self, cur):
+
+        """
+        Load up to --capacity-- phrases of the phrase table, oldest phrases first.
+        """
+        cur.execute('''SELECT "phrase_text", "phrase_id" FROM phrase ORDER BY "phrase_id" LIMIT %s;''',
+                    (self.capacity,))
+        rows = cur.fetchall()
+        with self.lock:
+            for phraseText, phraseID in rows:
+                self.phraseIDs[phraseText] = phraseID
+            self.warmed = True
+        print('phrase resolver warmed with %s phrases' % len(rows))
+
+    def resolve(self, cur, phrases):
+
+        """
+        Return ({phrase text: phrase ID}, {phrase text: phrase ID of the phrases inserted}) for
+        --phrases-- ({phrase text: phrase length}). Unknown phrases are inserted into the phrase table.
+        The inserted phrases are only remembered once the caller has committed its transaction
+        (see remember), so that a rollback never leaves unknown phrase IDs in memory.
+        """
+        if not self.warmed:
+            self.warm(cur)
+
+        phraseIDs = dict()
+        missing = dict()
+        with self.lock:
+            for phraseText, phraseLength in phrases.items():
+                phraseID = self.phraseIDs.get(phraseText)
+                if phraseID is None:
+                    missing[phraseText] = phraseLength
+                else:
+                    self.phraseIDs.move_to_end(phraseText)
+                    phraseIDs[phraseText] = phraseID
+            self.hits += len(phraseIDs)
+            self.misses += len(missing)
+
+        inserted = dict()
+        if missing:
+            """
+            Sorting the phrases makes concurrent ingesters lock the unique index entries in the
+            same order.
+            """
+            phraseTexts = sorted(missing.keys())
+            cur.execute('''
+                        WITH input AS (
+                            SELECT * FROM unnest(%s::varchar[], %s::smallint[]) AS i ("phrase_text", "phrase_length")),
+                        inserted AS (
+                            INSERT INTO phrase ("phrase_text", "phrase_length")
+                            SELECT "phrase_text", "phrase_length" FROM input
+                            ON CONFLICT ("phrase_text") DO NOTHING
+                            RETURNING "phrase_id", "phrase_text")
+                        SELECT "phrase_id", "phrase_text", true FROM inserted
+                        UNION ALL
+                        SELECT p."phrase_id", p."phrase_text", false FROM phrase p JOIN input USING ("phrase_text")
+                        ''', (phraseTexts, [missing[phraseText] for phraseText in phraseTexts]))
+            known = []
+            for phraseID, phraseText, isNew in cur.fetchall():
+                phraseIDs[phraseText] = phraseID
+                if isNew:
+                    inserted[phraseText] = phraseID
+                else:
+                    known.append((phraseText, phraseID))
+
+            """
+            A phrase inserted by a concurrent ingester that committed after the statement started
+            is neither inserted nor visible to the statement. It is visible to a new statement.
+            """
+            unresolved = [phraseText for phraseText in phraseTexts if phraseText not in phraseIDs]
+            if unresolved:
+                cur.execute('''SELECT "phrase_id", "phrase_text" FROM phrase WHERE "phrase_text" = ANY(%s);''',
+                            (unresolved,))
+                for phraseID, phraseText in cur.fetchall():
+                    phraseIDs[phraseText] = phraseID
+                    known.append((phraseText, phraseID))
+
+            self.remember(dict(known))
+
+        return phraseIDs, inserted
+
+    def remember(self, phraseIDs):
+
+        """
+        Add {phrase text: phrase ID} entries to the dictionary, dropping the least recently
+        used phrases beyond --capacity--.
+        """
+        with self.lock:
+            for phraseText, phraseID in phraseIDs.items():
+                self.phraseIDs[phraseText] = phraseID
+                self.phraseIDs.move_to_end(phraseText)
+            while len(self.phraseIDs) > self.capacity:
+                self.phraseIDs.popitem(last=False)
+
+    def forget(self, phraseTexts):
+
+        """
+        Remove phrases deleted from the phrase table.
+        """
+        with self.lock:
+            for phraseText in phraseTexts:
+                self.phraseIDs.pop(phraseText, None)
+
+    def __str__(self):
+
+        return "I am the PhraseResolver class"
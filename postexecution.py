@@ -7,10 +7,16 @@ Created on Tue Oct 23 08:37:16 2018
 ANALYZE THE DATA in context table, document table, phrase table, phrase origin table and
 phrase meaning table.
 Calculate the phrase vector space and distances between phrase-context and phrase-phrase.
+
+Usage: python postexecution.py [stage ...]
+    - stage: name of a WordVectorSpace stage to run, for instance updateSharedWord (see stageRunner.py).
+    Without stage, the stages whose inputs changed since their last run are run.
 """
 
 
+import sys
 import config
 from contextionaryAnalytics import WordVectorSpace
 
-phraseSpace = WordVectorSpace(config.PARSE['distancePercentile'], config.PARSE['bondingIndexPercentile'])
+phraseSpace = WordVectorSpace(config.PARSE['distancePercentile'], config.PARSE['bondingIndexPercentile'],
+                              sys.argv[1:] or None)
@@ -5,15 +5,9 @@ Created on Tue Jun  5 21:41:59 2018
 @author: seniortasse
 """
 
-import config
 import time
-from psycopg2 import connect 
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT 
-
-con = connect(dbname=config.DATABASE['dbname'],
-              user=config.DATABASE['user'],
-              password=config.DATABASE['password'])
-con.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+from databaseTools import connection
+from matrixFiles import load_matrix
 
 
 class TextComprehension(object):
@@ -39,12 +33,25 @@ class TextComprehension(object):
         
     def findContext(self):
         
+        """
+        Each call checks out its own connection of the shared pool so that concurrent
+        API requests do not share a cursor.
+        """
+        with connection() as con:
+            return self.weighContexts(con)
+
+    def weighContexts(self, con):
+
         import numpy as np
         #from numpy import genfromtxt
 
         start_time = time.time()
         #phraseWeightByContextMatrix = np.genfromtxt('phraseWeightByContextMatrix.csv', delimiter=',')
-        phraseWeightByContextMatrix=np.load('phraseWeightByContextMatrix.npy')
+        """
+        The matrix file is mapped in memory instead of being read: only the lines of the phrases
+        of the text are read from the disk. load_matrix checks the header of the file (see matrixFiles.py).
+        """
+        phraseWeightByContextMatrix=load_matrix('phraseWeightByContextMatrix')
         end_time = time.time()
         print("time to read from phrase weight matrix csv file: %s" % (str(end_time - start_time)))
         print("")
@@ -65,8 +72,8 @@ class TextComprehension(object):
                 
                 cur.execute(""" SELECT "phrase_index" FROM phrase WHERE "phrase_text" = %s; """, ([phrase]))
                 phrase_index = cur.fetchall()
-                if phrase_index:
-                    phraseCountArray[phrase_index]=self.phraseCount[phraseLength][phrase]
+                if phrase_index and phrase_index[0][0] is not None:
+                    phraseCountArray[phrase_index[0][0]]=self.phraseCount[phraseLength][phrase]
                     #print("phrase: %s, count: %s" %(phrase,self.phraseCount[phraseLength][phrase]))
         end_time = time.time()
         print("time to execute for loop and get phrase_index from table phrase: %s" % (str(end_time - start_time)))
@@ -74,7 +81,8 @@ class TextComprehension(object):
         #print("input text phrase count")
         #print(phraseCountArray)
         
-        textWeights=np.dot(phraseWeightByContextMatrix.transpose(),phraseCountArray.transpose())
+        phraseRows=np.flatnonzero(phraseCountArray)
+        textWeights=np.dot(phraseWeightByContextMatrix[phraseRows].transpose(),phraseCountArray[phraseRows].transpose())
         print("")
         #print("input text weights by context. Total independent context is %s" %len(textWeights))
         #print(textWeights)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Tokenizer backend of TextProcessor built on precompiled regular expressions
+(config.PARSE['tokenizer'] = 'regex').
+
+sent_tokenize and word_tokenize have the same interface as their NLTK counterparts:
+    - sent_tokenize splits a text into sentences after the tokens that end with '.', '?' or '!'
+    (possibly followed by closing quotes or brackets), except after a known abbreviation.
+    An ellipsis only ends a sentence when the next word is capitalized. This is the first pass
+    of the Punkt algorithm used by NLTK, with a fixed list of abbreviations instead of
+    the trained Punkt parameters.
+    - word_tokenize applies the rules of the NLTK Treebank word tokenizer to a sentence.
+    The rules that only isolate a character or a group of characters are merged into two
+    regular expressions and the sentence is not split into sentences again.
+Both differ from NLTK on some edge cases. tokenizerEquivalence.py compares the two backends
+on the library.
+"""
+import re
+
+
+ABBREVIATIONS = {'mr', 'mrs', 'ms', 'dr', 'prof', 'sr', 'jr', 'st', 'mt', 'ft', 'vs', 'etc', 'e.g', 'i.e',
+                 'cf', 'al', 'approx', 'dept', 'est', 'fig', 'figs', 'inc', 'ltd', 'co', 'corp', 'no', 'nos',
+                 'vol', 'vols', 'pp', 'ed', 'eds', 'gen', 'gov', 'sen', 'rep', 'rev', 'capt', 'col', 'lt',
+                 'sgt', 'u.s', 'u.k', 'u.n', 'a.m', 'p.m', 'jan', 'feb', 'mar', 'apr', 'jun', 'jul', 'aug',
+                 'sep', 'sept', 'oct', 'nov', 'dec', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun'}
+
+SENTENCE_END = re.compile(r'''(?<!\S)(\S*?)(\.{2,}|[.?!]+)(["')\]}'»”’]*)(?=\s|$)''')
+NEXT_WORD = re.compile(r'\s*(\S?)')
+
+QUOTE_AT_START = re.compile(r"^\"")
+OPENING_DOUBLE_QUOTE = re.compile(r"([ \(\[{<])(\"|\'{2})")
+STARTING_QUOTE = re.compile(r"(?i)(?<!\w)(\')(?!(?:re|ve|ll|m|t|s|d|n)\b)(?=\w)")
+ISOLATED = re.compile('[«“‘„;@#$%&?!‒-―]|`+|\\.{2,}')
+ISOLATED_AFTER_QUOTES = re.compile('[*\\[\\](){}<>»”’"]|--|\'\'')
+FINAL_PERIOD = re.compile(r'([^\.])(\.)([\]\)}>"\'' "»”’ " r"]*)\s*$")
+COMMA_COLON = re.compile(r"([:,])([^\d])")
+FINAL_COMMA_COLON = re.compile(r"([:,])$")
+CLOSING_QUOTE = re.compile(r"([^'])' ")
+SPACES = re.compile(r"\s+")
+CLITICS = [re.compile(r"([^' ])('[sS]|'[mM]|'[dD]|') "),
+           re.compile(r"([^' ])('ll|'LL|'re|'RE|'ve|'VE|n't|N'T) ")]
+CONTRACTIONS = [re.compile(pattern) for pattern in
+                [r"(?i)\b(can)(not)\b", r"(?i)\b(d)('ye)\b", r"(?i)\b(gim)(me)\b", r"(?i)\b(gon)(na)\b",
+                 r"(?i)\b(got)(ta)\b", r"(?i)\b(lem)(me)\b", r"(?i)\b(more)('n)\b", r"(?i)\b(wan)(na)(?=\s)",
+                 r"(?i) ('t)(is)\b", r"(?i) ('t)(was)\b"]]
+CONTRACTION_HINT = re.compile(r"(?i)\b(?:cannot|d'ye|gimme|gonna|gotta|lemme|more'n|wanna)\b|'t(?:is|was)\b")
+SPECIAL = re.compile(r"[^\w\s.-]|--|\.(?!\s*$)")
+
+
+def sent_tokenize(text):
+    """
+    Return the list of the sentences of --text--.
+    """
+    sentences = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        word, end = match.group(1), match.group(2)
+        if end == '.':
+            word = word.lower()
+            if word in ABBREVIATIONS or word.split('-')[-1] in ABBREVIATIONS:
+                continue
+        elif end.startswith('..'):
+            if not NEXT_WORD.match(text, match.end()).group(1).isupper():
+                continue
+
+        sentence = text[start:match.end()].strip()
+        if sentence:
+            sentences.append(sentence)
+        start = match.end()
+
+    sentence = text[start:].strip()
+    if sentence:
+        sentences.append(sentence)
+
+    return sentences
+
+
+def word_tokenize(sentence):
+    """
+    Return the list of the tokens of --sentence--.
+    Most sentences only contain words, spaces, hyphens and a final period: none of the rules but
+    the final period and the contractions apply to them, the other rules are skipped.
+    """
+    if not SPECIAL.search(sentence):
+        text = sentence.rstrip()
+        if text.endswith('.') and len(text) > 1:
+            text = text[:-1] + ' . '
+        if CONTRACTION_HINT.search(text):
+            text = " " + text + " "
+            for regexp in CONTRACTIONS:
+                text = regexp.sub(r" \1 \2 ", text)
+        return text.split()
+
+    text = QUOTE_AT_START.sub(r"``", sentence)
+    text = OPENING_DOUBLE_QUOTE.sub(r"\1 `` ", text)
+    text = STARTING_QUOTE.sub(r"\1 ", text)
+    text = FINAL_PERIOD.sub(r"\1 \2 \3 ", text)
+    text = COMMA_COLON.sub(r" \1 \2", text)
+    text = FINAL_COMMA_COLON.sub(r" \1 ", text)
+    text = ISOLATED.sub(r" \g<0> ", text)
+    text = CLOSING_QUOTE.sub(r"\1 ' ", text)
+    text = ISOLATED_AFTER_QUOTES.sub(r" \g<0> ", text)
+
+    text = SPACES.sub(" ", " " + text + " ")
+    for regexp in CLITICS:
+        text = regexp.sub(r"\1 \2 ", text)
+
+    if CONTRACTION_HINT.search(text):
+        for regexp in CONTRACTIONS:
+            text = regexp.sub(r" \1 \2 ", text)
+
+    return text.split()
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Spelling similarity engine of WordVectorSpace.updatePhraseSpellingSimilarity (contextionaryAnalytics.py).
+
+Two texts are similar when their Levenshtein distance is at most a small threshold k (3 for the phrases).
+Instead of computing the distance of every pair of texts, similar_pairs only verifies candidate pairs:
+    - a text r is split into k+1 segments. When the distance between r and s is at most k, at most k
+    segments of r are modified by the edits, so at least one segment of r is found unchanged in s, shifted
+    by at most k characters (pigeonhole principle)
+    - the segments of the texts are indexed by (text length, segment number, segment). The candidates of s
+    are the indexed texts with one of their segments found in s at its position +/- k, among the texts whose
+    length differs by at most k from the length of s
+    - each candidate is verified with bounded_levenshtein, a Levenshtein distance limited to the band of the
+    k diagonals around the main diagonal, which stops as soon as the distance exceeds k
+The texts are indexed by increasing length, so that each pair of texts is verified once.
+similar_pairs returns exactly the pairs whose full Levenshtein distance is at most k, with that distance.
+"""
+
+
+def bounded_levenshtein(s, t, maxDistance):
+    """
+    Return the Levenshtein distance between the strings --s-- and --t-- when it is at most --maxDistance--,
+    None otherwise.
+    """
+    if abs(len(s) - len(t)) > maxDistance:
+        return None
+    if len(s) > len(t):
+        s, t = t, s
+
+    """
+    The common prefix and the common suffix of the strings do not change their distance.
+    """
+    prefix = 0
+    while prefix < len(s) and s[prefix] == t[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < len(s) - prefix and s[-1 - suffix] == t[-1 - suffix]:
+        suffix += 1
+    s = s[prefix:len(s) - suffix]
+    t = t[prefix:len(t) - suffix]
+    if not s:
+        return len(t)
+
+    """
+    Only the cells (i, j) with |i - j| <= maxDistance are computed: the other cells are above maxDistance.
+    --outside-- stands for any value above maxDistance.
+    """
+    outside = maxDistance + 1
+    previous = list(range(len(t) + 1))
+    for i in range(1, len(s) + 1):
+        start = max(1, i - maxDistance)
+        end = min(len(t), i + maxDistance)
+        current = [outside] * (len(t) + 1)
+        if start == 1:
+            current[0] = i
+        character = s[i - 1]
+        rowMinimum = current[0] if start == 1 else outside
+        for j in range(start, end + 1):
+            cost = 0 if character == t[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if value > outside:
+                value = outside
+            current[j] = value
+            if value < rowMinimum:
+                rowMinimum = value
+        if rowMinimum > maxDistance:
+            return None
+        previous = current
+
+    distance = previous[len(t)]
+    return distance if distance <= maxDistance else None
+
+
+def segments(length, count):
+    """
+    Return the (start, length) of the --count-- segments of a text of --length-- characters: the last
+    length % count segments are one character longer than the first ones.
+    """
+    shortLength, longSegments = divmod(length, count)
+    result = []
+    start = 0
+    for number in range(count):
+        segmentLength = shortLength + (1 if number >= count - longSegments else 0)
+        result.append((start, segmentLength))
+        start += segmentLength
+    return result
+
+
+def similar_pairs(texts, maxDistance):
+    """
+    Return the list of the (i, j, distance) such that i < j and the Levenshtein distance between texts[i]
+    and texts[j] is at most --maxDistance--.
+    """
+    count = maxDistance + 1
+    order = sorted(range(len(texts)), key=lambda index: len(texts[index]))
+
+    """
+    --segmentIndex-- is the index {(text length, segment number, segment): indexed texts}.
+    A text of less than maxDistance+1 characters has empty segments and is a candidate of any text whose
+    length differs by at most maxDistance from its length: such texts are kept in --shortTexts-- instead.
+    """
+    segmentIndex = dict()
+    shortTexts = []
+    pairs = []
+    for index in order:
+        text = texts[index]
+        length = len(text)
+
+        candidates = set(other for other in shortTexts if length - len(texts[other]) <= maxDistance)
+        for otherLength in range(max(count, length - maxDistance), length + 1):
+            difference = length - otherLength
+            for number, (start, segmentLength) in enumerate(segments(otherLength, count)):
+                first = max(0, start - number, start + difference - (maxDistance - number))
+                last = min(length - segmentLength, start + number, start + difference + (maxDistance - number))
+                for position in range(first, last + 1):
+                    candidates.update(segmentIndex.get((otherLength, number, text[position:position + segmentLength]), ()))
+
+        for other in candidates:
+            distance = bounded_levenshtein(texts[other], text, maxDistance)
+            if distance is not None:
+                pairs.append((min(index, other), max(index, other), distance))
+
+        if length < count:
+            shortTexts.append(index)
+        else:
+            for number, (start, segmentLength) in enumerate(segments(length, count)):
+                segmentIndex.setdefault((length, number, text[start:start + segmentLength]), []).append(index)
+
+    return pairs
@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+"""
+Stage runner of WordVectorSpace (contextionaryAnalytics.py).
+
+Each stage of WordVectorSpace is declared in STAGES with the stages whose outputs it uses and the
+artifacts holding its in-memory outputs (matrices, boundaries, lexical sets), which the runner saves
+in the folder config.PARSE['matrixFolder'] with matrixFiles once the stage is done:
+    - createContextDictionary and createPhraseDictionary load the contexts and the phrases from the
+    database. They are always run: every other stage works on the objects they build. Their fingerprint
+    is the hash of what they loaded (context tree, phrase indexes, phrase counts and documents), so that
+    it only changes when the ingested data change
+    - the fingerprint of another stage is the hash of its name, of the parameters of WordVectorSpace
+    and of the fingerprints of the stages it uses
+A stage whose fingerprint is the one recorded after its last run (analyticsStages.json) is up to date:
+it is skipped and its artifacts are loaded instead. The record of a stage is removed when it starts, so
+that a stage interrupted by a crash is run again. The stages that are run go through a pool of
+config.PARSE['stageWorkers'] threads, a stage starting as soon as the stages it uses are done: for
+instance the spelling similarities and the shared words are computed at the same time.
+
+Usage from postexecution.py: python postexecution.py [stage ...]. The stages given are run even when
+they are up to date, with the stages they use that are not up to date. Without stage, every stage
+that is not up to date is run.
+
+After a run where every stage is up to date, the runner records the phrase of each line of the matrices
+(phraseIDs artifact) and the last change of the analytics change log written by the ingest. When only phrase
+counts changed since then, the next run without stage is an incremental refresh: the REFRESH_STAGES update
+the outputs of that run for the phrases and the contexts that changed instead of building them again (see
+incrementalRefresh.py). The other stages that are not up to date are run as usual.
+"""
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+import config
+import matrixFiles
+from databaseTools import checkout, release
+from incrementalRefresh import IncrementalRefresh, changed_cells, last_change, purge_changes
+
+
+"""
+(stage, stages whose outputs it uses, artifacts of its outputs) in the order of WordVectorSpace.__init__
+"""
+STAGES = [('createContextDictionary', [], []),
+          ('createPhraseDictionary', ['createContextDictionary'], []),
+          ('buildPhraseVectorSpaceMatrix', ['createPhraseDictionary'], ['phraseVectorSpaceMatrix']),
+          ('buildContextAxisMatrix', ['createContextDictionary'], ['contextAxisMatrix']),
+          ('buildDistanceToContextMatrix', ['buildPhraseVectorSpaceMatrix', 'buildContextAxisMatrix'],
+           ['distanceToContextMatrix', 'contextLexicalSetBoundaries']),
+          ('createContextLexicalSet', ['buildDistanceToContextMatrix'],
+           ['contextLexicalSetIndexes', 'contextLexicalSetDistances']),
+          ('createPhraseLexicalSet', ['createContextLexicalSet'],
+           ['phraseLexicalSetBoundaries', 'phraseLexicalSetLines', 'phraseLexicalSetIndexes',
+            'phraseLexicalSetBondingIndexes']),
+          ('buildPhraseWeightByContextMatrix', ['buildPhraseVectorSpaceMatrix', 'createContextLexicalSet'],
+           ['phraseWeightByContextMatrix']),
+          ('updateSharedWord', ['createContextLexicalSet'], []),
+          ('updateContextSpellingSimilarity', ['createContextDictionary'], []),
+          ('updatePhraseSpellingSimilarity', ['createContextLexicalSet'], []),
+          ('updateFrequencyDistanceTable', ['buildDistanceToContextMatrix', 'createContextLexicalSet'], [])]
+
+LOAD_STAGES = ['createContextDictionary', 'createPhraseDictionary']
+
+REFRESH_STAGES = ['buildPhraseVectorSpaceMatrix', 'buildDistanceToContextMatrix', 'createContextLexicalSet']
+
+
+def stage_names():
+
+    return [stage for stage, inputs, artifacts in STAGES]
+
+
+def fingerprint(*values):
+    """
+    Return the SHA-1 of --values--: arrays are hashed with their dtype and shape, other values as JSON.
+    """
+    digest = hashlib.sha1()
+    for value in values:
+        if isinstance(value, np.ndarray):
+            value = np.ascontiguousarray(value)
+            digest.update(json.dumps([value.dtype.str, value.shape]).encode("UTF-8"))
+            digest.update(value.tobytes())
+        else:
+            digest.update(json.dumps(value, sort_keys=True, default=str).encode("UTF-8"))
+    return digest.hexdigest()
+
+
+class StageRunner(object):
+
+    def __init__(self, wordVectorSpace, workers=None):
+
+        """
+        NOTE:
+            - wordVectorSpace: the WordVectorSpace object whose stages are run
+            - workers: threads running the stages, config.PARSE['stageWorkers'] by default
+        """
+        self.wordVectorSpace = wordVectorSpace
+        self.workers = workers or config.PARSE['stageWorkers']
+        self.inputs = {stage: inputs for stage, inputs, artifacts in STAGES}
+        self.artifacts = {stage: artifacts for stage, inputs, artifacts in STAGES}
+        self.fingerprints = dict()
+        self.refresh = None
+        self.statePath = matrixFiles.matrix_path('analyticsStages', '.json')
+        self.state = dict()
+        if os.path.exists(self.statePath):
+            with open(self.statePath, encoding="UTF-8") as stateFile:
+                self.state = json.load(stateFile)
+
+    def run(self, stages=None):
+
+        """
+        Run the --stages-- (names of STAGES) and the stages they use which are not up to date, or all the
+        stages which are not up to date when --stages-- is None. Return the list of the stages run.
+        """
+        names = stage_names()
+        for stage in stages or []:
+            if stage not in names:
+                raise ValueError("unknown stage %s, the stages are: %s" % (stage, ", ".join(names)))
+
+        """
+        The stages needed are the stages asked for and, recursively, the stages they use.
+        """
+        needed = set()
+        pending = list(stages or names)
+        while pending:
+            stage = pending.pop()
+            if stage not in needed:
+                needed.add(stage)
+                pending.extend(self.inputs[stage])
+
+        """
+        The last change of the change log is read before the data are loaded: the changes logged during the
+        load are taken into account again by the next run.
+        """
+        lastChange = last_change(checkout().cursor())
+        for stage in LOAD_STAGES:
+            self.runStage(stage)
+            self.fingerprints[stage] = self.loadFingerprint(stage)
+
+        toRun = []
+        for stage in names:
+            if stage in LOAD_STAGES or stage not in needed:
+                continue
+            self.fingerprints[stage] = fingerprint(stage, self.parameters(),
+                                                   [self.fingerprints[input] for input in self.inputs[stage]])
+            if (stages and stage in stages) or not self.isUpToDate(stage):
+                toRun.append(stage)
+
+        if toRun:
+            self.refresh = self.incrementalRefresh(stages, lastChange)
+            self.forget('build')
+
+        """
+        The artifacts of the stages skipped are loaded before any stage runs.
+        """
+        for stage in names:
+            if stage in needed and stage not in LOAD_STAGES and stage not in toRun:
+                print("%s is up to date: load %s" % (stage, ", ".join(self.artifacts[stage]) or "nothing"))
+                self.loadArtifacts(stage)
+
+        self.runStages(toRun)
+        if needed == set(names) and all(self.isUpToDate(stage) for stage in names if stage not in LOAD_STAGES):
+            self.recordBuild(lastChange)
+        return toRun
+
+    def incrementalRefresh(self, stages, lastChange):
+
+        """
+        Return the IncrementalRefresh of this run, None when the stages are built again: stages given, no
+        change log, no complete run recorded, contexts or parameters changed since that run, or dirty phrases
+        above config.PARSE['refreshDirtyFraction'] of the phrases.
+        """
+        build = self.state.get('build')
+        if stages or not config.PARSE['refreshDirtyFraction'] or lastChange is None or build is None:
+            return None
+        if build['createContextDictionary'] != self.fingerprints['createContextDictionary'] or \
+                build['lastChange'] > lastChange or \
+                not all(os.path.exists(matrixFiles.matrix_path(artifact))
+                        for artifact in ['phraseIDs'] + [artifact for stage in REFRESH_STAGES for artifact in self.artifacts[stage]]):
+            return None
+
+        cur = checkout().cursor()
+        refresh = IncrementalRefresh(self.wordVectorSpace, matrixFiles.load_matrix('phraseIDs'),
+                                     changed_cells(cur, build['lastChange'], lastChange), cur)
+        if refresh.dirtyFraction() > config.PARSE['refreshDirtyFraction']:
+            print("%.1f%% of the phrases changed: the stages are built again" % (100 * refresh.dirtyFraction()))
+            return None
+        print("incremental refresh: %.1f%% of the phrases changed" % (100 * refresh.dirtyFraction()))
+        return refresh
+
+    def recordBuild(self, lastChange):
+
+        """
+        Record the outputs of the stages as the previous run of the next incremental refresh: the phrase of each
+        line of the matrices and the last change of the change log they include. The changes up to that change
+        are deleted from the log.
+        """
+        matrixFiles.save_matrix('phraseIDs', self.phraseIDs(), lines='phrase_index')
+        self.state['build'] = {'lastChange': lastChange,
+                               'createContextDictionary': self.fingerprints['createContextDictionary']}
+        self.saveState()
+        if lastChange is not None:
+            purge_changes(checkout().cursor(), lastChange)
+
+    def runStages(self, stages):
+
+        """
+        Run --stages-- in a pool of threads, each stage being submitted once the stages it uses are done.
+        The artifacts and the record of a stage are saved by this thread when the stage is done.
+        """
+        remaining = list(stages)
+        running = dict()
+        with ThreadPoolExecutor(max(1, self.workers)) as executor:
+            while remaining or running:
+                for stage in list(remaining):
+                    if not any(input in remaining or input in running.values() for input in self.inputs[stage]):
+                        remaining.remove(stage)
+                        self.forget(stage)
+                        running[executor.submit(self.runStage, stage)] = stage
+                        if self.workers <= 1:
+                            break
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    future.result()
+                    self.saveArtifacts(stage)
+                    self.record(stage)
+
+    def runStage(self, stage):
+
+        print("%s...." % stage)
+        try:
+            if self.refresh is not None and stage in REFRESH_STAGES:
+                getattr(self.wordVectorSpace, stage)(self.refresh)
+            else:
+                getattr(self.wordVectorSpace, stage)()
+        finally:
+            release()
+
+    def parameters(self):
+
+        return [self.wordVectorSpace.distancePercentile, self.wordVectorSpace.bondingIndexPercentile,
+                config.PARSE['distanceDtype']]
+
+    def phraseIDs(self):
+
+        """
+        Phrase ID of each line (phrase index) of the matrices.
+        """
+        phraseIDs = np.zeros(len(self.wordVectorSpace.phrases), dtype=np.int64)
+        for phraseID, phrase in self.wordVectorSpace.phrases.items():
+            phraseIDs[phrase.getIndex()] = phraseID
+        return phraseIDs
+
+    def loadFingerprint(self, stage):
+
+        """
+        Fingerprint of the contexts or the phrases loaded by the stage --stage--.
+        """
+        space = self.wordVectorSpace
+        if stage == 'createContextDictionary':
+            return fingerprint(self.parameters(),
+                               sorted([contextID, context.getName(), context.getRCIndex(), context.getICIndex(),
+                                       list(context.getAncestorsID()), context.isIndependent()]
+                                      for contextID, context in space.contexts.items()))
+        return fingerprint(self.fingerprints['createContextDictionary'], self.phraseIDs(),
+                           space.phraseCountPerContextMatrix.indptr, space.phraseCountPerContextMatrix.indices,
+                           space.phraseCountPerContextMatrix.data, space.phraseDocumentMatrix.indptr,
+                           space.phraseDocumentMatrix.indices, space.documentRCIndex,
+                           space.contextSubtree.indptr, space.contextSubtree.indices)
+
+    def isUpToDate(self, stage):
+
+        return self.state.get(stage) == self.fingerprints[stage] and \
+            all(os.path.exists(matrixFiles.matrix_path(artifact)) for artifact in self.artifacts[stage])
+
+    def forget(self, stage):
+
+        self.state.pop(stage, None)
+        self.saveState()
+
+    def record(self, stage):
+
+        self.state[stage] = self.fingerprints[stage]
+        self.saveState()
+
+    def saveState(self):
+
+        os.makedirs(os.path.dirname(self.statePath) or '.', exist_ok=True)
+        with open(self.statePath + '.tmp', 'w', encoding="UTF-8") as stateFile:
+            json.dump(self.state, stateFile, indent=1)
+        os.replace(self.statePath + '.tmp', self.statePath)
+
+    """
+    saveArtifacts and loadArtifacts convert the in-memory outputs of a stage into arrays and back:
+        - the lexical set boundaries of the contexts by RCIndex
+        - the lexical sets of the contexts as the lines (RCIndex, phrase index) and the distances, in the order
+        of the contexts and of their lexical sets
+        - the lexical set boundaries of the phrases by phrase index, the phrases with lexical sets by context and
+        these lexical sets as the lines (phrase index, RCIndex, related phrase index) and the bonding indexes
+    """
+    def saveArtifacts(self, stage):
+
+        space = self.wordVectorSpace
+        if stage == 'buildPhraseVectorSpaceMatrix':
+            matrixFiles.save_matrix('phraseVectorSpaceMatrix', space.phraseVectorSpaceMatrix, lines='phrase_index', columns='icindex')
+        elif stage == 'buildContextAxisMatrix':
+            matrixFiles.save_matrix('contextAxisMatrix', space.contextAxisMatrix, lines='context', columns='icindex')
+        elif stage == 'buildDistanceToContextMatrix':
+            matrixFiles.save_matrix('distanceToContextMatrix', space.distanceToContextMatrix, lines='phrase_index', columns='rcindex')
+            boundaries = np.zeros(len(space.contexts))
+            for context in space.contexts.values():
+                boundaries[context.getRCIndex()] = context.getLexicalSetBoundary()
+            matrixFiles.save_matrix('contextLexicalSetBoundaries', boundaries, lines='rcindex')
+        elif stage == 'createContextLexicalSet':
+            indexes = [(context.getRCIndex(), phrase.getIndex())
+                       for context in space.contexts.values() for phrase in context.getLexicalSet().keys()]
+            distances = [distance for context in space.contexts.values() for distance in context.getLexicalSet().values()]
+            matrixFiles.save_matrix('contextLexicalSetIndexes', np.array(indexes, dtype=np.int64).reshape(-1, 2),
+                                    columns=['rcindex', 'phrase_index'])
+            matrixFiles.save_matrix('contextLexicalSetDistances', np.array(distances, dtype=np.float64))
+        elif stage == 'createPhraseLexicalSet':
+            boundaries = np.zeros(len(space.phrases))
+            lines = []
+            indexes = []
+            bondingIndexes = []
+            for phrase in space.phrases.values():
+                boundaries[phrase.getIndex()] = phrase.getLexicalSetBoundary()
+                if phrase.getLexicalSetByContext() is not None:
+                    lines.append(phrase.getIndex())
+                for RCIndex, lexicalSet in enumerate(phrase.getLexicalSetByContext() or []):
+                    for relatedPhrase, bondingIndex in lexicalSet.items():
+                        indexes.append((phrase.getIndex(), RCIndex, relatedPhrase.getIndex()))
+                        bondingIndexes.append(bondingIndex)
+            matrixFiles.save_matrix('phraseLexicalSetBoundaries', boundaries, lines='phrase_index')
+            matrixFiles.save_matrix('phraseLexicalSetLines', np.array(lines, dtype=np.int64))
+            matrixFiles.save_matrix('phraseLexicalSetIndexes', np.array(indexes, dtype=np.int64).reshape(-1, 3),
+                                    columns=['phrase_index', 'rcindex', 'phrase_index'])
+            matrixFiles.save_matrix('phraseLexicalSetBondingIndexes', np.array(bondingIndexes, dtype=np.float64))
+        elif stage == 'buildPhraseWeightByContextMatrix':
+            matrixFiles.save_matrix('phraseWeightByContextMatrix', space.phraseWeightByContextMatrix, lines='phrase_index', columns='rcindex')
+
+    def loadArtifacts(self, stage):
+
+        space = self.wordVectorSpace
+        contextsByRCIndex = {context.getRCIndex(): context for context in space.contexts.values()}
+        phrasesByIndex = {phrase.getIndex(): phrase for phrase in space.phrases.values()}
+        if stage == 'buildPhraseVectorSpaceMatrix':
+            space.phraseVectorSpaceMatrix = matrixFiles.load_matrix('phraseVectorSpaceMatrix')
+        elif stage == 'buildContextAxisMatrix':
+            space.contextAxisMatrix = matrixFiles.load_matrix('contextAxisMatrix')
+        elif stage == 'buildDistanceToContextMatrix':
+            space.distanceToContextMatrix = matrixFiles.load_matrix('distanceToContextMatrix')
+            boundaries = matrixFiles.load_matrix('contextLexicalSetBoundaries')
+            for RCIndex, context in contextsByRCIndex.items():
+                context.setLexicalSetBoundary(boundaries[RCIndex])
+        elif stage == 'createContextLexicalSet':
+            for context in space.contexts.values():
+                context.setLexicalSet(dict())
+            indexes = matrixFiles.load_matrix('contextLexicalSetIndexes').tolist()
+            distances = matrixFiles.load_matrix('contextLexicalSetDistances')
+            for (RCIndex, index), distance in zip(indexes, distances):
+                contextsByRCIndex[RCIndex].updateLexicalSet(phrasesByIndex[index], distance)
+        elif stage == 'createPhraseLexicalSet':
+            boundaries = matrixFiles.load_matrix('phraseLexicalSetBoundaries')
+            for index, phrase in phrasesByIndex.items():
+                phrase.setLexicalSetBoundary(boundaries[index])
+            for index in matrixFiles.load_matrix('phraseLexicalSetLines').tolist():
+                phrasesByIndex[index].initializeLexicalSetByContext(len(space.contexts))
+            lexicalSets = dict()
+            indexes = matrixFiles.load_matrix('phraseLexicalSetIndexes').tolist()
+            bondingIndexes = matrixFiles.load_matrix('phraseLexicalSetBondingIndexes').tolist()
+            for (index, RCIndex, relatedIndex), bondingIndex in zip(indexes, bondingIndexes):
+                lexicalSets.setdefault((index, RCIndex), dict())[phrasesByIndex[relatedIndex]] = bondingIndex
+            for (index, RCIndex), lexicalSet in lexicalSets.items():
+                phrasesByIndex[index].updateLexicalSetByContext(lexicalSet, RCIndex)
+        elif stage == 'buildPhraseWeightByContextMatrix':
+            space.phraseWeightByContextMatrix = matrixFiles.load_matrix('phraseWeightByContextMatrix')
+
+    def __str__(self):
+
+        return "I am the StageRunner class"
@@ -4,15 +4,28 @@ Created on Tue Jun  5 22:05:28 2018
 
 @author: seniortasse
 """
+import re
+
+
+"""
+A word is only kept when it contains letters, digits, - and _ only and does not start or
+end with - or _.
+"""
+WORD = re.compile(r"^[A-Za-z0-9_-]*$")
 
 
 class TextProcessor(object):
 
-    def __init__(self, text, phraseMaxLength):
+    def __init__(self, text, phraseMaxLength, engine=None, tokenizer=None):
+
+        import config
 
         self.text = text
         self.phraseMaxLength = phraseMaxLength
+        self.engine = engine or config.PARSE['ngramEngine']
+        self.tokenizer = tokenizer or config.PARSE['tokenizer']
         self.clauses = []
+        self.clauseWords = []
         self.phraseCount = dict()
         self.wordOrderedList = []
         self.size = dict()
@@ -54,8 +67,12 @@ class TextProcessor(object):
         """
         A very useful tool of Python is the sentence tokenizer that splits
         a text into its various sentences and save them into a list of sentences.
+        The tokenizer is the one of NLTK or the faster regexTokenizer, see config.PARSE['tokenizer'].
         """
-        from nltk.tokenize import sent_tokenize
+        if self.tokenizer == 'regex':
+            from regexTokenizer import sent_tokenize
+        else:
+            from nltk.tokenize import sent_tokenize
         self.clauses = sent_tokenize(modifiedText)
 
     def breakClausesIntoPhrases(self):
@@ -66,17 +83,10 @@ class TextProcessor(object):
         The list of words will be stored into --wordSplit-- variable.
         """
     
-        from nltk.tokenize import word_tokenize
-        import re
-        
-        """
-        We define a dictionary {phraselength:phrases} that will store for each
-        phraselength the list of phrases that have that length.
-        """
-        phraseSplit = dict()
-        
-        for length in range(1, self.phraseMaxLength+1):
-             phraseSplit.update({length: []})
+        if self.tokenizer == 'regex':
+            from regexTokenizer import word_tokenize
+        else:
+            from nltk.tokenize import word_tokenize
 
         """
         We now look at each of the clauses one by one.
@@ -90,7 +100,7 @@ class TextProcessor(object):
             
             wordSplit = word_tokenize(clause)
 
-            wordSplit = [w for w in wordSplit if re.match("^[A-Za-z0-9_-]*$", w) and not w.startswith('-') and not w.endswith('-') and not w.startswith('_') and not w.endswith('_')]
+            wordSplit = [w for w in wordSplit if WORD.match(w) and not w.startswith('-') and not w.endswith('-') and not w.startswith('_') and not w.endswith('_')]
 
             
         
@@ -111,10 +121,32 @@ class TextProcessor(object):
 
 
             self.wordOrderedList.extend(wordSplit)
-            
-            
-            from collections import Counter
-            
+            self.clauseWords.append(wordSplit)
+
+        """
+        The phrases of each length are then listed and counted by the engine selected with
+        config.PARSE['ngramEngine'].
+        """
+        if self.engine == 'numpy':
+            self.countPhrasesNumpy()
+        else:
+            self.countPhrasesPython()
+
+    def countPhrasesPython(self):
+
+        from collections import Counter
+
+        """
+        We define a dictionary {phraselength:phrases} that will store for each
+        phraselength the list of phrases that have that length.
+        """
+        phraseSplit = dict()
+
+        for length in range(1, self.phraseMaxLength+1):
+             phraseSplit.update({length: []})
+
+        for wordSplit in self.clauseWords:
+
             """
             We list for each phrase length all the phrases of the clause
             that have that length
@@ -169,6 +201,54 @@ class TextProcessor(object):
             counter.update(phraseSplit[length]) 
             self.phraseCount.update({length: dict(counter)})
 
+    def countPhrasesNumpy(self):
+
+        import numpy as np
+
+        """
+        Each distinct word gets an integer ID and the words of all the clauses are stored in one
+        ID array, the clauses being separated by -1.
+        The phrases of length n are the windows of n consecutive IDs that do not contain a separator.
+        A window is packed into a single int64 key (key(n) = key(n-1) * vocabulary size + ID), so that
+        the phrases of each length are counted with one np.unique. When the keys of a length would not
+        fit into an int64, the windows are counted as rows of IDs instead.
+        The words of the clauses only contain letters, digits, - and _, and never start or end with
+        - or _, so a phrase is always its words joined by spaces: the strings are only built once per
+        distinct phrase.
+        Phrases are listed in the order of their first occurrence in the text, as with Counter.
+        """
+        vocabulary = dict()
+        ids = []
+        for wordSplit in self.clauseWords:
+            for word in wordSplit:
+                ids.append(vocabulary.setdefault(word, len(vocabulary)))
+            ids.append(-1)
+        words = list(vocabulary.keys())
+        ids = np.array(ids, dtype=np.int64)
+        vocabularySize = max(len(words), 1)
+
+        keys = ids.copy()
+        valid = ids >= 0
+        for length in range(1, self.phraseMaxLength+1):
+            if length > 1:
+                keys = keys[:-1] * vocabularySize + ids[length-1:]
+                valid = valid[:-1] & (ids[length-1:] >= 0)
+
+            starts = np.flatnonzero(valid)
+            self.size.update({length: len(starts)})
+
+            if vocabularySize ** length <= np.iinfo(np.int64).max:
+                _, first, counts = np.unique(keys[starts], return_index=True, return_counts=True)
+            else:
+                windows = np.stack([ids[starts + l] for l in range(length)], axis=1)
+                _, first, counts = np.unique(windows, axis=0, return_index=True, return_counts=True)
+
+            order = np.argsort(first, kind='stable')
+            phraseCount = dict()
+            for start, count in zip(starts[first[order]].tolist(), counts[order].tolist()):
+                phraseCount[" ".join(words[w] for w in ids[start:start+length].tolist())] = count
+            self.phraseCount.update({length: phraseCount})
+
     def __str__(self):    
         
         return "I am the Document class"
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the phrase counting engines of TextProcessor (config.PARSE['ngramEngine']).
+
+Every document of the library is tokenized once, then its phrases are counted with both
+engines on the same clauses. The script checks that both engines return the same phrase counts,
+in the same order, and the same sizes, and prints the time spent by each engine.
+
+Usage: python textProcessingBenchmark.py [library folder] [repetitions] [scale]
+    - library folder: folder searched for .txt documents ('Context tree' by default)
+    - repetitions: number of times each engine counts the phrases of each document (5 by default)
+    - scale: each document is repeated --scale-- times to simulate larger documents (1 by default)
+"""
+import os
+import sys
+import time
+import config
+from textProcessing import TextProcessor
+
+
+def count(textProcessor, engine):
+    textProcessor.phraseCount = dict()
+    textProcessor.size = dict()
+    if engine == 'numpy':
+        textProcessor.countPhrasesNumpy()
+    else:
+        textProcessor.countPhrasesPython()
+    return [(length, list(phrases.items())) for length, phrases in textProcessor.phraseCount.items()], \
+        textProcessor.size
+
+
+def main(libraryFolderPath='Context tree', repetitions=5, scale=1):
+    filepaths = []
+    for root, dirs, files in os.walk(libraryFolderPath):
+        filepaths.extend(os.path.join(root, file) for file in files if file.endswith(".txt"))
+
+    timings = {'python': 0.0, 'numpy': 0.0}
+    phrases = 0
+    for filepath in sorted(filepaths):
+        file = open(filepath, "r", encoding="UTF-8-sig")
+        text = " ".join([file.read()] * scale)
+        file.close()
+
+        textProcessor = TextProcessor(text, config.PARSE['phraseLength'], 'python')
+
+        results = dict()
+        for engine in timings:
+            start_time = time.time()
+            for _ in range(repetitions):
+                results[engine] = count(textProcessor, engine)
+            timings[engine] += time.time() - start_time
+
+        if results['python'] != results['numpy']:
+            print("Different phrase counts for", filepath)
+            sys.exit(1)
+        phrases += sum(results['numpy'][1].values())
+
+    print("%s documents, %s phrases, %s repetitions" % (len(filepaths), phrases, repetitions))
+    for engine, timing in timings.items():
+        print("%s engine: %.3f seconds" % (engine, timing))
+    if timings['numpy'] > 0:
+        print("speedup: %.1fx" % (timings['python'] / timings['numpy']))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else 'Context tree',
+         int(sys.argv[2]) if len(sys.argv) > 2 else 5,
+         int(sys.argv[3]) if len(sys.argv) > 3 else 1)
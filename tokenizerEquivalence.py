@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Equivalence check of the tokenizer backends of TextProcessor (config.PARSE['tokenizer']).
+
+Every document of the library is processed with the NLTK tokenizer and with regexTokenizer.
+For each document, the script compares:
+    - the clauses
+    - the words kept in each clause, which are the only tokens used to build the phrases
+    - the phrase counts
+and prints the first difference found. It ends with the time spent by each backend to split
+the documents into clauses and the clauses into words, which is the hot path of TextProcessor.
+
+Usage: python tokenizerEquivalence.py [library folder] [repetitions]
+    - library folder: folder searched for .txt documents ('Context tree' by default)
+    - repetitions: number of times each document is tokenized by each backend for the timings (1 by default)
+"""
+import os
+import sys
+import time
+import config
+import regexTokenizer
+from textProcessing import TextProcessor
+
+
+def tokenize(text, tokenizer):
+    """
+    Split --text-- into clauses and words the way TextProcessor does.
+    """
+    if tokenizer == 'regex':
+        sent_tokenize, word_tokenize = regexTokenizer.sent_tokenize, regexTokenizer.word_tokenize
+    else:
+        from nltk.tokenize import sent_tokenize, word_tokenize
+
+    modifiedText = text.replace(",", ". .").replace(";", ". .").replace("(", ". .").replace(")", ". .")
+    return [word_tokenize(clause) for clause in sent_tokenize(modifiedText)]
+
+
+def first_difference(reference, candidate):
+    for index in range(max(len(reference), len(candidate))):
+        expected = reference[index] if index < len(reference) else None
+        found = candidate[index] if index < len(candidate) else None
+        if expected != found:
+            return index, expected, found
+    return None
+
+
+def main(libraryFolderPath='Context tree', repetitions=1):
+    filepaths = []
+    for root, dirs, files in os.walk(libraryFolderPath):
+        filepaths.extend(os.path.join(root, file) for file in files if file.endswith(".txt"))
+
+    timings = {'nltk': 0.0, 'regex': 0.0}
+    differences = {'clauses': 0, 'words': 0, 'phrases': 0}
+    for filepath in sorted(filepaths):
+        file = open(filepath, "r", encoding="UTF-8-sig")
+        text = file.read()
+        file.close()
+
+        textProcessors = dict()
+        for tokenizer in timings:
+            textProcessors[tokenizer] = TextProcessor(text, config.PARSE['phraseLength'], tokenizer=tokenizer)
+
+            start_time = time.time()
+            for _ in range(repetitions):
+                tokenize(text, tokenizer)
+            timings[tokenizer] += time.time() - start_time
+
+        reference, candidate = textProcessors['nltk'], textProcessors['regex']
+        comparisons = {'clauses': (reference.getClauses(), candidate.getClauses()),
+                       'words': ([words for words in reference.clauseWords if words],
+                                 [words for words in candidate.clauseWords if words]),
+                       'phrases': (sorted((length, sorted(phrases.items()))
+                                          for length, phrases in reference.getPhraseCount().items()),
+                                   sorted((length, sorted(phrases.items()))
+                                          for length, phrases in candidate.getPhraseCount().items()))}
+
+        for name, (expected, found) in comparisons.items():
+            difference = first_difference(expected, found)
+            if difference is not None:
+                differences[name] += 1
+                print("%s: different %s at %s\n    nltk:  %r\n    regex: %r" % ((filepath, name) + difference))
+
+    print("%s documents, %s repetitions" % (len(filepaths), repetitions))
+    for name, count in differences.items():
+        print("documents with different %s: %s" % (name, count))
+    for tokenizer, timing in timings.items():
+        print("%s tokenizer: %.3f seconds" % (tokenizer, timing))
+    if timings['regex'] > 0:
+        print("speedup: %.1fx" % (timings['nltk'] / timings['regex']))
+
+    return differences
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else 'Context tree',
+         int(sys.argv[2]) if len(sys.argv) > 2 else 1)